@@ -2,17 +2,25 @@ import sys
 from pathlib import Path
 import json
 import os
+import time
 from typing import Optional
 
 # Добавляем корневую директорию проекта в PYTHONPATH
 sys.path.append(str(Path(__file__).parent))
 
 from fastapi import FastAPI, HTTPException, Request, Header, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 import logging
 import uvicorn
 from bot.command_processor import CommandProcessor
+from bot.webhook_reply import open_reply_slot, close_reply_slot
+from bot.update_queue import UpdateQueue, WEBHOOK_INGEST_MODE
+from bot.update_dedup import UpdateDeduplicator
+from bot.chat_lease import ChatLeases
+from bot.log_setup import setup_logging, stop_logging, should_log_body
+from bot.metrics import REGISTRY, WEBHOOK_SECONDS
+from bot.loop_watchdog import LoopWatchdog, LOOP_WATCHDOG
 
 # Настройка логирования
 logging.basicConfig(
@@ -65,32 +73,102 @@ class TelegramUpdate(BaseModel):
     class Config:
         allow_extra = True  # Разрешаем дополнительные поля
 
+# Типы обновлений, которые принимает webhook
+KNOWN_UPDATE_TYPES = ['message', 'edited_message', 'channel_post', 'edited_channel_post',
+                      'inline_query', 'chosen_inline_result', 'callback_query',
+                      'poll', 'poll_answer', 'my_chat_member', 'chat_member']
+
 # Модель данных для ответа
 class WebhookResponse(BaseModel):
     status: str
     message: str
 
+# Модель данных для включения сторожа цикла событий
+class LoopWatchdogSettings(BaseModel):
+    enabled: bool
+    threshold_ms: Optional[float] = None
+
 # Инициализация обработчика команд
 command_processor = None
 
+# Очередь обновлений для режима быстрого подтверждения webhook
+update_queue = None
+
+# Окно дедупликации повторных доставок по update_id
+update_dedup = UpdateDeduplicator()
+
+# Число воркеров (uvicorn --workers и gunicorn читают ту же переменную);
+# при нескольких воркерах состояние делится через общее хранилище STATE_BACKEND=sqlite
+WORKER_COUNT = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Аренда чатов воркерами, чтобы сообщения одного чата не обрабатывались параллельно
+chat_leases = None
+
+# Сторож цикла событий: задержка цикла и стеки блокирующих вызовов (LOOP_WATCHDOG)
+loop_watchdog = LoopWatchdog()
+
 # Получение секретного токена из переменных окружения
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 
+# Возвращать быстрые ответы в теле webhook-ответа вместо отдельного sendMessage
+TELEGRAM_INLINE_REPLIES = os.getenv("TELEGRAM_INLINE_REPLIES", "0") == "1"
+
 @app.on_event("startup")
 async def startup_event():
     """
     Инициализация необходимых компонентов при запуске приложения
     """
-    global command_processor
+    global command_processor, update_queue, chat_leases
     try:
+        # Формат логов и запись из отдельного потока (LOG_FORMAT, LOG_QUEUE)
+        setup_logging()
         logger.info("Начало инициализации приложения")
         command_processor = CommandProcessor()
         await command_processor.initialize()
         logger.info("CommandProcessor успешно инициализирован")
+        
+        if WORKER_COUNT > 1:
+            backend = command_processor.state_backend
+            if not backend.persistent:
+                logger.warning("Несколько воркеров без STATE_BACKEND=sqlite: история чатов, дедупликация "
+                               "и квоты Google Sheets не общие")
+            update_dedup.backend = backend
+            chat_leases = ChatLeases(backend)
+            # Квота Google Sheets относится к сервисному аккаунту, а не к воркеру:
+            # bucket квот и лимит заданий на таблицу ведутся в общем хранилище
+            if getattr(command_processor, 'sheet_jobs', None) is not None:
+                command_processor.sheet_jobs.backend = backend
+            if getattr(command_processor, 'sheets_api', None) is not None:
+                command_processor.sheets_api.rate_limiter.share_quota(backend)
+            logger.info(f"Воркер {os.getpid()} запущен в режиме {WORKER_COUNT} воркеров")
+        
+        if WEBHOOK_INGEST_MODE:
+            update_queue = UpdateQueue(process_queued_update)
+            await update_queue.start()
+        
+        if LOOP_WATCHDOG:
+            await loop_watchdog.start()
     except Exception as e:
         logger.error(f"Ошибка при инициализации приложения: {str(e)}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Освобождение ресурсов при остановке приложения
+    """
+    if update_queue is not None:
+        # Сначала дообрабатываем принятые обновления, пока клиенты еще открыты
+        await update_queue.stop()
+    if command_processor is not None:
+        try:
+            await command_processor.shutdown()
+        except Exception as e:
+            logger.error(f"Ошибка при остановке приложения: {str(e)}")
+    await loop_watchdog.stop()
+    # Дописываем логи из очереди и возвращаем обработчики
+    stop_logging()
+
 # Функция для проверки секретного токена
 async def verify_telegram_token(x_telegram_bot_api_secret_token: str = Header(None)):
     """
@@ -112,22 +190,21 @@ async def telegram_webhook_handler(request: Request, verified: bool = Depends(ve
     """
     Обработчик webhook-запросов от Telegram.
     """
+    started = time.perf_counter()
+    body = None
+    outcome = "error"
     try:
-        logger.info("Начало обработки webhook-запроса от Telegram")
-        
-        # Логируем заголовки
-        headers = dict(request.headers)
-        logger.info(f"Заголовки запроса: {json.dumps(headers, indent=2)}")
-        
-        # Получаем тело запроса как байты и декодируем
+        # Тело читается один раз; заголовки и тело пишутся в лог только на DEBUG или выборочно
         body_bytes = await request.body()
-        body_str = body_bytes.decode()
-        logger.info(f"Тело запроса (сырое): {body_str}")
+        if logger.isEnabledFor(logging.DEBUG):
+            headers = {k: v for k, v in request.headers.items() if k != "x-telegram-bot-api-secret-token"}
+            logger.debug(f"Заголовки запроса: {headers}")
+        if should_log_body(logger):
+            logger.info(f"Тело обновления: {body_bytes.decode(errors='replace')}")
         
         try:
-            body = json.loads(body_str)
-            logger.info(f"Тело запроса (JSON): {json.dumps(body, indent=2)}")
-        except json.JSONDecodeError as e:
+            body = json.loads(body_bytes)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.error(f"Ошибка декодирования JSON: {str(e)}")
             raise HTTPException(status_code=400, detail="Invalid JSON")
         
@@ -141,18 +218,12 @@ async def telegram_webhook_handler(request: Request, verified: bool = Depends(ve
             raise HTTPException(status_code=400, detail="Missing required field: update_id")
             
         # Проверяем наличие хотя бы одного известного типа обновления
-        known_update_types = ['message', 'edited_message', 'channel_post', 'edited_channel_post', 
-                             'inline_query', 'chosen_inline_result', 'callback_query', 
-                             'poll', 'poll_answer', 'my_chat_member', 'chat_member']
-        
-        has_known_type = any(update_type in body for update_type in known_update_types)
-        if not has_known_type:
+        if not any(update_type in body for update_type in KNOWN_UPDATE_TYPES):
             logger.error(f"Неизвестный тип обновления: {body.keys()}")
             raise HTTPException(status_code=400, detail="Unknown update type")
             
         try:
             update = TelegramUpdate(**body)
-            logger.info("Данные успешно преобразованы в TelegramUpdate")
         except Exception as e:
             logger.error(f"Ошибка создания объекта TelegramUpdate: {str(e)}")
             raise HTTPException(status_code=422, detail=str(e))
@@ -162,29 +233,120 @@ async def telegram_webhook_handler(request: Request, verified: bool = Depends(ve
             logger.error(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
         
-        # Обработка различных типов обновлений
-        if update.message:
-            # Обработка обычного сообщения
-            await command_processor.process_message(update.message)
-        elif update.my_chat_member:
-            # Обработка уведомления о членстве в группе
-            logger.info(f"Получено уведомление о членстве в группе: {update.my_chat_member}")
-            # Здесь можно добавить логику обработки членства в группе
-        elif update.callback_query:
-            # Обработка колбэк-запросов от инлайн-кнопок
-            logger.info(f"Получен callback_query: {update.callback_query}")
-            # Здесь можно добавить логику обработки колбэк-запросов
-        else:
-            # Логируем другие типы обновлений
-            logger.info(f"Получен необрабатываемый тип обновления: {body}")
+        # Повторную доставку уже принятого обновления подтверждаем без обработки
+        if await update_dedup.check(update.update_id):
+            outcome = "duplicate"
+            return {"ok": True}
+        
+        # В режиме быстрого подтверждения только ставим обновление в очередь
+        if update_queue is not None:
+            chat_id = update.message.chat.get("id") if update.message else None
+            if not update_queue.submit(body, chat_id):
+                # Telegram повторит доставку позже, и она должна быть обработана
+                await update_dedup.forget(update.update_id)
+                outcome = "rejected"
+                raise HTTPException(status_code=503, detail="Очередь обновлений заполнена")
+            outcome = "queued"
+            return {"ok": True}
+        
+        # Первый быстрый ответ можно вернуть прямо в теле webhook-ответа
+        reply = None
+        if TELEGRAM_INLINE_REPLIES:
+            slot, token = open_reply_slot()
+        try:
+            await dispatch_update(update, body)
+        except Exception:
+            await update_dedup.forget(update.update_id)
+            raise
+        finally:
+            if TELEGRAM_INLINE_REPLIES:
+                reply = close_reply_slot(slot, token)
         
+        if reply:
+            outcome = f"inline_{reply['method']}"
+            return reply
+        outcome = "processed"
         return {"ok": True}
         
-    except HTTPException:
+    except HTTPException as e:
+        if outcome == "error":
+            outcome = f"http_{e.status_code}"
         raise
     except Exception as e:
         logger.error(f"Ошибка при обработке webhook-запроса: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        elapsed = time.perf_counter() - started
+        WEBHOOK_SECONDS.observe(elapsed, outcome=outcome)
+        log_update(body, outcome, elapsed)
+
+def log_update(body: Optional[dict], outcome: str, elapsed: float) -> None:
+    """
+    Пишет одну компактную строку об обработанном обновлении (в режиме json - с полями)
+    
+    Args:
+        body: Тело обновления (None, если его не удалось разобрать)
+        outcome: Результат обработки
+        elapsed: Время обработки в секундах
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    body = body if isinstance(body, dict) else {}
+    update_type = next((t for t in KNOWN_UPDATE_TYPES if t in body), "unknown")
+    message = body.get(update_type) if isinstance(body.get(update_type), dict) else {}
+    chat = message.get("chat") if isinstance(message.get("chat"), dict) else {}
+    fields = {
+        "update_id": body.get("update_id"),
+        "type": update_type,
+        "chat_id": chat.get("id"),
+        "text_len": len(message.get("text") or ""),
+        "outcome": outcome,
+        "ms": round(elapsed * 1000, 2)
+    }
+    logger.info(
+        "Обновление %s (%s, чат %s): %s за %.1f мс",
+        fields["update_id"], update_type, fields["chat_id"], outcome, fields["ms"],
+        extra={"fields": fields}
+    )
+
+async def dispatch_update(update: TelegramUpdate, body: dict) -> None:
+    """
+    Передает обновление Telegram в обработчик по его типу.
+    
+    Args:
+        update: Разобранное обновление
+        body: Исходное тело обновления
+    """
+    if update.message:
+        # Обработка обычного сообщения
+        if chat_leases is None:
+            await command_processor.process_message(update.message)
+        else:
+            # Чат обрабатывает один воркер; история записывается до освобождения,
+            # чтобы следующее сообщение чата в другом воркере ее увидело
+            async with chat_leases.hold(update.message.chat.get("id")):
+                await command_processor.process_message(update.message)
+                await command_processor.chat_history.flush()
+    elif update.my_chat_member:
+        # Обработка уведомления о членстве в группе
+        logger.info(f"Получено уведомление о членстве в группе: {update.my_chat_member}")
+        # Здесь можно добавить логику обработки членства в группе
+    elif update.callback_query:
+        # Обработка колбэк-запросов от инлайн-кнопок
+        logger.info(f"Получен callback_query: {update.callback_query}")
+        # Здесь можно добавить логику обработки колбэк-запросов
+    else:
+        # Логируем другие типы обновлений
+        logger.info(f"Получен необрабатываемый тип обновления: {body}")
+
+async def process_queued_update(body: dict) -> None:
+    """
+    Обрабатывает обновление из очереди (режим быстрого подтверждения webhook).
+    
+    Args:
+        body: Проверенное тело обновления
+    """
+    await dispatch_update(TelegramUpdate(**body), body)
 
 @app.get("/health")
 async def health_check():
@@ -194,25 +356,99 @@ async def health_check():
     logger.debug("Получен запрос на проверку здоровья сервиса")
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    """
+    Эндпоинт с метриками внутренних компонентов (очереди, кэши)
+    """
+    if command_processor is None:
+        raise HTTPException(status_code=503, detail="CommandProcessor не инициализирован")
+    result = command_processor.get_stats()
+    result["worker"] = {"pid": os.getpid(), "workers": WORKER_COUNT}
+    result["update_dedup"] = update_dedup.stats()
+    if chat_leases is not None:
+        result["chat_leases"] = chat_leases.stats()
+    if update_queue is not None:
+        result["updates"] = update_queue.stats()
+    result["loop_watchdog"] = loop_watchdog.stats()
+    return result
+
+@app.get("/debug/loop-watchdog")
+async def get_loop_watchdog(verified: bool = Depends(verify_telegram_token)):
+    """
+    Состояние сторожа цикла событий: задержка цикла и последняя блокировка со стеком
+    """
+    return loop_watchdog.stats()
+
+@app.post("/debug/loop-watchdog")
+async def set_loop_watchdog(settings: LoopWatchdogSettings, verified: bool = Depends(verify_telegram_token)):
+    """
+    Включает или выключает сторож цикла событий без перезапуска (защищен тем же
+    секретным токеном, что и webhook)
+    """
+    if settings.threshold_ms is not None:
+        if settings.threshold_ms <= 0:
+            raise HTTPException(status_code=400, detail="threshold_ms должен быть больше нуля")
+        loop_watchdog.threshold = settings.threshold_ms / 1000
+    if settings.enabled:
+        await loop_watchdog.start()
+    else:
+        await loop_watchdog.stop()
+    return loop_watchdog.stats()
+
+def _queue_values(field: str) -> dict:
+    """Возвращает поле статистики очередей обновлений и создания таблиц по имени очереди"""
+    values = {}
+    if update_queue is not None:
+        values[("updates",)] = update_queue.stats()[field]
+    sheet_jobs = getattr(command_processor, 'sheet_jobs', None)
+    if sheet_jobs is not None:
+        values[("sheet_jobs",)] = sheet_jobs.stats()[field]
+    return values
+
+def _openai_value(field: str) -> Optional[int]:
+    openai_stats = getattr(command_processor, 'openai_stats', None)
+    return openai_stats[field] if openai_stats is not None else None
+
+# Показатели, которые читаются из компонентов при каждом запросе /metrics
+REGISTRY.gauge("bot_queue_depth", "Число ожидающих заданий в очереди", ["queue"],
+               func=lambda: _queue_values("depth"))
+REGISTRY.gauge("bot_queue_in_progress", "Число выполняемых заданий очереди", ["queue"],
+               func=lambda: _queue_values("in_progress"))
+REGISTRY.counter("bot_queue_failed_total", "Задания очереди, завершившиеся ошибкой", ["queue"],
+                 func=lambda: _queue_values("failed"))
+REGISTRY.counter("bot_queue_rejected_total", "Задания, отклоненные из-за переполнения очереди", ["queue"],
+                 func=lambda: _queue_values("rejected"))
+REGISTRY.gauge("bot_openai_in_flight", "Запросы к OpenAI в работе",
+               func=lambda: _openai_value("in_flight"))
+REGISTRY.gauge("bot_openai_waiting", "Запросы к OpenAI, ожидающие места в лимите",
+               func=lambda: _openai_value("waiting"))
+REGISTRY.counter("bot_update_duplicates_total", "Повторные доставки обновлений, пропущенные без обработки",
+                 func=lambda: update_dedup.hits)
+REGISTRY.gauge("bot_event_loop_lag_seconds", "Перцентили задержки цикла событий за окно измерений", ["quantile"],
+               func=lambda: {(str(q),): lag for q, lag in loop_watchdog.lag_percentiles().items()}
+               if loop_watchdog.enabled else None)
+REGISTRY.counter("bot_event_loop_blocks_total", "Блокировки цикла событий дольше LOOP_BLOCK_THRESHOLD",
+                 func=lambda: loop_watchdog.blocks)
+REGISTRY.gauge("bot_loop_watchdog_enabled", "Включен ли сторож цикла событий",
+               func=lambda: int(loop_watchdog.enabled))
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Метрики процесса в текстовом формате Prometheus (при нескольких воркерах - одного воркера)
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """
-    Middleware для логирования всех HTTP-запросов
+    Middleware для логирования HTTP-запросов (на уровне DEBUG; обновления
+    Telegram описывает одна строка из обработчика webhook)
     """
-    logger.info(f"Входящий {request.method} запрос на {request.url}")
-    
-    # Логируем тело запроса для POST-запросов
-    if request.method == "POST":
-        try:
-            body = await request.body()
-            if body:
-                body_str = body.decode()
-                logger.debug(f"Тело запроса: {body_str}")
-        except Exception as e:
-            logger.error(f"Ошибка при чтении тела запроса: {str(e)}")
-    
     response = await call_next(request)
-    logger.info(f"Отправлен ответ со статусом {response.status_code}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{request.method} {request.url.path} -> {response.status_code}")
     return response
 
 @app.exception_handler(Exception)
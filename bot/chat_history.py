@@ -0,0 +1,302 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних сообщений хранить в одном чате (в запрос попадают те, что
+# помещаются в бюджет токенов CHAT_HISTORY_TOKEN_BUDGET)
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', '20'))
+
+# Сколько чатов держать в памяти и через сколько секунд бездействия забывать чат
+CHAT_HISTORY_MAX_CHATS = int(os.getenv('CHAT_HISTORY_MAX_CHATS', '10000'))
+CHAT_HISTORY_IDLE_TTL = float(os.getenv('CHAT_HISTORY_IDLE_TTL', '86400'))
+
+# Общий бюджет памяти на тексты истории в байтах
+CHAT_HISTORY_MAX_BYTES = int(os.getenv('CHAT_HISTORY_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Как часто сбрасывать измененные истории в хранилище состояния, в секундах
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL', '1.0'))
+
+# Пространство имен историй в хранилище состояния
+_NAMESPACE = "chat_history"
+
+# Примерные накладные расходы на одно сообщение (dict, строки role/content) в байтах
+_MESSAGE_OVERHEAD = 200
+
+def _message_size(message: dict) -> int:
+    return len(message["content"].encode('utf-8')) + _MESSAGE_OVERHEAD
+
+class ChatHistoryStore:
+    """
+    Хранилище истории сообщений чатов с ограниченной памятью.
+
+    История каждого чата - кольцевой буфер deque(maxlen). Чаты упорядочены по
+    последнему обращению: при превышении числа чатов или бюджета байт вытесняются
+    целиком самые давно неактивные, чаты без активности дольше idle_ttl забываются.
+
+    С постоянным хранилищем состояния память работает как кэш перед ним: история
+    подгружается при первом обращении к чату, а изменения копятся и записываются
+    пачками фоновой задачей, не задерживая ответ. Перед использованием истории из
+    памяти сверяется ее версия в хранилище, чтобы видеть изменения других воркеров.
+    """
+
+    def __init__(self, max_messages: int = CHAT_HISTORY_MAX_MESSAGES,
+                 max_chats: int = CHAT_HISTORY_MAX_CHATS,
+                 idle_ttl: float = CHAT_HISTORY_IDLE_TTL,
+                 max_bytes: int = CHAT_HISTORY_MAX_BYTES,
+                 backend: Optional[StateBackend] = None,
+                 flush_interval: float = CHAT_HISTORY_FLUSH_INTERVAL):
+        self.max_messages = max_messages
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.backend = backend or StateBackend()
+        self.flush_interval = flush_interval
+        # chat_id -> {"messages": deque, "bytes": int, "last_used": float, "version": float}
+        self._chats = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = {"idle": 0, "max_chats": 0, "max_bytes": 0}
+        # Чаты с незаписанными изменениями; снимки вытесненных из памяти до записи
+        self._dirty = set()
+        self._evicted_dirty = {}
+        self._flusher = None
+        self.backend_stats = {"loads": 0, "reloads": 0, "flushes": 0, "rows_written": 0,
+                              "flush_seconds": 0.0, "errors": 0}
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def _install(self, chat_id: int, messages: List[dict], version: float) -> dict:
+        """Помещает в память историю, прочитанную из хранилища"""
+        old = self._chats.pop(chat_id, None)
+        if old is not None:
+            self.total_bytes -= old["bytes"]
+        chat = {"messages": deque(messages, maxlen=self.max_messages), "bytes": 0,
+                "last_used": 0.0, "version": version}
+        chat["bytes"] = sum(_message_size(message) for message in chat["messages"])
+        self.total_bytes += chat["bytes"]
+        self._chats[chat_id] = chat
+        return chat
+
+    def _local(self, chat_id: int) -> Optional[dict]:
+        """Возвращает историю чата из памяти (или вытесненную, но еще не записанную)"""
+        chat = self._chats.get(chat_id)
+        if chat is None and chat_id in self._evicted_dirty:
+            # Вытесненная, но еще не записанная история возвращается в память
+            return self._install(chat_id, self._evicted_dirty.pop(chat_id), 0.0)
+        return chat
+
+    async def _load(self, chat_id: int) -> Optional[dict]:
+        """
+        Возвращает актуальную историю чата из памяти или из хранилища
+
+        Чтения хранилища (SQLite с busy_timeout, блокировка на время записи пачки)
+        выполняются в пуле потоков, чтобы не задерживать цикл событий.
+        """
+        chat = self._local(chat_id)
+        if not self.backend.persistent or chat_id in self._dirty:
+            return chat
+        try:
+            if chat is not None:
+                # История в памяти может устареть, если чат обслуживал другой воркер
+                version = await asyncio.to_thread(self.backend.version, _NAMESPACE, str(chat_id))
+                if version == chat["version"]:
+                    return self._local(chat_id)
+                self.backend_stats["reloads"] += 1
+            messages, version = await asyncio.to_thread(self.backend.get, _NAMESPACE, str(chat_id))
+        except Exception as e:
+            self.backend_stats["errors"] += 1
+            logger.error(f"Не удалось прочитать историю чата {chat_id}: {str(e)}")
+            return self._local(chat_id)
+        if chat_id in self._dirty or self._chats.get(chat_id) is not chat:
+            # Пока шло чтение, история изменилась в этом воркере: она новее прочитанной
+            return self._local(chat_id)
+        self.backend_stats["loads"] += 1
+        if messages is None:
+            if chat is not None:
+                # История удалена в другом воркере
+                self._chats.pop(chat_id)
+                self.total_bytes -= chat["bytes"]
+            return None
+        return self._install(chat_id, messages, version)
+
+    def _mark_used(self, chat_id: int, chat: dict) -> None:
+        chat["last_used"] = time.monotonic()
+        self._chats.move_to_end(chat_id)
+
+    async def _touch(self, chat_id: int) -> dict:
+        chat = await self._load(chat_id)
+        if chat is None:
+            chat = {"messages": deque(maxlen=self.max_messages), "bytes": 0, "last_used": 0.0, "version": 0.0}
+            self._chats[chat_id] = chat
+        self._mark_used(chat_id, chat)
+        return chat
+
+    def _drop_chat(self, chat_id: int, reason: str) -> None:
+        chat = self._chats.pop(chat_id)
+        self.total_bytes -= chat["bytes"]
+        self.evictions[reason] += 1
+        if chat_id in self._dirty:
+            # Незаписанные изменения сохраняем до ближайшей записи в хранилище
+            self._evicted_dirty[chat_id] = list(chat["messages"])
+
+    def _evict(self, keep: int) -> None:
+        now = time.monotonic()
+        # Чаты упорядочены по последнему обращению, неактивные всегда в начале
+        while self._chats:
+            chat_id, chat = next(iter(self._chats.items()))
+            if chat_id == keep:
+                break
+            if now - chat["last_used"] > self.idle_ttl:
+                self._drop_chat(chat_id, "idle")
+            elif len(self._chats) > self.max_chats:
+                self._drop_chat(chat_id, "max_chats")
+            elif self.total_bytes > self.max_bytes:
+                self._drop_chat(chat_id, "max_bytes")
+            else:
+                break
+
+    async def append(self, chat_id: int, role: str, content: str) -> None:
+        """
+        Добавляет сообщение в историю чата
+
+        Args:
+            chat_id: ID чата
+            role: Роль автора ("user" или "assistant")
+            content: Текст сообщения
+        """
+        chat = await self._touch(chat_id)
+        message = {"role": role, "content": content}
+        size = _message_size(message)
+        messages = chat["messages"]
+        if len(messages) == messages.maxlen:
+            # deque сам удалит самое старое сообщение, учитываем его размер
+            removed = _message_size(messages[0])
+            chat["bytes"] -= removed
+            self.total_bytes -= removed
+        messages.append(message)
+        chat["bytes"] += size
+        self.total_bytes += size
+        self._mark_dirty(chat_id)
+
+        # Один чат не может занять больше всего бюджета: отбрасываем его старые сообщения
+        while chat["bytes"] > self.max_bytes and len(messages) > 1:
+            removed = _message_size(messages.popleft())
+            chat["bytes"] -= removed
+            self.total_bytes -= removed
+        self._evict(keep=chat_id)
+
+    async def get(self, chat_id: int) -> List[dict]:
+        """
+        Возвращает историю чата от старых сообщений к новым
+
+        Args:
+            chat_id: ID чата
+
+        Returns:
+            List[dict]: Сообщения вида {"role": ..., "content": ...}
+        """
+        chat = await self._load(chat_id)
+        if chat is None:
+            return []
+        self._mark_used(chat_id, chat)
+        self._evict(keep=chat_id)
+        return list(chat["messages"])
+
+    def clear(self, chat_id: int) -> None:
+        """Удаляет историю чата"""
+        chat = self._chats.pop(chat_id, None)
+        if chat is not None:
+            self.total_bytes -= chat["bytes"]
+        self._mark_dirty(chat_id)
+
+    def _mark_dirty(self, chat_id: int) -> None:
+        if self.backend.persistent:
+            self._dirty.add(chat_id)
+            self._evicted_dirty.pop(chat_id, None)
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные изменения в хранилище одной транзакцией в пуле потоков
+
+        Returns:
+            int: Число записанных историй
+        """
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        pending = []
+        for chat_id in dirty:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                messages = list(chat["messages"])
+            else:
+                messages = self._evicted_dirty.pop(chat_id, None)
+            pending.append((chat_id, messages))
+        records = [(_NAMESPACE, str(chat_id), messages) for chat_id, messages in pending]
+
+        started = time.perf_counter()
+        try:
+            version = await asyncio.to_thread(self.backend.put_many, records)
+        except Exception as e:
+            # Возвращаем изменения в очередь записи, если их не перезаписали за это время
+            self.backend_stats["errors"] += 1
+            logger.error(f"Не удалось записать историю {len(records)} чатов: {str(e)}")
+            for chat_id, messages in pending:
+                if chat_id not in self._dirty:
+                    self._dirty.add(chat_id)
+                    if chat_id not in self._chats and messages is not None:
+                        self._evicted_dirty[chat_id] = messages
+            return 0
+        for chat_id in dirty:
+            chat = self._chats.get(chat_id)
+            # Версию обновляем, только если в чате не было новых изменений во время записи
+            if chat is not None and chat_id not in self._dirty:
+                chat["version"] = version
+        self.backend_stats["flushes"] += 1
+        self.backend_stats["rows_written"] += len(records)
+        self.backend_stats["flush_seconds"] += time.perf_counter() - started
+        return len(records)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        """Запускает фоновую запись изменений, если хранилище постоянное"""
+        if self.backend.persistent and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую запись и записывает оставшиеся изменения"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, object]:
+        """Возвращает число чатов в памяти, объем истории и счетчики вытеснения"""
+        return {
+            "chats": len(self._chats),
+            "messages": sum(len(chat["messages"]) for chat in self._chats.values()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_chats": self.max_chats,
+            "max_messages_per_chat": self.max_messages,
+            "evictions": dict(self.evictions),
+            "backend": type(self.backend).__name__,
+            "pending_writes": len(self._dirty),
+            **{key: round(value, 6) if isinstance(value, float) else value
+               for key, value in self.backend_stats.items()}
+        }
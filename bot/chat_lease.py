@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Срок аренды чата воркером (страховка на случай падения процесса), в секундах
+CHAT_LEASE_TTL = float(os.getenv('CHAT_LEASE_TTL', '180'))
+
+# Сколько ждать освобождения чата другим воркером и как часто проверять, в секундах
+CHAT_LEASE_WAIT_TIMEOUT = float(os.getenv('CHAT_LEASE_WAIT_TIMEOUT', '60'))
+CHAT_LEASE_POLL_INTERVAL = float(os.getenv('CHAT_LEASE_POLL_INTERVAL', '0.05'))
+
+class ChatLeases:
+    """
+    Аренда чатов воркерами: в каждый момент сообщения одного чата обрабатывает
+    только один процесс, как с привязкой чата к воркеру.
+
+    Обновления приходят на один адрес webhook и распределяются между воркерами
+    ядром до чтения тела запроса, поэтому направить чат в определенный воркер
+    нельзя. Вместо этого воркер занимает чат в общем хранилище состояния на время
+    обработки сообщения; остальные воркеры ждут освобождения.
+    """
+
+    def __init__(self, backend: StateBackend, owner: str = "",
+                 ttl: float = CHAT_LEASE_TTL,
+                 wait_timeout: float = CHAT_LEASE_WAIT_TIMEOUT,
+                 poll_interval: float = CHAT_LEASE_POLL_INTERVAL):
+        self.backend = backend
+        self.owner = owner or str(os.getpid())
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        # Внутри процесса порядок сообщений одного чата держат локальные блокировки
+        self._locks = {}
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    async def _acquire(self, chat_id: int) -> bool:
+        started = time.monotonic()
+        delay = self.poll_interval
+        waited = False
+        while True:
+            if await asyncio.to_thread(self.backend.claim, "chat", str(chat_id), self.owner, self.ttl):
+                if waited:
+                    self.wait_seconds += time.monotonic() - started
+                return True
+            if not waited:
+                waited = True
+                self.waits += 1
+            if time.monotonic() - started >= self.wait_timeout:
+                self.wait_seconds += time.monotonic() - started
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    @asynccontextmanager
+    async def hold(self, chat_id: Optional[int]):
+        """
+        Занимает чат на время обработки сообщения
+
+        Если чат не освободился за wait_timeout, сообщение обрабатывается без аренды:
+        задержка ответа хуже, чем редкое нарушение порядка.
+
+        Args:
+            chat_id: ID чата (None - без аренды)
+        """
+        if chat_id is None:
+            yield
+            return
+        entry = self._locks.setdefault(chat_id, {"lock": asyncio.Lock(), "users": 0})
+        entry["users"] += 1
+        try:
+            async with entry["lock"]:
+                claimed = await self._acquire(chat_id)
+                if claimed:
+                    self.acquired += 1
+                else:
+                    self.timeouts += 1
+                    logger.warning(f"Чат {chat_id} не освобожден другим воркером за {self.wait_timeout} с")
+                try:
+                    yield
+                finally:
+                    if claimed:
+                        try:
+                            await asyncio.to_thread(self.backend.release, "chat", str(chat_id), self.owner)
+                        except Exception as e:
+                            logger.error(f"Не удалось освободить чат {chat_id}: {str(e)}")
+        finally:
+            entry["users"] -= 1
+            if not entry["users"]:
+                del self._locks[chat_id]
+
+    def stats(self) -> dict:
+        """Возвращает метрики аренды чатов"""
+        return {
+            "owner": self.owner,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "timeouts": self.timeouts,
+            "local_chats": len(self._locks)
+        }
@@ -16,6 +16,24 @@ class CommandParser:
         # Шаблон для извлечения разделов
         # Ищет текст после "разделы" до конца строки и разбивает по запятой
         self.sections_pattern = r'(?:разделы\s+)(.+)$'
+        
+        # Шаблоны для разбора с оценкой уверенности (регистр исходного текста сохраняется)
+        self.mention_regex = re.compile(r'@\w+[,:]?\s*')
+        self.quoted_name_regex = re.compile(r'["«“]([^"»”]{2,100})["»”]')
+        self.name_regex = re.compile(
+            r'(?:проект[ауе]?|таблиц[ауы])\s+(?:(?:для|к|по)\s+проект[ауе]?\s+)?'
+            # Название не может начинаться с предлога ("таблицу в excel", "таблица с разделами")
+            r'(?!(?:с|в|на|по|для|к|о|об|из)\s)(?P<name>[^,.:;!?]{2,}?)'
+            r'(?=\s+с\s+раздел|\s*[,.:;!?]|\s+раздел|\s+нужн|\s+потребу|$)',
+            re.IGNORECASE
+        )
+        self.explicit_sections_regex = re.compile(
+            r'(?:с\s+разделами|разделы|раздел[ау]?)\s*:?\s*(?P<sections>.+)$', re.IGNORECASE
+        )
+        self.implicit_sections_regex = re.compile(
+            r'(?:нужн[аоы]\s+будут|нужн[аоы]|потребу[ею]тся)\s*:?\s*(?P<sections>.+)$', re.IGNORECASE
+        )
+        self.section_split_regex = re.compile(r'\s*(?:,|;|\s+и\s+)\s*', re.IGNORECASE)
 
     def clean_text(self, text: str) -> str:
         """
@@ -95,6 +113,82 @@ class CommandParser:
         
         return result
 
+    def _split_sections(self, text: str) -> List[str]:
+        """
+        Разбивает перечисление разделов по запятым, точкам с запятой и союзу "и"
+        
+        Args:
+            text (str): Текст после маркера разделов
+            
+        Returns:
+            List[str]: Список разделов
+        """
+        sections = []
+        for section in self.section_split_regex.split(text):
+            section = section.strip(' .!"«»“”')
+            if section:
+                sections.append(section)
+        return sections
+
+    def parse_with_confidence(self, command: str) -> Dict[str, any]:
+        """
+        Разбирает команду создания таблицы правилами и оценивает уверенность разбора.
+        
+        Название ищется в кавычках или после слов "проект"/"таблицу", разделы - после
+        "с разделами"/"разделы" (надежнее) или "нужны"/"потребуются"/двоеточия.
+        
+        Args:
+            command (str): Текст команды
+            
+        Returns:
+            Dict[str, any]: project_name, sections и confidence от 0 до 1
+        """
+        text = re.sub(r'\s+', ' ', self.mention_regex.sub('', command)).strip()
+        result = {"project_name": None, "sections": [], "confidence": 0.0}
+        confidence = 0.0
+        
+        # Название проекта: в кавычках надежнее, чем по ключевому слову
+        name_end = None
+        quoted = self.quoted_name_regex.search(text)
+        if quoted:
+            result["project_name"] = quoted.group(1).strip()
+            name_end = quoted.end()
+            confidence += 0.5
+        else:
+            match = self.name_regex.search(text)
+            if match and match.group('name').strip():
+                result["project_name"] = match.group('name').strip()
+                name_end = match.end()
+                confidence += 0.4
+        if name_end is None:
+            return result
+        
+        # Разделы ищем только после названия проекта
+        tail = text[name_end:]
+        explicit = self.explicit_sections_regex.search(tail)
+        if explicit:
+            result["sections"] = self._split_sections(explicit.group('sections'))
+            confidence += 0.4
+        else:
+            implicit = self.implicit_sections_regex.search(tail)
+            if not implicit and tail.lstrip().startswith(':'):
+                implicit = re.match(r'\s*:\s*(?P<sections>.+)$', tail)
+            if implicit:
+                result["sections"] = self._split_sections(implicit.group('sections'))
+                confidence += 0.3
+        
+        # Правдоподобные размеры: короткое название и короткие разделы
+        name_words = len(result["project_name"].split())
+        sections = result["sections"]
+        if sections and name_words <= 6 and len(sections) <= 20 \
+                and all(len(section.split()) <= 4 for section in sections):
+            confidence += 0.1
+        if not sections or '?' in text:
+            confidence = min(confidence, 0.5)
+        
+        result["confidence"] = round(confidence, 2)
+        return result
+
 def test_parser():
     """
     Тестирование парсера на примере команды
@@ -1,10 +1,24 @@
 import os
 import json
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from typing import Dict, List, Tuple, Optional
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from .sheets_api import GoogleSheetsAPI
+from .sheets_trace import SheetsTrace
+from .sheet_jobs import SheetJobQueue, QueueFullError
+from .webhook_reply import take_reply_slot, pop_held_reply
+from .extraction_cache import ExtractionCache
+from .chat_history import ChatHistoryStore
+from .state_backend import create_state_backend
+from .token_budget import fit_history, message_tokens
+from .command_parser import CommandParser
+from .intent_matcher import IntentMatcher
+from .metrics import INTENT_SECONDS, OPENAI_SECONDS, OPENAI_ERRORS, TELEGRAM_SECONDS, TELEGRAM_ERRORS
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,6 +31,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Пул соединений к Telegram Bot API: таймауты, лимиты и keep-alive
+TELEGRAM_HTTP_TIMEOUT = float(os.getenv('TELEGRAM_HTTP_TIMEOUT', '10'))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '5'))
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv('TELEGRAM_MAX_CONNECTIONS', '20'))
+TELEGRAM_MAX_KEEPALIVE = int(os.getenv('TELEGRAM_MAX_KEEPALIVE', '10'))
+TELEGRAM_KEEPALIVE_EXPIRY = float(os.getenv('TELEGRAM_KEEPALIVE_EXPIRY', '60'))
+
+# HTTP/2 к api.telegram.org (нужен пакет h2, без него используется HTTP/1.1)
+TELEGRAM_HTTP2 = os.getenv('TELEGRAM_HTTP2', '1') == '1'
+
+# OpenAI: таймаут одного запроса (сек.) и максимум одновременных запросов на процесс
+OPENAI_REQUEST_TIMEOUT = float(os.getenv('OPENAI_REQUEST_TIMEOUT', '30'))
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+
+# Потоковые ответы в режиме чата: первое сообщение с первыми токенами, затем правки
+OPENAI_STREAM_REPLIES = os.getenv('OPENAI_STREAM_REPLIES', '0') == '1'
+OPENAI_STREAM_TIMEOUT = float(os.getenv('OPENAI_STREAM_TIMEOUT', '120'))
+
+# Минимальный интервал между правками одного сообщения (Telegram - около 1 в секунду на чат)
+TELEGRAM_EDIT_INTERVAL = float(os.getenv('TELEGRAM_EDIT_INTERVAL', '1.5'))
+
+# Максимальная длина текста сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Сколько раз повторять итоговую правку потокового ответа при 429 перед отправкой новым сообщением
+TELEGRAM_FINAL_EDIT_ATTEMPTS = 3
+
+# Ответ пользователю, если OpenAI вернул ошибку или пустой ответ
+AI_ERROR_REPLY = "К сожалению, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте позже."
+
+# Минимальная уверенность разбора правилами, при которой ChatGPT не вызывается
+RULE_PARSER_MIN_CONFIDENCE = float(os.getenv('RULE_PARSER_MIN_CONFIDENCE', '0.8'))
+
+# Общий классификатор запросов на процесс
+_intent_matcher = IntentMatcher()
+
+def _create_telegram_client(bot_token: str) -> httpx.AsyncClient:
+    """
+    Создает долгоживущий клиент Telegram Bot API с пулом соединений
+    
+    Args:
+        bot_token: Токен бота
+        
+    Returns:
+        httpx.AsyncClient: Клиент с base_url https://api.telegram.org/bot<token>/
+    """
+    http2 = TELEGRAM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("Пакет h2 не установлен, клиент Telegram будет использовать HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        base_url=f"https://api.telegram.org/bot{bot_token}/",
+        http2=http2,
+        timeout=httpx.Timeout(TELEGRAM_HTTP_TIMEOUT, connect=TELEGRAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=TELEGRAM_MAX_CONNECTIONS,
+            max_keepalive_connections=TELEGRAM_MAX_KEEPALIVE,
+            keepalive_expiry=TELEGRAM_KEEPALIVE_EXPIRY
+        )
+    )
+
 class CommandProcessor:
     def __init__(self):
         """
@@ -43,11 +121,25 @@ class CommandProcessor:
             if not os.getenv('TELEGRAM_BOT_TOKEN'):
                 raise ValueError("Не найден TELEGRAM_BOT_TOKEN в переменных окружения")
             
+            # Создаем пул соединений к Telegram один раз на все время работы
+            if getattr(self, 'telegram_client', None) is None:
+                self.telegram_client = _create_telegram_client(os.getenv('TELEGRAM_BOT_TOKEN'))
+                logger.info("HTTP-клиент Telegram инициализирован")
+            
             # Инициализируем клиент OpenAI, если он еще не инициализирован
             if not hasattr(self, 'openai_client') or self.openai_client is None:
-                self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+                self.openai_client = AsyncOpenAI(
+                    api_key=os.getenv('OPENAI_API_KEY'),
+                    timeout=OPENAI_REQUEST_TIMEOUT
+                )
                 logger.info("OpenAI клиент инициализирован")
             
+            # Общий лимит одновременных запросов к OpenAI для всех чатов
+            if getattr(self, 'openai_semaphore', None) is None:
+                self.openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+                self.openai_stats = {"calls": 0, "errors": 0, "timeouts": 0, "in_flight": 0, "waiting": 0}
+                self.stream_stats = {"messages": 0, "edits": 0, "throttled": 0}
+            
             # Инициализируем клиент Google Sheets, если он еще не инициализирован
             if not hasattr(self, 'sheets_api') or self.sheets_api is None:
                 self.sheets_api = GoogleSheetsAPI()
@@ -56,11 +148,39 @@ class CommandProcessor:
                 # Аутентифицируемся в Google Sheets
                 self.sheets_api.authenticate()
                 logger.info("Успешная аутентификация в Google Sheets API")
-            
-            # Инициализируем словарь для хранения истории сообщений, если он еще не инициализирован
-            if not hasattr(self, 'chat_histories'):
-                self.chat_histories = {}
-                self.max_history_length = 5  # Уменьшено до 5 для оптимизации использования памяти
+                
+                # Прогреваем кэш шаблонов, чтобы первое создание таблицы не ждало их загрузки
+                try:
+                    await self.sheets_api.run_in_executor(self.sheets_api.warm_template_cache)
+                except Exception as e:
+                    logger.warning(f"Не удалось прогреть кэш шаблонов: {str(e)}")
+            
+            # Кэш результатов извлечения проекта, при необходимости с диска
+            if getattr(self, 'extraction_cache', None) is None:
+                self.extraction_cache = ExtractionCache()
+                self.extraction_cache.load()
+            
+            # Разбор команд правилами перед обращением к ChatGPT
+            if getattr(self, 'command_parser', None) is None:
+                self.command_parser = CommandParser()
+                self.extraction_stats = {
+                    "rules_hits": 0, "rules_escalations": 0, "rules_seconds": 0.0,
+                    "llm_calls": 0, "llm_seconds": 0.0
+                }
+            
+            # Запускаем очередь создания таблиц, если она еще не запущена
+            if not hasattr(self, 'sheet_jobs') or self.sheet_jobs is None:
+                self.sheet_jobs = SheetJobQueue(self._run_sheet_job)
+                await self.sheet_jobs.start()
+            
+            # Инициализируем хранилище истории сообщений с ограничением памяти;
+            # при STATE_BACKEND=sqlite история сохраняется между перезапусками
+            if getattr(self, 'chat_history', None) is None:
+                self.state_backend = create_state_backend()
+                self.chat_history = ChatHistoryStore(backend=self.state_backend)
+                await self.chat_history.start()
+                self.prompt_stats = {"requests": 0, "prompt_tokens": 0, "max_prompt_tokens": 0,
+                                     "trimmed_messages": 0, "summaries": 0}
                 logger.info("Инициализировано хранилище истории сообщений")
             
             logger.info("Асинхронная инициализация CommandProcessor успешно завершена")
@@ -72,6 +192,31 @@ class CommandProcessor:
         # Это позволяет использовать асинхронные операции при инициализации
         pass
 
+    async def shutdown(self):
+        """
+        Освобождает ресурсы процессора команд.
+        Этот метод вызывается при остановке приложения.
+        """
+        logger.info("Остановка CommandProcessor")
+        if getattr(self, 'sheet_jobs', None) is not None:
+            await self.sheet_jobs.stop()
+        if getattr(self, 'sheets_api', None) is not None:
+            await asyncio.to_thread(self.sheets_api.close)
+        if getattr(self, 'telegram_client', None) is not None:
+            await self.telegram_client.aclose()
+            self.telegram_client = None
+        if getattr(self, 'extraction_cache', None) is not None:
+            self.extraction_cache.save()
+        if getattr(self, 'chat_history', None) is not None:
+            await self.chat_history.stop()
+        if getattr(self, 'state_backend', None) is not None:
+            self.state_backend.close()
+            self.state_backend = None
+        if getattr(self, 'openai_client', None) is not None:
+            await self.openai_client.close()
+            self.openai_client = None
+        logger.info("CommandProcessor остановлен")
+
     def _determine_intent(self, message: str) -> str:
         """
         Определяет тип запроса на основе ключевых слов
@@ -82,66 +227,107 @@ class CommandProcessor:
         Returns:
             str: Тип запроса ("create_table", "help" или "chat")
         """
-        logger.info(f"DEBUG: Определение типа запроса для сообщения: '{message}'")
-        message_lower = message.lower()
-        
-        # Ключевые слова для создания таблицы
-        create_table_keywords = [
-            # Прямые команды на создание
-            "создай таблицу", "сделай таблицу", "новая таблица", 
-            "создать таблицу", "сделать таблицу", "создай лист", "сделай лист",
-            # Дополнительные варианты
-            "подготовь таблицу", "подготовить таблицу", "сформируй таблицу",
-            "организуй таблицу", "составь таблицу", "составить таблицу",
-            # Варианты с проектом
-            "таблицу к проекту", "таблицу для проекта", "проект с разделами",
-            # Дополнительные команды
-            "добавь таблицу", "добавить таблицу"
-        ]
-        
-        # Ключевые слова для запроса помощи
-        help_keywords = [
-            "что ты умеешь", "команды", "инструкция"
-        ]
-        
-        # Проверяем наличие ключевых слов для создания таблицы
-        for keyword in create_table_keywords:
-            if keyword in message_lower:
-                logger.info(f"DEBUG: Найдено ключевое слово для создания таблицы: '{keyword}'")
-                return "create_table"
-        
-        # Дополнительная проверка на наличие слова "таблица" и упоминания разделов
-        if "таблиц" in message_lower and ("раздел" in message_lower or "секци" in message_lower):
-            logger.info(f"DEBUG: Обнаружено упоминание таблицы и разделов")
-            return "create_table"
-        
-        # Дополнительная проверка на наличие слова "проект" и упоминания разделов
-        if "проект" in message_lower and ("раздел" in message_lower or "секци" in message_lower):
-            logger.info(f"DEBUG: Обнаружено упоминание проекта и разделов")
-            return "create_table"
-        
-        # Проверка на опечатки в слове "проект" с разделами
-        if ("прект" in message_lower or "праект" in message_lower) and "раздел" in message_lower:
-            logger.info(f"DEBUG: Обнаружена опечатка в слове 'проект' с упоминанием разделов")
-            return "create_table"
-        
-        # Исключаем вопросы о проектах и таблицах
-        question_markers = ["что такое", "что ты знаешь", "расскажи о", "что значит"]
-        for marker in question_markers:
-            if marker in message_lower and ("проект" in message_lower or "таблиц" in message_lower):
-                logger.info(f"DEBUG: Обнаружен вопрос о проекте или таблице, используем режим чата")
-                return "chat"
-                
-        # Проверяем наличие ключевых слов для справки
-        for keyword in help_keywords:
-            if keyword in message_lower:
-                logger.info(f"DEBUG: Найдено ключевое слово для справки: '{keyword}'")
-                return "help"
-        
-        logger.info("DEBUG: Ключевые слова не найдены, используем режим чата")
-        return "chat"  # По умолчанию - режим чата
+        started = time.perf_counter()
+        intent, rule = _intent_matcher.classify(message)
+        INTENT_SECONDS.observe(time.perf_counter() - started, intent=intent)
+        logger.debug(f"Определен тип запроса {intent} по правилу {rule}")
+        return intent
+    
+    @asynccontextmanager
+    async def _openai_slot(self, site: str):
+        """
+        Занимает место в общем лимите одновременных запросов к OpenAI и ведет счетчики.
+        
+        Args:
+            site: Место вызова для метрик задержки ("chat", "chat_stream", "extract_project")
+        """
+        stats = self.openai_stats
+        stats["waiting"] += 1
+        try:
+            await self.openai_semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1
+        stats["in_flight"] += 1
+        stats["calls"] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            OPENAI_ERRORS.inc(site=site, kind="timeout")
+            raise
+        except Exception:
+            stats["errors"] += 1
+            OPENAI_ERRORS.inc(site=site, kind="error")
+            raise
+        finally:
+            OPENAI_SECONDS.observe(time.perf_counter() - started, site=site)
+            stats["in_flight"] -= 1
+            self.openai_semaphore.release()
+    
+    async def _create_completion(self, site: str, **kwargs):
+        """
+        Выполняет запрос к OpenAI Chat Completions с общим лимитом параллельности и таймаутом.
+        
+        Args:
+            site: Место вызова для метрик задержки
+            **kwargs: Параметры chat.completions.create
+            
+        Returns:
+            Ответ OpenAI
+            
+        Raises:
+            asyncio.TimeoutError: Если запрос не уложился в OPENAI_REQUEST_TIMEOUT
+        """
+        async with self._openai_slot(site):
+            return await asyncio.wait_for(
+                self.openai_client.chat.completions.create(**kwargs),
+                timeout=OPENAI_REQUEST_TIMEOUT
+            )
+    
+    async def _prepare_chat_messages(self, message: str, chat_id: int) -> List[dict]:
+        """
+        Добавляет сообщение пользователя в историю чата и формирует запрос к OpenAI
+        
+        Args:
+            message: Текст сообщения от пользователя
+            chat_id: ID чата пользователя
+            
+        Returns:
+            List[dict]: Системное сообщение и история чата
+        """
+        # Системное сообщение для задания контекста
+        system_message = {
+            "role": "system", 
+            "content": "Ты помощник в телеграм боте, который может отвечать на вопросы и помогать с различными задачами. Отвечай охотно, но немного высокомерно в меру кратко и по существу."
+        }
+        
+        # Добавляем сообщение пользователя в историю; хранилище само ограничивает
+        # число сообщений в чате и общий объем памяти
+        await self.chat_history.append(chat_id, "user", message)
+        
+        # Оставляем самые новые сообщения в пределах бюджета токенов,
+        # более старые при необходимости сжимаются в системную заметку
+        history, trimmed = fit_history(await self.chat_history.get(chat_id))
+        
+        # Формируем запрос к OpenAI API с историей сообщений
+        messages = [system_message] + history
+        prompt_tokens = sum(message_tokens(msg) for msg in messages)
+        self.prompt_stats["requests"] += 1
+        self.prompt_stats["prompt_tokens"] += prompt_tokens
+        self.prompt_stats["max_prompt_tokens"] = max(self.prompt_stats["max_prompt_tokens"], prompt_tokens)
+        self.prompt_stats["trimmed_messages"] += trimmed
+        if history and history[0]["role"] == "system":
+            self.prompt_stats["summaries"] += 1
+        logger.info(f"DEBUG: Отправка {len(messages)} сообщений (~{prompt_tokens} токенов) в OpenAI API")
+        
+        # Логируем историю сообщений для отладки
+        for i, msg in enumerate(history):
+            logger.info(f"DEBUG: История [{i}] - {msg['role']}: {msg['content'][:30]}...")
+        
+        return messages
     
-    def _chat_with_ai(self, message: str, chat_id: int) -> str:
+    async def _chat_with_ai(self, message: str, chat_id: int) -> str:
         """
         Обрабатывает обычный запрос к AI через OpenAI API
         
@@ -154,36 +340,10 @@ class CommandProcessor:
         """
         try:
             logger.info(f"DEBUG: Отправка запроса в OpenAI API для chat_id {chat_id}: '{message}'")
+            messages = await self._prepare_chat_messages(message, chat_id)
             
-            # Системное сообщение для задания контекста
-            system_message = {
-                "role": "system", 
-                "content": "Ты помощник в телеграм боте, который может отвечать на вопросы и помогать с различными задачами. Отвечай охотно, но немного высокомерно в меру кратко и по существу."
-            }
-            
-            # Инициализируем историю сообщений для нового пользователя
-            if chat_id not in self.chat_histories:
-                self.chat_histories[chat_id] = []
-                logger.info(f"DEBUG: Создана новая история сообщений для chat_id {chat_id}")
-            
-            # Добавляем сообщение пользователя в историю
-            self.chat_histories[chat_id].append({"role": "user", "content": message})
-            
-            # Ограничиваем размер истории, чтобы не превысить лимиты OpenAI
-            if len(self.chat_histories[chat_id]) > self.max_history_length:
-                # Удаляем самые старые сообщения, оставляя только последние max_history_length
-                self.chat_histories[chat_id] = self.chat_histories[chat_id][-self.max_history_length:]
-                logger.info(f"DEBUG: История сообщений для chat_id {chat_id} ограничена до {self.max_history_length} сообщений")
-            
-            # Формируем запрос к OpenAI API с историей сообщений
-            messages = [system_message] + self.chat_histories[chat_id]
-            logger.info(f"DEBUG: Отправка {len(messages)} сообщений в OpenAI API")
-            
-            # Логируем историю сообщений для отладки
-            for i, msg in enumerate(self.chat_histories[chat_id]):
-                logger.info(f"DEBUG: История [{i}] - {msg['role']}: {msg['content'][:30]}...")
-            
-            response = self.openai_client.chat.completions.create(
+            response = await self._create_completion(
+                "chat",
                 model="gpt-4o",
                 messages=messages
             )
@@ -193,15 +353,187 @@ class CommandProcessor:
             logger.info(f"DEBUG: Получен ответ от OpenAI API: '{ai_response[:50]}...'")
             
             # Сохраняем ответ в истории
-            self.chat_histories[chat_id].append({"role": "assistant", "content": ai_response})
+            await self.chat_history.append(chat_id, "assistant", ai_response)
             
             return ai_response
             
         except Exception as e:
             logger.error(f"Ошибка при обращении к AI: {str(e)}")
-            return "К сожалению, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте позже."
+            return AI_ERROR_REPLY
+    
+    async def _stream_chat_with_ai(self, message: str, chat_id: int) -> None:
+        """
+        Обрабатывает запрос к AI в потоковом режиме: первое сообщение отправляется
+        с первыми токенами, дальше текст дописывается редкими правками editMessageText.
+        
+        Место в лимите OpenAI занято только на время чтения потока: промежуточные
+        показы выполняются в фоновой задаче, итоговая правка - после освобождения места.
+        
+        Args:
+            message: Текст сообщения от пользователя
+            chat_id: ID чата пользователя для хранения истории сообщений
+        """
+        state = {"text": "", "offset": 0, "message_id": None, "shown": "", "next_edit": 0.0, "flusher": None}
+        try:
+            logger.info(f"DEBUG: Потоковый запрос в OpenAI API для chat_id {chat_id}: '{message}'")
+            messages = await self._prepare_chat_messages(message, chat_id)
+            
+            async with self._openai_slot("chat_stream"):
+                await asyncio.wait_for(
+                    self._consume_chat_stream(messages, chat_id, state),
+                    timeout=OPENAI_STREAM_TIMEOUT
+                )
+            if state["flusher"] is not None:
+                await state["flusher"]
+            
+            if not state["text"].strip():
+                logger.warning(f"OpenAI вернул пустой потоковый ответ для chat_id {chat_id}")
+                await self.send_telegram_message(chat_id, AI_ERROR_REPLY)
+                return
+            
+            await self._flush_stream(chat_id, state, final=True)
+            await self.chat_history.append(chat_id, "assistant", state["text"])
+            
+        except Exception as e:
+            logger.error(f"Ошибка при потоковом обращении к AI: {str(e)}")
+            if state["message_id"] is None:
+                await self.send_telegram_message(chat_id, AI_ERROR_REPLY)
+        finally:
+            if state["flusher"] is not None and not state["flusher"].done():
+                state["flusher"].cancel()
+    
+    async def _consume_chat_stream(self, messages: List[dict], chat_id: int, state: dict) -> None:
+        """
+        Читает поток ответа OpenAI и периодически показывает накопленный текст.
+        
+        Показ запускается фоновой задачей (не больше одной одновременно), чтобы
+        запросы к Telegram и паузы при 429 не задерживали чтение потока.
+        
+        Args:
+            messages: Сообщения запроса
+            chat_id: ID чата
+            state: Состояние потокового ответа
+        """
+        stream = await self.openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            stream=True
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            state["text"] += delta
+            flusher = state["flusher"]
+            if time.monotonic() >= state["next_edit"] and (flusher is None or flusher.done()):
+                if flusher is not None:
+                    # Ошибка предыдущего показа прерывает ответ, как и раньше
+                    flusher.result()
+                state["flusher"] = asyncio.create_task(self._flush_stream(chat_id, state))
+    
+    async def _flush_stream(self, chat_id: int, state: dict, final: bool = False) -> None:
+        """
+        Показывает накопленный текст: отправляет первое сообщение или правит его.
+        
+        Правки не чаще TELEGRAM_EDIT_INTERVAL секунд; при 429 выдерживается retry_after.
+        Текст длиннее лимита Telegram продолжается в новом сообщении. Если итоговую
+        правку не удалось выполнить за TELEGRAM_FINAL_EDIT_ATTEMPTS попыток, текст
+        текущего сообщения целиком отправляется новым сообщением.
+        
+        Args:
+            chat_id: ID чата
+            state: Состояние потокового ответа
+            final: Последний показ - при ограничении частоты дождаться и повторить
+        """
+        for attempt in range(TELEGRAM_FINAL_EDIT_ATTEMPTS):
+            try:
+                while True:
+                    chunk = state["text"][state["offset"]:state["offset"] + TELEGRAM_MESSAGE_LIMIT]
+                    if not chunk.strip():
+                        return
+                    if state["message_id"] is None:
+                        result = await self._call_bot_api("sendMessage", {"chat_id": chat_id, "text": chunk})
+                        state["message_id"] = result["message_id"]
+                        self.stream_stats["messages"] += 1
+                    elif chunk != state["shown"]:
+                        await self._call_bot_api("editMessageText", {
+                            "chat_id": chat_id,
+                            "message_id": state["message_id"],
+                            "text": chunk
+                        })
+                        self.stream_stats["edits"] += 1
+                    state["shown"] = chunk
+                    if len(state["text"]) - state["offset"] <= TELEGRAM_MESSAGE_LIMIT:
+                        break
+                    # Сообщение заполнено до лимита, остаток пойдет в новое
+                    state["offset"] += TELEGRAM_MESSAGE_LIMIT
+                    state["message_id"] = None
+                    state["shown"] = ""
+                state["next_edit"] = time.monotonic() + TELEGRAM_EDIT_INTERVAL
+                return
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 429:
+                    raise
+                self.stream_stats["throttled"] += 1
+                retry_after = e.response.json().get("parameters", {}).get("retry_after", TELEGRAM_EDIT_INTERVAL)
+                state["next_edit"] = time.monotonic() + retry_after
+                logger.warning(f"Telegram ограничил правки для chat_id {chat_id}, пауза {retry_after} сек.")
+                if not final:
+                    return
+                await asyncio.sleep(retry_after)
+        
+        # Итоговая правка так и не прошла: без нее пользователь увидит обрезанный ответ
+        logger.error(f"Telegram {TELEGRAM_FINAL_EDIT_ATTEMPTS} раза ограничил итоговую правку для chat_id "
+                     f"{chat_id}, ответ отправляется новым сообщением")
+        text = state["text"][state["offset"]:]
+        for start in range(0, len(text), TELEGRAM_MESSAGE_LIMIT):
+            await self._call_bot_api("sendMessage", {
+                "chat_id": chat_id,
+                "text": text[start:start + TELEGRAM_MESSAGE_LIMIT]
+            })
+            self.stream_stats["messages"] += 1
+    
+    async def _get_project_info(self, message: str) -> Dict[str, any]:
+        """
+        Извлекает информацию о проекте по уровням: кэш, разбор правилами, ChatGPT.
+        
+        Разбор правилами принимается при уверенности не ниже RULE_PARSER_MIN_CONFIDENCE,
+        неоднозначные сообщения передаются в ChatGPT.
+        
+        Args:
+            message: Текст сообщения от пользователя
+            
+        Returns:
+            Dict[str, any]: Словарь с информацией о проекте или пустой словарь в случае ошибки
+        """
+        stats = self.extraction_stats
+        cache = self.extraction_cache
+        cached = cache.get(message)
+        if cached:
+            logger.info(f"Информация о проекте взята из кэша: {json.dumps(cached, ensure_ascii=False)}")
+            return cached
+        
+        started = time.monotonic()
+        parsed = self.command_parser.parse_with_confidence(message)
+        stats["rules_seconds"] += time.monotonic() - started
+        if parsed["confidence"] >= RULE_PARSER_MIN_CONFIDENCE:
+            stats["rules_hits"] += 1
+            logger.info(f"Информация о проекте извлечена правилами (уверенность {parsed['confidence']}): "
+                        f"{parsed['project_name']}, {parsed['sections']}")
+            return {"project_name": parsed["project_name"], "sections": parsed["sections"]}
+        stats["rules_escalations"] += 1
+        logger.info(f"Уверенность разбора правилами {parsed['confidence']}, используем ChatGPT")
+        
+        started = time.monotonic()
+        result = await self._extract_project_info(message)
+        stats["llm_calls"] += 1
+        stats["llm_seconds"] += time.monotonic() - started
+        # Кэшируем только успешные результаты, ошибки должны повторяться
+        if result:
+            cache.put(message, result, time.monotonic() - started)
+        return result
     
-    def _extract_project_info(self, message: str) -> Dict[str, any]:
+    async def _extract_project_info(self, message: str) -> Dict[str, any]:
         """
         Извлекает информацию о проекте из сообщения с помощью ChatGPT.
         
@@ -231,14 +563,14 @@ class CommandProcessor:
             # Отправляем запрос в ChatGPT с обработкой ошибок
             try:
                 logger.info("Отправка запроса в ChatGPT API")
-                response = self.openai_client.chat.completions.create(
+                response = await self._create_completion(
+                    "extract_project",
                     model="gpt-4o",
                     response_format={"type": "json_object"},
                     messages=[
                         {"role": "system", "content": "Ты - помощник, который извлекает структурированную информацию из текста."},
                         {"role": "user", "content": prompt}
-                    ],
-                    timeout=30  # Добавляем таймаут для запроса
+                    ]
                 )
             except Exception as e:
                 logger.error(f"Ошибка при запросе к ChatGPT API: {str(e)}")
@@ -282,7 +614,7 @@ class CommandProcessor:
             logger.error(f"Ошибка при извлечении информации из сообщения: {str(e)}")
             return {}
 
-    def process_command(self, message: str, chat_id: int) -> str:
+    async def process_command(self, message: str, chat_id: int) -> str:
         """
         Обрабатывает команду пользователя.
         
@@ -304,7 +636,7 @@ class CommandProcessor:
             if intent == "create_table":
                 logger.info("DEBUG: Обработка запроса на создание таблицы")
                 # Извлекаем информацию о проекте
-                project_data = self._extract_project_info(message)
+                project_data = await self._get_project_info(message)
                 
                 if not project_data or not project_data.get("project_name") or not project_data.get("sections"):
                     error_msg = "Не удалось извлечь информацию о проекте из сообщения. Пожалуйста, сформулируйте иначе."
@@ -313,9 +645,19 @@ class CommandProcessor:
                 
                 logger.info(f"Создание листа проекта с данными: {json.dumps(project_data, ensure_ascii=False)}")
                 
-                # Отправляем сообщение о начале создания таблицы
+                # Ставим создание таблицы в очередь
+                try:
+                    position = self.sheet_jobs.submit(chat_id, project_data, self.sheets_api.spreadsheet_id)
+                except QueueFullError:
+                    return "⏳ Сейчас создается слишком много таблиц. Пожалуйста, повторите запрос через пару минут."
+                
+                if position:
+                    status_line = f"🔢 Ваша позиция в очереди: {position}"
+                else:
+                    status_line = "🔄 Начинаю создание таблицы..."
+                
                 processing_message = f"""
-                🔄 Начинаю создание таблицы...
+                {status_line}
                 
                 📋 Название проекта: {project_data['project_name']}
                 📑 Разделы: {', '.join(project_data['sections'])}
@@ -323,15 +665,9 @@ class CommandProcessor:
                 Это может занять некоторое время. Я сообщу, когда таблица будет готова.
                 """
                 
-                # Импортируем asyncio до его использования
-                import asyncio
-                
-                # Отправляем сообщение о начале создания немедленно
+                # Отправляем сообщение о постановке в очередь немедленно
                 asyncio.create_task(self.send_telegram_message(chat_id, processing_message))
                 
-                # Запускаем асинхронную задачу создания таблицы
-                asyncio.create_task(self._create_table_async(chat_id, project_data))
-                
                 # Возвращаем пустое сообщение, т.к. мы уже отправили уведомление
                 return ""
                 
@@ -350,7 +686,11 @@ class CommandProcessor:
             else:  # intent == "chat"
                 logger.info(f"DEBUG: Обработка запроса в режиме чата для chat_id {chat_id}")
                 # Обрабатываем как обычный запрос к чат-боту
-                ai_response = self._chat_with_ai(message, chat_id)
+                if OPENAI_STREAM_REPLIES:
+                    # Ответ показывается по мере генерации и уже отправлен
+                    await self._stream_chat_with_ai(message, chat_id)
+                    return ""
+                ai_response = await self._chat_with_ai(message, chat_id)
                 return ai_response
             
         except Exception as e:
@@ -366,22 +706,15 @@ class CommandProcessor:
             message: Объект сообщения от Telegram
         """
         try:
-            logger.info("Начало обработки сообщения от Telegram")
-            
-            # Логируем структуру объекта message для отладки
-            logger.info(f"DEBUG: Структура объекта message: {dir(message)}")
-            logger.info(f"DEBUG: Структура объекта message.chat: {message.chat}")
-            
             # Получаем текст сообщения и информацию о чате
             chat_id = message.chat["id"]
             text = message.text or ""
-            logger.info(f"DEBUG: Получен chat_id: {chat_id}, текст: '{text}'")
             
             if not chat_id or not text:
                 logger.warning("Получено некорректное сообщение")
                 return
                 
-            logger.info(f"Обработка сообщения от chat_id {chat_id}: {text}")
+            logger.debug(f"Обработка сообщения от chat_id {chat_id}: {text}")
             
             # Если это команда /start
             if text == '/start':
@@ -400,12 +733,13 @@ class CommandProcessor:
                 return
             
             # Обрабатываем текст сообщения
-            response = self.process_command(text, chat_id)
+            response = await self.process_command(text, chat_id)
             
-            # Отправляем ответ пользователю
-            await self.send_telegram_message(chat_id, response)
+            # Отправляем ответ пользователю (пустой ответ - уведомление уже отправлено)
+            if response:
+                await self.send_telegram_message(chat_id, response)
             
-            logger.info(f"Сообщение успешно обработано: {text}")
+            logger.debug(f"Сообщение от chat_id {chat_id} обработано")
             
         except Exception as e:
             error_msg = f"Ошибка при обработке сообщения: {str(e)}"
@@ -415,6 +749,51 @@ class CommandProcessor:
             except Exception as send_error:
                 logger.error(f"Не удалось отправить сообщение об ошибке: {str(send_error)}")
     
+    async def _run_sheet_job(self, job: dict) -> None:
+        """
+        Выполняет задание из очереди создания таблиц.
+        
+        Args:
+            job: Задание с ключами chat_id и project_data
+        """
+        await self._create_table_async(job["chat_id"], job["project_data"])
+    
+    def get_stats(self) -> dict:
+        """
+        Возвращает метрики компонентов процессора команд.
+        
+        Returns:
+            dict: Метрики по компонентам
+        """
+        stats = {}
+        if getattr(self, 'openai_stats', None) is not None:
+            stats["openai"] = dict(self.openai_stats, max_concurrency=OPENAI_MAX_CONCURRENCY)
+            stats["openai_stream"] = dict(self.stream_stats)
+        if getattr(self, 'chat_history', None) is not None:
+            stats["chat_history"] = self.chat_history.stats()
+            prompt = dict(self.prompt_stats)
+            prompt["avg_prompt_tokens"] = round(prompt["prompt_tokens"] / prompt["requests"], 1) if prompt["requests"] else 0.0
+            stats["chat_prompt"] = prompt
+        if getattr(self, 'extraction_cache', None) is not None:
+            stats["extraction_cache"] = self.extraction_cache.stats()
+        if getattr(self, 'extraction_stats', None) is not None:
+            extraction = dict(self.extraction_stats)
+            avg_llm = extraction["llm_seconds"] / extraction["llm_calls"] if extraction["llm_calls"] else 0.0
+            # Каждое сообщение, разобранное правилами, экономит один вызов ChatGPT
+            extraction["llm_calls_saved"] = extraction["rules_hits"]
+            extraction["estimated_llm_seconds_saved"] = round(extraction["rules_hits"] * avg_llm, 3)
+            extraction["rules_seconds"] = round(extraction["rules_seconds"], 6)
+            extraction["llm_seconds"] = round(extraction["llm_seconds"], 3)
+            stats["extraction"] = extraction
+        if getattr(self, 'sheet_jobs', None) is not None:
+            stats["sheet_jobs"] = self.sheet_jobs.stats()
+        if getattr(self, 'sheets_api', None) is not None:
+            stats["sheets_templates"] = self.sheets_api.template_cache.stats()
+            stats["sheets_rate_limiter"] = self.sheets_api.rate_limiter.stats()
+        if getattr(self, 'last_sheet_trace', None) is not None:
+            stats["last_sheet_trace"] = self.last_sheet_trace
+        return stats
+    
     async def _create_table_async(self, chat_id: int, project_data: dict) -> None:
         """
         Асинхронно создает таблицу и отправляет уведомление пользователю.
@@ -426,11 +805,17 @@ class CommandProcessor:
         try:
             logger.info(f"Начало асинхронного создания таблицы: {json.dumps(project_data, ensure_ascii=False)}")
             
-            # Создаем лист проекта
-            sheet_url = self.sheets_api.create_project_sheet_with_retry(project_data['project_name'], project_data['sections'])
+            # Создаем лист проекта в пуле потоков Sheets, не блокируя цикл событий;
+            # в трассировку записываются этапы создания и вызовы API
+            trace = SheetsTrace("create_project_sheet", chat_id=chat_id,
+                                project=project_data['project_name'], sections=len(project_data['sections']))
+            sheet_url = await self.sheets_api.create_project_sheet_async(
+                project_data['project_name'], project_data['sections'], trace
+            )
+            self.last_sheet_trace = trace.summary()
             
             if sheet_url:
-                logger.info(f"Таблица успешно создана: {sheet_url}")
+                logger.info(f"Таблица успешно создана: {sheet_url} ({trace.summary_line()})")
                 
                 success_message = f"""
                 ✅ Таблица успешно создана!
@@ -442,7 +827,7 @@ class CommandProcessor:
                 
                 await self.send_telegram_message(chat_id, success_message)
             else:
-                logger.error("Не удалось создать таблицу")
+                logger.error(f"Не удалось создать таблицу ({trace.summary_line()})")
                 await self.send_telegram_message(chat_id, "❌ Не удалось создать таблицу. Пожалуйста, попробуйте позже.")
         except Exception as e:
             logger.error(f"Ошибка при асинхронном создании таблицы: {str(e)}")
@@ -452,29 +837,55 @@ class CommandProcessor:
         """
         Отправляет сообщение в Telegram.
         
+        Если обработка идет внутри webhook-запроса с открытым слотом ответа,
+        сообщение возвращается в теле webhook-ответа без отдельного запроса.
+        
         Args:
             chat_id: ID чата
             text: Текст сообщения
         """
         try:
-            import httpx
-            from os import getenv
-            
-            bot_token = getenv('TELEGRAM_BOT_TOKEN')
-            if not bot_token:
-                raise ValueError("Не найден TELEGRAM_BOT_TOKEN в переменных окружения")
-                
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
             data = {
                 "chat_id": chat_id,
                 "text": text,
                 "parse_mode": "HTML"
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data)
-                response.raise_for_status()
-                logger.info(f"HTTP Request: POST {url} \"{response.status_code} {response.reason_phrase}\"")
+            if take_reply_slot("sendMessage", data):
+                logger.info(f"Ответ для chat_id {chat_id} будет возвращен в теле webhook-ответа")
+                return
+            
+            # Отложенный в слоте ответ отправляем первым, чтобы сохранить порядок сообщений
+            held = pop_held_reply()
+            if held:
+                await self._call_bot_api(held.pop("method"), held)
+            
+            await self._call_bot_api("sendMessage", data)
                 
         except Exception as e:
             logger.error(f"Ошибка при отправке сообщения в Telegram: {str(e)}")
+    
+    async def _call_bot_api(self, method: str, params: dict) -> Optional[dict]:
+        """
+        Вызывает метод Telegram Bot API через пул соединений.
+        
+        Args:
+            method: Метод Bot API
+            params: Параметры метода
+            
+        Returns:
+            Optional[dict]: Поле result ответа Bot API
+        """
+        if getattr(self, 'telegram_client', None) is None:
+            raise RuntimeError("HTTP-клиент Telegram не инициализирован")
+        
+        # Соединение берется из пула клиента, без нового TCP/TLS-рукопожатия
+        try:
+            with TELEGRAM_SECONDS.time(method=method):
+                response = await self.telegram_client.post(method, json=params)
+                response.raise_for_status()
+        except Exception:
+            TELEGRAM_ERRORS.inc(method=method)
+            raise
+        logger.info(f"HTTP Request: POST {method} \"{response.status_code} {response.reason_phrase}\"")
+        return response.json().get("result")
@@ -0,0 +1,138 @@
+import os
+import re
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Кэш результатов извлечения проекта: размер, TTL в секундах и файл для сохранения между перезапусками
+EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', '1000'))
+EXTRACTION_CACHE_TTL = float(os.getenv('EXTRACTION_CACHE_TTL', '86400'))
+EXTRACTION_CACHE_PATH = os.getenv('EXTRACTION_CACHE_PATH', '')
+
+# Упоминание бота: имена ботов в Telegram всегда оканчиваются на "bot"
+_BOT_MENTION_PATTERN = re.compile(r'@\w*bot\b', re.IGNORECASE)
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalize_message(text: str) -> str:
+    """
+    Приводит текст сообщения к ключу кэша: без упоминания бота, в нижнем регистре,
+    с одиночными пробелами
+
+    Args:
+        text: Текст сообщения
+
+    Returns:
+        str: Нормализованный текст
+    """
+    text = _BOT_MENTION_PATTERN.sub(' ', text)
+    return _WHITESPACE_PATTERN.sub(' ', text.lower()).strip()
+
+class ExtractionCache:
+    """
+    LRU-кэш результатов извлечения информации о проекте с TTL.
+
+    Ключ - нормализованный текст сообщения. Время записей хранится по часам
+    системы, чтобы TTL сохранялся при загрузке кэша с диска.
+    """
+
+    def __init__(self, max_size: int = EXTRACTION_CACHE_SIZE,
+                 ttl: float = EXTRACTION_CACHE_TTL,
+                 path: str = EXTRACTION_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # ключ -> {"result": ..., "created_at": ...}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.puts = 0
+        self.miss_seconds = 0.0
+
+    def get(self, message: str) -> Optional[dict]:
+        """
+        Возвращает сохраненный результат извлечения
+
+        Args:
+            message: Текст сообщения
+
+        Returns:
+            Optional[dict]: Копия результата или None
+        """
+        key = normalize_message(message)
+        entry = self._entries.get(key)
+        if entry and time.time() - entry["created_at"] < self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(json.dumps(entry["result"]))
+        if entry:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, message: str, result: dict, elapsed: float = 0.0) -> None:
+        """
+        Сохраняет результат извлечения
+
+        Args:
+            message: Текст сообщения
+            result: Результат извлечения
+            elapsed: Время извлечения в секундах (для оценки сэкономленного времени)
+        """
+        key = normalize_message(message)
+        self._entries[key] = {"result": result, "created_at": time.time()}
+        self._entries.move_to_end(key)
+        self.puts += 1
+        self.miss_seconds += elapsed
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def load(self) -> None:
+        """Загружает непросроченные записи из файла, если он задан"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось загрузить кэш извлечения из {self.path}: {str(e)}")
+            return
+        now = time.time()
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["created_at"]):
+            if now - entry["created_at"] < self.ttl:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        logger.info(f"Кэш извлечения загружен: {len(self._entries)} записей")
+
+    def save(self) -> None:
+        """Сохраняет кэш в файл, если он задан (через временный файл, атомарно)"""
+        if not self.path:
+            return
+        # У каждого воркера свой временный файл, последний сохранивший побеждает
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            logger.info(f"Кэш извлечения сохранен: {len(self._entries)} записей")
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш извлечения в {self.path}: {str(e)}")
+
+    def stats(self) -> dict:
+        """Возвращает метрики кэша"""
+        total = self.hits + self.misses
+        avg_miss = self.miss_seconds / self.puts if self.puts else 0.0
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "estimated_seconds_saved": round(self.hits * avg_miss, 3)
+        }
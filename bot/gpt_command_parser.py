@@ -1,10 +1,17 @@
 import json
 import os
+import time
 import logging
 from typing import Dict, Any
 from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
+# Модуль импортируется и как bot.gpt_command_parser, и напрямую из bot/main.py
+try:
+    from .metrics import OPENAI_SECONDS, OPENAI_ERRORS
+except ImportError:
+    from metrics import OPENAI_SECONDS, OPENAI_ERRORS
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -114,14 +121,21 @@ class GPTCommandParser:
         try:
             logger.info(f"Начало парсинга команды: {message}")
             
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": message}
-                ]
-            )
+            started = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(
+                    model="gpt-4o",
+                    response_format={"type": "json_object"},
+                    messages=[
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": message}
+                    ]
+                )
+            except Exception:
+                OPENAI_ERRORS.inc(site="gpt_parser", kind="error")
+                raise
+            finally:
+                OPENAI_SECONDS.observe(time.perf_counter() - started, site="gpt_parser")
             
             # Получаем ответ от GPT
             try:
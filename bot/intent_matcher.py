@@ -0,0 +1,60 @@
+from typing import Tuple
+
+# Ключевые слова для создания таблицы
+CREATE_TABLE_KEYWORDS = [
+    # Прямые команды на создание
+    "создай таблицу", "сделай таблицу", "новая таблица",
+    "создать таблицу", "сделать таблицу", "создай лист", "сделай лист",
+    # Дополнительные варианты
+    "подготовь таблицу", "подготовить таблицу", "сформируй таблицу",
+    "организуй таблицу", "составь таблицу", "составить таблицу",
+    # Варианты с проектом
+    "таблицу к проекту", "таблицу для проекта", "проект с разделами",
+    # Дополнительные команды
+    "добавь таблицу", "добавить таблицу"
+]
+
+# Ключевые слова для запроса помощи
+HELP_KEYWORDS = ["что ты умеешь", "команды", "инструкция"]
+
+# Вопросы о проектах и таблицах, которые не являются командой
+QUESTION_MARKERS = ["что такое", "что ты знаешь", "расскажи о", "что значит"]
+
+class IntentMatcher:
+    """
+    Определение типа запроса цепочкой проверок подстрок.
+
+    Проверки `in` по строке выполняются в C и при таком числе ключевых слов быстрее
+    одного общего регулярного выражения (см. scripts/bench_intent.py); кроме типа
+    запроса возвращается сработавшее правило.
+    """
+
+    def classify(self, message: str) -> Tuple[str, str]:
+        """
+        Определяет тип запроса
+
+        Args:
+            message: Текст сообщения
+
+        Returns:
+            Tuple[str, str]: Тип запроса ("create_table", "help" или "chat") и сработавшее правило
+        """
+        text = message.lower()
+        for keyword in CREATE_TABLE_KEYWORDS:
+            if keyword in text:
+                return "create_table", "create_keyword"
+        sections = "раздел" in text or "секци" in text
+        if sections and "таблиц" in text:
+            return "create_table", "table_with_sections"
+        if sections and "проект" in text:
+            return "create_table", "project_with_sections"
+        if "раздел" in text and ("прект" in text or "праект" in text):
+            return "create_table", "project_typo_with_sections"
+        if "проект" in text or "таблиц" in text:
+            for marker in QUESTION_MARKERS:
+                if marker in text:
+                    return "chat", "question_about_project"
+        for keyword in HELP_KEYWORDS:
+            if keyword in text:
+                return "help", "help_keyword"
+        return "chat", "default"
@@ -0,0 +1,118 @@
+import os
+import json
+import queue
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional, Tuple
+
+# Формат логов: text - как раньше, json - одна компактная JSON-строка на запись
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+# Писать логи в файлы и консоль из отдельного потока, а не из цикла событий
+LOG_QUEUE = os.getenv('LOG_QUEUE', '1') == '1'
+
+# Доля обновлений, тело которых записывается в лог на уровне INFO (на DEBUG - всегда)
+LOG_BODY_SAMPLE_RATE = float(os.getenv('LOG_BODY_SAMPLE_RATE', '0'))
+
+_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Логгеры, переведенные на очередь: (логгер, обработчик очереди, поток записи)
+_queued: List[Tuple[logging.Logger, QueueHandler, QueueListener]] = []
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись в одну JSON-строку. Дополнительные поля передаются
+    через extra={"fields": {...}} и попадают в JSON как есть.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            data.update(fields)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+class _PreparedQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не форматирует запись в потоке цикла событий:
+    в очередь уходит запись как есть, форматированием занимается поток записи.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы сообщения вычисляются сразу, чтобы изменяемые объекты не поменялись
+        # до записи; исключение форматируется в потоке записи
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def _queue_logger(target: logging.Logger) -> None:
+    """Переносит обработчики логгера за очередь с отдельным потоком записи"""
+    handlers = [h for h in target.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        target.removeHandler(handler)
+    queue_handler = _PreparedQueueHandler(log_queue)
+    target.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _queued.append((target, queue_handler, listener))
+
+def setup_logging(log_format: str = LOG_FORMAT, use_queue: bool = LOG_QUEUE) -> None:
+    """
+    Настраивает формат и вывод логов для приложения: в режиме json все обработчики
+    получают JsonFormatter, с очередью запись в файлы выполняет отдельный поток.
+
+    Args:
+        log_format: "text" или "json"
+        use_queue: Писать логи через QueueHandler/QueueListener
+    """
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(_TEXT_FORMAT)
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.root.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger) and logger.handlers
+    ]
+    for target in loggers:
+        for handler in target.handlers:
+            if not isinstance(handler, QueueHandler):
+                handler.setFormatter(formatter)
+        if use_queue:
+            _queue_logger(target)
+
+def stop_logging() -> None:
+    """
+    Останавливает потоки записи, дописав оставшиеся в очередях записи,
+    и возвращает логгерам их обработчики
+    """
+    while _queued:
+        target, queue_handler, listener = _queued.pop()
+        target.removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            target.addHandler(handler)
+
+def should_log_body(logger: logging.Logger, sample_rate: Optional[float] = None) -> bool:
+    """
+    Решает, записывать ли тело обновления в лог: всегда на уровне DEBUG,
+    иначе для случайной доли обновлений
+
+    Args:
+        logger: Логгер, в который пишется тело
+        sample_rate: Доля обновлений (по умолчанию LOG_BODY_SAMPLE_RATE)
+
+    Returns:
+        bool: True, если тело нужно записать
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        return True
+    rate = LOG_BODY_SAMPLE_RATE if sample_rate is None else sample_rate
+    return rate > 0 and random.random() < rate
@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# Включать сторож цикла событий при запуске (1/0); включается и выключается и на лету через /debug/loop-watchdog
+LOOP_WATCHDOG = os.getenv('LOOP_WATCHDOG', '0') == '1'
+
+# Интервал измерения задержки цикла (сек.) и длительность блокировки, после которой пишется стек (сек.)
+LOOP_WATCHDOG_INTERVAL = float(os.getenv('LOOP_WATCHDOG_INTERVAL', '0.05'))
+LOOP_BLOCK_THRESHOLD = float(os.getenv('LOOP_BLOCK_THRESHOLD', '0.25'))
+
+# Сколько последних измерений задержки хранить для перцентилей
+LOOP_LAG_WINDOW = int(os.getenv('LOOP_LAG_WINDOW', '2000'))
+
+# Уровни перцентилей задержки, отдаваемых в /metrics
+LAG_QUANTILES = (50, 90, 99)
+
+class LoopWatchdog:
+    """
+    Сторож цикла событий.
+
+    Корутина-пульс засыпает на interval и измеряет, насколько позже просыпается:
+    это задержка цикла (время, которое готовые задачи ждут своей очереди). Отдельный
+    поток следит за пульсом и, если цикл не отвечает дольше threshold, снимает стек
+    потока цикла через sys._current_frames() - то есть стек именно той синхронной
+    операции, которая держит цикл (time.sleep, блокирующий клиент, .execute() и т. п.).
+    """
+
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL,
+                 threshold: float = LOOP_BLOCK_THRESHOLD,
+                 window: int = LOOP_LAG_WINDOW):
+        """
+        Args:
+            interval: Интервал пульса в секундах
+            threshold: Длительность блокировки цикла, после которой пишется стек, в секундах
+            window: Число последних измерений задержки для перцентилей
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self._lags = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop_thread_id = None
+        self._last_beat = 0.0
+        self._beat = 0
+        self._reported_beat = -1
+
+        self.blocks = 0
+        self.last_block = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """Запускает пульс в текущем цикле событий и поток наблюдения"""
+        if self.enabled:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._pulse(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Сторож цикла событий включен: интервал {self.interval * 1000:.0f} мс, "
+                    f"порог блокировки {self.threshold * 1000:.0f} мс")
+
+    async def stop(self) -> None:
+        """Останавливает пульс и поток наблюдения (накопленные измерения сохраняются)"""
+        if not self.enabled:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self._stop.set()
+        self._thread.join(timeout=max(self.threshold, 1.0))
+        self._thread = None
+        logger.info("Сторож цикла событий выключен")
+
+    async def _pulse(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            with self._lock:
+                self._lags.append(lag)
+                self._last_beat = time.perf_counter()
+                if self._reported_beat == self._beat and self.last_block is not None:
+                    # Блокировка закончилась: фиксируем полную длительность
+                    self.last_block["blocked_ms"] = round(lag * 1000, 1)
+                self._beat += 1
+
+    def _watch(self) -> None:
+        # Проверяем пульс чаще порога, чтобы снять стек, пока цикл еще заблокирован
+        # (порог можно менять на лету, поэтому период считается на каждой итерации)
+        while not self._stop.wait(max(min(self.threshold, self.interval) / 2, 0.005)):
+            with self._lock:
+                stalled = time.perf_counter() - self._last_beat - self.interval
+                beat = self._beat
+            if stalled < self.threshold or beat == self._reported_beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            with self._lock:
+                self._reported_beat = beat
+                self.blocks += 1
+                self.last_block = {
+                    "at": round(time.time(), 3),
+                    "blocked_ms": round(stalled * 1000, 1),
+                    "stack": stack
+                }
+            logger.warning(f"Цикл событий заблокирован дольше {stalled * 1000:.0f} мс, стек:\n{stack}")
+
+    def lag_percentiles(self) -> dict:
+        """
+        Возвращает перцентили задержки цикла за окно измерений
+
+        Returns:
+            dict: {уровень (0.5, 0.9, 0.99): задержка в секундах}
+        """
+        with self._lock:
+            lags = list(self._lags)
+        return {q / 100: percentile(lags, q) for q in LAG_QUANTILES}
+
+    def stats(self) -> dict:
+        """Возвращает состояние сторожа, перцентили задержки (мс) и последнюю блокировку"""
+        with self._lock:
+            lags = list(self._lags)
+            last_block = dict(self.last_block) if self.last_block else None
+        result = {
+            "enabled": self.enabled,
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "samples": len(lags),
+            "blocks": self.blocks,
+            "last_block": last_block
+        }
+        for q in LAG_QUANTILES:
+            result[f"lag_p{q}_ms"] = round(percentile(lags, q) * 1000, 1)
+        result["lag_max_ms"] = round(max(lags, default=0.0) * 1000, 1)
+        return result
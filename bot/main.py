@@ -2,11 +2,11 @@ import os
 import json
 import logging
 import pytz
-from typing import Dict, Any
 from telegram import Update
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
 from dotenv import load_dotenv
 from gpt_command_parser import GPTCommandParser, ParsingError
+from state_backend import StateMap, create_state_backend
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -23,8 +23,9 @@ file_handler.setFormatter(formatter)
 # Добавляем обработчик к логгеру
 logger.addHandler(file_handler)
 
-# Словарь для хранения контекста пользователей
-user_context: Dict[int, Dict[str, Any]] = {}
+# Контекст пользователей (ожидание подтверждения); при STATE_BACKEND=sqlite
+# переживает перезапуск и общий для нескольких процессов
+user_context = StateMap("user_context", create_state_backend())
 
 def log_user_action(user_id: int, username: str, action: str):
     """Логирует действие пользователя"""
@@ -0,0 +1,234 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержек, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Возвращает перцентиль выборки с линейной интерполяцией (0.0 для пустой выборки)
+
+    Args:
+        values: Значения
+        q: Уровень от 0 до 100
+
+    Returns:
+        float: Значение перцентиля
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class _Metric:
+    """
+    Общая часть метрик: имя, описание, метки и блокировка (метрики пишут и потоки Sheets).
+
+    Значения счетчика или показателя можно не вести в метрике, а вычислять при чтении
+    функцией func, возвращающей число или словарь {кортеж значений меток: число}.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 func: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _current_values(self) -> Dict[Tuple[str, ...], float]:
+        if self.func is None:
+            with self._lock:
+                return dict(self._values)
+        result = self.func()
+        if result is None:
+            return {}
+        return result if isinstance(result, dict) else {(): result}
+
+    def _value_samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._current_values().items())
+        ]
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return self._value_samples()
+
+class Gauge(_Metric):
+    """Текущее значение (очереди, число соединений и т. п.)"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> List[str]:
+        return self._value_samples()
+
+class Histogram(_Metric):
+    """Гистограмма значений с накопительными корзинами, суммой и числом наблюдений"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # метки -> [счетчики корзин, сумма, число]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет длительность блока, в том числе завершившегося исключением"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Набор метрик процесса, отдаваемый в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Повторная регистрация (например, при перезапуске приложения в тестах)
+                # возвращает уже существующую метрику
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def _register_with_func(self, metric: _Metric) -> _Metric:
+        registered = self._register(metric)
+        if metric.func is not None:
+            # Функция может ссылаться на объекты нового экземпляра приложения
+            registered.func = metric.func
+        return registered
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                func: Optional[Callable[[], object]] = None) -> Counter:
+        return self._register_with_func(Counter(name, documentation, labelnames, func))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              func: Optional[Callable[[], object]] = None) -> Gauge:
+        return self._register_with_func(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+# Метрики процесса бота
+REGISTRY = MetricsRegistry()
+
+WEBHOOK_SECONDS = REGISTRY.histogram(
+    "bot_webhook_seconds", "Время обработки webhook-запроса Telegram", ["outcome"])
+INTENT_SECONDS = REGISTRY.histogram(
+    "bot_intent_seconds", "Время определения типа запроса", ["intent"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+OPENAI_SECONDS = REGISTRY.histogram(
+    "bot_openai_seconds", "Время запроса к OpenAI по месту вызова", ["site"])
+OPENAI_ERRORS = REGISTRY.counter(
+    "bot_openai_errors_total", "Ошибки запросов к OpenAI по месту вызова", ["site", "kind"])
+SHEETS_CALL_SECONDS = REGISTRY.histogram(
+    "bot_sheets_call_seconds", "Время вызова Google Sheets API с учетом повторов", ["method"])
+SHEETS_RETRIES = REGISTRY.counter(
+    "bot_sheets_retries_total", "Повторы запросов к Google Sheets API по коду ответа", ["status"])
+SHEETS_ERRORS = REGISTRY.counter(
+    "bot_sheets_errors_total", "Неудачные вызовы Google Sheets API", ["method"])
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    "bot_telegram_seconds", "Время вызова Telegram Bot API", ["method"])
+TELEGRAM_ERRORS = REGISTRY.counter(
+    "bot_telegram_errors_total", "Ошибки вызовов Telegram Bot API", ["method"])
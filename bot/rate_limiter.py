@@ -0,0 +1,260 @@
+import os
+import time
+import random
+import logging
+import threading
+from typing import Callable, Optional
+from googleapiclient.errors import HttpError
+
+from .metrics import SHEETS_RETRIES
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Квоты Google Sheets API на одного пользователя (сервисный аккаунт) в минуту
+SHEETS_READ_QUOTA_PER_MIN = int(os.getenv('SHEETS_READ_QUOTA_PER_MIN', '60'))
+SHEETS_WRITE_QUOTA_PER_MIN = int(os.getenv('SHEETS_WRITE_QUOTA_PER_MIN', '60'))
+
+# Сколько запросов можно выполнить подряд без ожидания
+SHEETS_BURST = int(os.getenv('SHEETS_BURST', '10'))
+
+# Повторы при временных ошибках API
+SHEETS_MAX_RETRIES = int(os.getenv('SHEETS_MAX_RETRIES', '5'))
+SHEETS_BACKOFF_BASE = float(os.getenv('SHEETS_BACKOFF_BASE', '1.0'))
+SHEETS_BACKOFF_MAX = float(os.getenv('SHEETS_BACKOFF_MAX', '32.0'))
+
+# Коды ответов, при которых повторяется чтение
+RETRYABLE_STATUSES = (429, 500, 503)
+
+# Запись повторяется только после отказа по квоте: при 5xx изменение могло быть
+# уже применено, и повтор создал бы дубликат листа или конфликт имени
+RETRYABLE_WRITE_STATUSES = (429,)
+
+# Допуск на погрешность вычислений с плавающей точкой при пополнении bucket
+_TOKEN_EPSILON = 1e-9
+
+# Пространство имен общих bucket квот в хранилище состояния
+_BUCKET_NAMESPACE = "sheets_quota"
+
+class TokenBucket:
+    """
+    Потокобезопасный token bucket: capacity токенов, пополнение rate токенов в секунду
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        if capacity < 1 or rate <= 0:
+            raise ValueError(f"Некорректные параметры token bucket: capacity={capacity}, rate={rate}")
+        self.capacity = capacity
+        self.rate = rate
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """
+        Забирает один токен, при необходимости ожидая его появления
+
+        Returns:
+            float: Время ожидания в секундах
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1 - _TOKEN_EPSILON:
+                    self._tokens = max(0.0, self._tokens - 1)
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class SharedTokenBucket:
+    """
+    Token bucket в общем хранилище состояния: одну квоту расходуют все воркеры.
+
+    Параметры берутся у локального bucket, который используется, если хранилище
+    недоступно: лучше соблюдать квоту хотя бы в своем процессе, чем остановить запросы.
+    """
+
+    def __init__(self, local: TokenBucket, backend: StateBackend, key: str):
+        self.capacity = local.capacity
+        self.rate = local.rate
+        self.local = local
+        self.backend = backend
+        self.key = key
+
+    def acquire(self) -> float:
+        """
+        Забирает один токен из общего bucket, при необходимости ожидая его появления
+
+        Returns:
+            float: Время ожидания в секундах
+        """
+        waited = 0.0
+        while True:
+            try:
+                delay = self.backend.take_token(_BUCKET_NAMESPACE, self.key, self.capacity, self.rate)
+            except Exception as e:
+                logger.error(f"Не удалось взять токен квоты {self.key} в общем хранилище: {str(e)}")
+                return waited + self.local.acquire()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+def _per_minute_bucket(quota: int, burst: int) -> TokenBucket:
+    # Запас на всплеск вычитается из скорости пополнения, чтобы за любую минуту
+    # не выйти за квоту: burst + rate * 60 <= quota. При квоте 1 это невозможно,
+    # тогда пополнение - один токен в минуту
+    if quota < 1:
+        raise ValueError(f"Квота Google Sheets должна быть не меньше 1 запроса в минуту, получено {quota}")
+    burst = max(1, min(burst, quota // 2))
+    return TokenBucket(capacity=burst, rate=max(quota - burst, 1) / 60.0)
+
+class SheetsRateLimiter:
+    """
+    Ограничитель запросов к Google Sheets API с учетом квот на чтение и запись.
+
+    Каждый запрос забирает токен из соответствующего bucket. Чтение повторяется
+    при 429/500/503, запись - только при 429, с экспоненциальной задержкой со
+    случайным разбросом; заголовок Retry-After имеет приоритет над расчетной задержкой.
+
+    Квота Google относится к сервисному аккаунту, а не к процессу, поэтому при
+    нескольких воркерах bucket переводятся в общее хранилище (share_quota).
+    """
+
+    def __init__(self, read_quota: int = SHEETS_READ_QUOTA_PER_MIN,
+                 write_quota: int = SHEETS_WRITE_QUOTA_PER_MIN,
+                 burst: int = SHEETS_BURST,
+                 max_retries: int = SHEETS_MAX_RETRIES,
+                 backoff_base: float = SHEETS_BACKOFF_BASE,
+                 backoff_max: float = SHEETS_BACKOFF_MAX):
+        self.buckets = {
+            'read': _per_minute_bucket(read_quota, burst),
+            'write': _per_minute_bucket(write_quota, burst)
+        }
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self.calls = {'read': 0, 'write': 0}
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.errors_by_status = {}
+
+    def share_quota(self, backend: StateBackend) -> None:
+        """
+        Переводит bucket чтения и записи в общее хранилище состояния
+
+        Args:
+            backend: Хранилище, общее для воркеров (без постоянного хранилища ничего не меняется)
+        """
+        if not backend.persistent:
+            return
+        self.buckets = {
+            kind: SharedTokenBucket(bucket, backend, kind) for kind, bucket in self.buckets.items()
+        }
+        logger.info("Квоты Google Sheets общие для всех воркеров")
+
+    def _count(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter: случайная задержка от 0 до base * 2^attempt
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def backoff(self, attempt: int, error: HttpError) -> float:
+        """
+        Ждет перед повтором операции целиком (например, создания листа после 5xx)
+        с той же экспоненциальной задержкой со случайным разбросом, что и повтор запроса
+
+        Args:
+            attempt: Номер неудавшейся попытки, начиная с 0
+            error: Ошибка API, после которой выполняется повтор
+
+        Returns:
+            float: Время ожидания в секундах
+        """
+        delay = self._backoff_delay(attempt, _retry_after(error))
+        self._count(retries=1, backoff_seconds=delay)
+        SHEETS_RETRIES.inc(status=str(error.resp.status))
+        time.sleep(delay)
+        return delay
+
+    def execute(self, call: Callable[[], dict], kind: str = 'read') -> dict:
+        """
+        Выполняет запрос с учетом квот и повторами при временных ошибках
+
+        Args:
+            call: Функция, выполняющая запрос
+            kind: Тип квоты - 'read' или 'write'
+
+        Returns:
+            dict: Ответ API
+
+        Raises:
+            HttpError: Если запрос не удался после всех повторов или ошибка не временная
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = self.buckets[kind].acquire()
+            with self._lock:
+                self.calls[kind] += 1
+                self.throttled_seconds += waited
+            try:
+                return call()
+            except HttpError as e:
+                status = e.resp.status
+                with self._lock:
+                    self.errors_by_status[status] = self.errors_by_status.get(status, 0) + 1
+                retryable = RETRYABLE_STATUSES if kind == 'read' else RETRYABLE_WRITE_STATUSES
+                if status not in retryable or attempt == self.max_retries:
+                    self._count(failures=1)
+                    raise
+                delay = self._backoff_delay(attempt, _retry_after(e))
+                self._count(retries=1, backoff_seconds=delay)
+                SHEETS_RETRIES.inc(status=str(status))
+                logger.warning(f"Sheets API вернул {status}, повтор {attempt + 1}/{self.max_retries} через {delay:.1f} сек.")
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        """Возвращает счетчики ограничителя"""
+        with self._lock:
+            return {
+                'read_calls': self.calls['read'],
+                'write_calls': self.calls['write'],
+                'retries': self.retries,
+                'failures': self.failures,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'backoff_seconds': round(self.backoff_seconds, 3),
+                'errors_by_status': dict(self.errors_by_status),
+                'shared_quota': isinstance(self.buckets['read'], SharedTokenBucket)
+            }
+
+def _retry_after(error: HttpError) -> Optional[float]:
+    """
+    Извлекает значение заголовка Retry-After (в секундах) из ошибки API
+
+    Args:
+        error: Ошибка googleapiclient
+
+    Returns:
+        Optional[float]: Задержка или None, если заголовка нет
+    """
+    value = error.resp.get('retry-after') if hasattr(error.resp, 'get') else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
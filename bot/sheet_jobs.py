@@ -0,0 +1,295 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Число обработчиков очереди создания таблиц
+SHEET_JOB_WORKERS = int(os.getenv('SHEET_JOB_WORKERS', '2'))
+
+# Максимальное число заданий, ожидающих в очереди
+SHEET_JOB_QUEUE_SIZE = int(os.getenv('SHEET_JOB_QUEUE_SIZE', '50'))
+
+# Максимальное число одновременных заданий для одной таблицы Google Sheets
+SHEET_JOB_PER_SPREADSHEET = int(os.getenv('SHEET_JOB_PER_SPREADSHEET', '2'))
+
+# Слот таблицы в общем хранилище (несколько воркеров): срок аренды на случай падения
+# воркера и интервал повторной проверки, когда все слоты заняты другими воркерами (сек.)
+SHEET_JOB_SLOT_TTL = float(os.getenv('SHEET_JOB_SLOT_TTL', '300'))
+SHEET_JOB_SLOT_POLL_INTERVAL = float(os.getenv('SHEET_JOB_SLOT_POLL_INTERVAL', '0.5'))
+
+# Пространство имен слотов таблиц в хранилище состояния
+_SLOT_NAMESPACE = "sheet_job"
+
+class QueueFullError(Exception):
+    """Исключение при переполнении очереди создания таблиц"""
+    pass
+
+class SheetJobQueue:
+    """
+    Очередь заданий на создание листов проекта с ограниченным пулом обработчиков.
+
+    Число одновременно выполняемых заданий ограничено количеством обработчиков и
+    дополнительно лимитом на одну таблицу, размер очереди ограничен, чтобы при
+    всплеске запросов не превышать квоты Google Sheets. Обработчик берет первое
+    задание, для таблицы которого есть свободный слот, поэтому задание, упершееся
+    в лимит таблицы, не занимает обработчик и не блокирует задания других таблиц.
+
+    С общим хранилищем состояния лимит на таблицу действует на все воркеры: перед
+    выполнением задание арендует один из per_spreadsheet_limit слотов таблицы. Если
+    все слоты заняты другими воркерами, задание возвращается в начало очереди, а
+    таблица пропускается до следующей проверки через slot_poll_interval.
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable[None]],
+                 workers: int = SHEET_JOB_WORKERS,
+                 max_size: int = SHEET_JOB_QUEUE_SIZE,
+                 per_spreadsheet_limit: int = SHEET_JOB_PER_SPREADSHEET,
+                 backend: Optional[StateBackend] = None,
+                 owner: str = "",
+                 slot_ttl: float = SHEET_JOB_SLOT_TTL,
+                 slot_poll_interval: float = SHEET_JOB_SLOT_POLL_INTERVAL):
+        """
+        Args:
+            handler: Корутина, выполняющая задание
+            workers: Число обработчиков
+            max_size: Максимальный размер очереди
+            per_spreadsheet_limit: Лимит одновременных заданий на одну таблицу
+            backend: Хранилище состояния, общее для воркеров
+            owner: Идентификатор воркера (по умолчанию PID)
+            slot_ttl: Срок аренды слота таблицы в секундах
+            slot_poll_interval: Интервал проверки слотов, занятых другими воркерами, в секундах
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.per_spreadsheet_limit = per_spreadsheet_limit
+        self.backend = backend or StateBackend()
+        self.owner = owner or str(os.getpid())
+        self.slot_ttl = slot_ttl
+        self.slot_poll_interval = slot_poll_interval
+        self._pending = deque()
+        self._running: Dict[str, int] = {}
+        # Таблицы, все слоты которых заняты другими воркерами: spreadsheet_id -> время следующей проверки
+        self._blocked: Dict[str, float] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._tasks = []
+
+        self.in_progress = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slot_waits = 0
+
+    async def start(self) -> None:
+        """Запускает обработчики очереди"""
+        self._changed = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"sheet-job-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(f"Очередь создания таблиц запущена: {self.workers} обработчиков, размер {self.max_size}")
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """
+        Дожидается выполнения заданий из очереди и останавливает обработчики
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        if self._drained is None:
+            return
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь создания таблиц не опустела за {timeout} сек., осталось {len(self._pending)}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Очередь создания таблиц остановлена")
+
+    def submit(self, chat_id: int, project_data: dict, spreadsheet_id: str) -> int:
+        """
+        Ставит задание в очередь
+
+        Args:
+            chat_id: ID чата пользователя
+            project_data: Данные проекта
+            spreadsheet_id: ID таблицы, в которой создается лист
+
+        Returns:
+            int: Позиция в очереди (0 - задание начнет выполняться сразу)
+
+        Raises:
+            QueueFullError: Если очередь заполнена
+        """
+        if self._changed is None:
+            raise RuntimeError("Очередь создания таблиц не запущена")
+        if len(self._pending) >= self.max_size:
+            self.rejected += 1
+            logger.warning(f"Очередь создания таблиц заполнена, задание для chat_id {chat_id} отклонено")
+            raise QueueFullError("Очередь создания таблиц заполнена")
+        job = {
+            "chat_id": chat_id,
+            "project_data": project_data,
+            "spreadsheet_id": spreadsheet_id,
+            "enqueued_at": time.monotonic()
+        }
+        self._pending.append(job)
+        self.submitted += 1
+        self._drained.clear()
+        self._changed.set()
+
+        position = self._position(job)
+        logger.info(f"Задание для chat_id {chat_id} поставлено в очередь, позиция {position}")
+        return position
+
+    def _has_capacity(self, spreadsheet_id: str, running: Dict[str, int]) -> bool:
+        return running.get(spreadsheet_id, 0) < self.per_spreadsheet_limit
+
+    def _position(self, job: dict) -> int:
+        # Повторяем раздачу заданий свободным обработчикам: 0, если задание достанется
+        # обработчику сразу, иначе его номер среди продолжающих ждать
+        running = dict(self._running)
+        idle_workers = self.workers - self.in_progress
+        waiting = 0
+        for pending in self._pending:
+            spreadsheet_id = pending["spreadsheet_id"]
+            if idle_workers > 0 and self._has_capacity(spreadsheet_id, running):
+                idle_workers -= 1
+                running[spreadsheet_id] = running.get(spreadsheet_id, 0) + 1
+                if pending is job:
+                    return 0
+                continue
+            waiting += 1
+            if pending is job:
+                return waiting
+        return waiting
+
+    def _take_job(self) -> Optional[dict]:
+        # Первое задание, для таблицы которого есть свободный слот
+        now = time.monotonic()
+        for job in self._pending:
+            spreadsheet_id = job["spreadsheet_id"]
+            if self._blocked.get(spreadsheet_id, 0.0) > now:
+                continue
+            if self._has_capacity(spreadsheet_id, self._running):
+                self._pending.remove(job)
+                return job
+        return None
+
+    async def _wait_changed(self) -> None:
+        if not self._blocked:
+            await self._changed.wait()
+            return
+        # Слоты других воркеров освобождаются без уведомления: проверяем их по таймеру
+        timeout = max(0.0, min(self._blocked.values()) - time.monotonic())
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        now = time.monotonic()
+        for spreadsheet_id, retry_at in list(self._blocked.items()):
+            if retry_at <= now:
+                del self._blocked[spreadsheet_id]
+
+    async def _claim_slot(self, spreadsheet_id: str, owner: str) -> Optional[str]:
+        """Арендует слот таблицы в общем хранилище; '' - хранилища нет, None - слоты заняты"""
+        if not self.backend.persistent:
+            return ""
+        try:
+            for slot in range(self.per_spreadsheet_limit):
+                key = f"{spreadsheet_id}:{slot}"
+                if await asyncio.to_thread(self.backend.claim, _SLOT_NAMESPACE, key, owner, self.slot_ttl):
+                    return key
+        except Exception as e:
+            # Без общего хранилища соблюдаем хотя бы лимит этого воркера
+            logger.error(f"Не удалось занять слот таблицы {spreadsheet_id} в общем хранилище: {str(e)}")
+            return ""
+        return None
+
+    async def _release_slot(self, key: str, owner: str) -> None:
+        if not key:
+            return
+        try:
+            await asyncio.to_thread(self.backend.release, _SLOT_NAMESPACE, key, owner)
+        except Exception as e:
+            logger.error(f"Не удалось освободить слот таблицы {key} в общем хранилище: {str(e)}")
+
+    def _finish(self, spreadsheet_id: str) -> None:
+        self.in_progress -= 1
+        self._running[spreadsheet_id] -= 1
+        if not self._running[spreadsheet_id]:
+            del self._running[spreadsheet_id]
+
+    async def _worker(self, index: int) -> None:
+        # У каждого обработчика свой владелец: аренда тем же владельцем считается свободной
+        owner = f"{self.owner}-{index}"
+        while True:
+            job = self._take_job()
+            if job is None:
+                self._changed.clear()
+                await self._wait_changed()
+                continue
+
+            spreadsheet_id = job["spreadsheet_id"]
+            # Место в лимите воркера занимается до ожидания хранилища, чтобы другие
+            # обработчики не обогнали задание той же таблицы
+            self._running[spreadsheet_id] = self._running.get(spreadsheet_id, 0) + 1
+            self.in_progress += 1
+            slot = await self._claim_slot(spreadsheet_id, owner)
+            if slot is None:
+                self._finish(spreadsheet_id)
+                # Задание было первым для своей таблицы, поэтому порядок внутри таблицы сохраняется
+                self._pending.appendleft(job)
+                self._blocked[spreadsheet_id] = time.monotonic() + self.slot_poll_interval
+                self.slot_waits += 1
+                continue
+
+            wait = time.monotonic() - job["enqueued_at"]
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                await self.handler(job)
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка в обработчике очереди {index}: {str(e)}")
+            finally:
+                self._finish(spreadsheet_id)
+                await self._release_slot(slot, owner)
+                # Освободился слот таблицы: ожидающие задания могут стать доступны
+                self._changed.set()
+                if not self._pending and not self.in_progress:
+                    self._drained.set()
+
+    def stats(self) -> dict:
+        """Возвращает метрики очереди"""
+        started = self.completed + self.failed + self.in_progress
+        return {
+            "depth": len(self._pending),
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "in_progress": self.in_progress,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait / started, 3) if started else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "slot_waits": self.slot_waits
+        }
@@ -1,13 +1,22 @@
 import os
+import re
 import json
+import asyncio
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
+import httplib2
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from .rate_limiter import SheetsRateLimiter
+from .metrics import SHEETS_CALL_SECONDS, SHEETS_ERRORS
+from .sheets_trace import SheetsTrace, SHEETS_TRACE_DIR, activate, current_trace, error_status, payload_size, stage
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -29,15 +38,412 @@ SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',  # Полный доступ к таблицам
 ]
 
+# Доступ к метаданным файлов (modifiedTime шаблонов)
+DRIVE_METADATA_SCOPE = 'https://www.googleapis.com/auth/drive.metadata.readonly'
+
+# Шаблон секции занимает столбцы A-J
+SECTION_COLUMNS = 10
+
+# Поля, которые запрашиваются у шаблонов (без лишних данных о листе)
+TEMPLATE_FIELDS = (
+    'sheets(properties(sheetId,title,gridProperties),merges,conditionalFormats,'
+    'data(rowData(values(userEnteredValue,userEnteredFormat,note,dataValidation,textFormatRuns))))'
+)
+
+# Поля ячеек, которые переносятся из шаблона секции
+SECTION_CELL_FIELDS = 'userEnteredValue,userEnteredFormat,note,dataValidation,textFormatRuns'
+
+# Ссылка на ячейку в формуле: необязательный $, столбец, необязательный $, строка.
+# Имена функций (LOG10( и т.п.) и части других идентификаторов не считаются ссылками
+_CELL_REF_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9_.$])(\$?)([A-Z]{1,3})(\$?)([0-9]+)(?![0-9A-Za-z_(])"
+)
+
+def _shift_formula_rows(formula: str, offset: int) -> str:
+    """
+    Сдвигает относительные ссылки на строки в формуле, как это делает copyPaste
+    
+    Args:
+        formula: Формула в нотации A1
+        offset: Смещение в строках
+        
+    Returns:
+        str: Формула со сдвинутыми ссылками
+    """
+    if not offset:
+        return formula
+
+    def shift(match):
+        col_abs, col, row_abs, row = match.groups()
+        if not row_abs:
+            row = str(int(row) + offset)
+        return f"{col_abs}{col}{row_abs}{row}"
+
+    # Строковые литералы в кавычках не трогаем
+    parts = formula.split('"')
+    for i in range(0, len(parts), 2):
+        parts[i] = _CELL_REF_PATTERN.sub(shift, parts[i])
+    return '"'.join(parts)
+
+def _render_cell(cell: dict, section: str, offset: int) -> dict:
+    """
+    Готовит ячейку шаблона секции для записи в лист проекта
+    
+    Args:
+        cell: Ячейка из rowData шаблона
+        section: Название раздела для подстановки в {sectionName}
+        offset: Смещение раздела в строках относительно шаблона
+        
+    Returns:
+        dict: Данные ячейки для запроса updateCells
+    """
+    rendered = {key: cell[key] for key in ('userEnteredFormat', 'note', 'dataValidation') if key in cell}
+    value = cell.get('userEnteredValue')
+    if value is None:
+        return rendered
+
+    if 'stringValue' in value and '{sectionName}' in value['stringValue']:
+        # Подстановка меняет длину строки, поэтому textFormatRuns не переносим
+        rendered['userEnteredValue'] = {
+            'stringValue': value['stringValue'].replace('{sectionName}', section.title())
+        }
+        return rendered
+
+    if 'formulaValue' in value:
+        rendered['userEnteredValue'] = {'formulaValue': _shift_formula_rows(value['formulaValue'], offset)}
+    else:
+        rendered['userEnteredValue'] = value
+    if 'textFormatRuns' in cell:
+        rendered['textFormatRuns'] = cell['textFormatRuns']
+    return rendered
+
+def _shift_conditional_format(rule: dict, sheet_id: int, offset: int) -> dict:
+    """
+    Переносит правило условного форматирования шаблона секции на раздел, как copyPaste:
+    диапазоны и относительные ссылки в пользовательских формулах сдвигаются на offset строк
+    
+    Args:
+        rule: Правило из conditional_formats разобранного шаблона
+        sheet_id: ID листа проекта
+        offset: Смещение раздела в строках относительно шаблона
+        
+    Returns:
+        dict: Правило для запроса addConditionalFormatRule
+    """
+    shifted = dict(rule)
+    shifted['ranges'] = [
+        dict(grid_range, sheetId=sheet_id,
+             startRowIndex=grid_range['startRowIndex'] + offset,
+             endRowIndex=grid_range['endRowIndex'] + offset)
+        for grid_range in rule['ranges']
+    ]
+    boolean_rule = rule.get('booleanRule')
+    if boolean_rule and boolean_rule.get('condition', {}).get('values'):
+        condition = dict(boolean_rule['condition'])
+        condition['values'] = [
+            {'userEnteredValue': _shift_formula_rows(value['userEnteredValue'], offset)}
+            if str(value.get('userEnteredValue', '')).startswith('=') else value
+            for value in condition['values']
+        ]
+        shifted['booleanRule'] = dict(boolean_rule, condition=condition)
+    return shifted
+
+def _clip_range(grid_range: dict, row_count: int) -> Optional[dict]:
+    """Обрезает диапазон шаблона по заполненным строкам и столбцам A-J (None - вне области)"""
+    start_row = grid_range.get('startRowIndex', 0)
+    start_column = grid_range.get('startColumnIndex', 0)
+    if start_row >= row_count or start_column >= SECTION_COLUMNS:
+        return None
+    return {
+        'startRowIndex': start_row,
+        'endRowIndex': min(grid_range.get('endRowIndex', row_count), row_count),
+        'startColumnIndex': start_column,
+        'endColumnIndex': min(grid_range.get('endColumnIndex', SECTION_COLUMNS), SECTION_COLUMNS)
+    }
+
+def _parse_template(sheet: dict) -> dict:
+    """
+    Разбирает лист шаблона, полученный с includeGridData
+    
+    Args:
+        sheet: Элемент sheets из ответа spreadsheets().get
+        
+    Returns:
+        dict: sheet_id, grid_properties, rows (ячейки столбцов A-J), row_count
+              (строки до последней заполненной), column_a_rows (строки до последней
+              заполненной в столбце A), merges (объединения в пределах row_count),
+              conditional_formats (правила условного форматирования с диапазонами
+              в пределах row_count) и conditional_format_count (всего правил на листе)
+    """
+    properties = sheet['properties']
+    data = sheet.get('data') or [{}]
+    rows = [row.get('values', [])[:SECTION_COLUMNS] for row in data[0].get('rowData', [])]
+
+    row_count = 0
+    column_a_rows = 0
+    for index, row in enumerate(rows):
+        if any('userEnteredValue' in cell for cell in row):
+            row_count = index + 1
+        if row and 'userEnteredValue' in row[0]:
+            column_a_rows = index + 1
+
+    merges = [
+        merge for merge in sheet.get('merges', [])
+        if merge.get('startRowIndex', 0) < row_count
+        and merge.get('startColumnIndex', 0) < SECTION_COLUMNS
+    ]
+    merges = [
+        {
+            'startRowIndex': merge.get('startRowIndex', 0),
+            'endRowIndex': min(merge['endRowIndex'], row_count),
+            'startColumnIndex': merge.get('startColumnIndex', 0),
+            'endColumnIndex': min(merge['endColumnIndex'], SECTION_COLUMNS)
+        }
+        for merge in merges
+    ]
+
+    conditional_formats = []
+    for rule in sheet.get('conditionalFormats', []):
+        ranges = [_clip_range(grid_range, row_count) for grid_range in rule.get('ranges', [])]
+        ranges = [grid_range for grid_range in ranges if grid_range]
+        if ranges:
+            conditional_formats.append(dict(rule, ranges=ranges))
+
+    return {
+        'sheet_id': properties['sheetId'],
+        'title': properties.get('title'),
+        'grid_properties': properties.get('gridProperties', {}),
+        'rows': rows,
+        'row_count': row_count,
+        'column_a_rows': column_a_rows,
+        'merges': merges,
+        'conditional_formats': conditional_formats,
+        'conditional_format_count': len(sheet.get('conditionalFormats', []))
+    }
+
+
+# Число потоков, в которых выполняются блокирующие запросы к Google Sheets
+SHEETS_EXECUTOR_WORKERS = int(os.getenv('SHEETS_EXECUTOR_WORKERS', '4'))
+
+# Время жизни закэшированного шаблона в секундах
+TEMPLATE_CACHE_TTL = float(os.getenv('SHEETS_TEMPLATE_CACHE_TTL', '600'))
+
+# Проверять изменение шаблона через Drive modifiedTime по истечении TTL
+TEMPLATE_CHECK_MODIFIED = os.getenv('SHEETS_TEMPLATE_CHECK_MODIFIED', '0') == '1'
+
+class TemplateCache:
+    """
+    Кэш разобранных шаблонов (данные ячеек, форматы, объединения, число строк),
+    ключ - ID таблицы-шаблона
+    """
+
+    def __init__(self, ttl: float = TEMPLATE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_id: str) -> Optional[dict]:
+        """
+        Возвращает запись кэша, если она есть (в том числе просроченную)
+        
+        Args:
+            template_id: ID таблицы-шаблона
+            
+        Returns:
+            Optional[dict]: Запись с ключами template, fetched_at, modified_time
+        """
+        with self._lock:
+            return self._entries.get(template_id)
+
+    def is_fresh(self, entry: dict) -> bool:
+        """Проверяет, не истек ли TTL записи"""
+        return time.monotonic() - entry['fetched_at'] < self.ttl
+
+    def put(self, template_id: str, template: dict, modified_time: Optional[str] = None) -> None:
+        """Сохраняет разобранный шаблон"""
+        with self._lock:
+            self._entries[template_id] = {
+                'template': template,
+                'fetched_at': time.monotonic(),
+                'modified_time': modified_time
+            }
+
+    def touch(self, template_id: str) -> None:
+        """Продлевает TTL записи, если шаблон не изменился"""
+        with self._lock:
+            if template_id in self._entries:
+                self._entries[template_id]['fetched_at'] = time.monotonic()
+
+    def record(self, hit: bool) -> None:
+        """Учитывает попадание или промах кэша"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, template_id: Optional[str] = None) -> None:
+        """Удаляет запись кэша (или все записи, если ID не указан)"""
+        with self._lock:
+            if template_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(template_id, None)
+
+    def stats(self) -> dict:
+        """Возвращает статистику кэша"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+# Время, через которое индекс названий листов перечитывается целиком (на случай ручных правок)
+TITLE_INDEX_TTL = float(os.getenv('SHEETS_TITLE_INDEX_TTL', '300'))
+
+# Название листа с числовым суффиксом: "Проект-3"
+_SUFFIX_PATTERN = re.compile(r'^(.*)-([0-9]+)$')
+
+class SheetTitleIndex:
+    """
+    Индекс названий листов основной таблицы.
+    
+    Загружается одним запросом и дальше обновляется локально при добавлении,
+    переименовании и удалении листов. Для каждого базового имени хранится
+    указатель на следующий свободный суффикс -k.
+    """
+
+    def __init__(self, ttl: float = TITLE_INDEX_TTL):
+        self.ttl = ttl
+        self.loaded_at = None
+        self._titles = {}          # sheetId -> title
+        self._taken = set()        # занятые названия (включая зарезервированные)
+        self._reserved = set()     # имена, выданные под создаваемые листы
+        self._next_suffix = {}     # базовое имя -> первый суффикс, который стоит проверить
+        self._lock = threading.Lock()
+
+    def is_loaded(self) -> bool:
+        """Проверяет, загружен ли индекс и не истек ли его TTL"""
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    def load(self, sheets: List[dict]) -> None:
+        """
+        Заполняет индекс из ответа spreadsheets().get
+        
+        Args:
+            sheets: Элементы sheets с properties(title,sheetId)
+        """
+        with self._lock:
+            self._titles = {
+                sheet['properties']['sheetId']: sheet['properties']['title']
+                for sheet in sheets
+            }
+            # Резервы создаваемых листов переживают перезагрузку индекса
+            self._taken = set(self._titles.values()) | self._reserved
+            self._next_suffix = {}
+            self.loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Помечает индекс как устаревший"""
+        with self._lock:
+            self.loaded_at = None
+
+    def __contains__(self, title: str) -> bool:
+        with self._lock:
+            return title in self._taken
+
+    def _release_suffix(self, title: str) -> None:
+        # Освободившийся суффикс снова становится кандидатом
+        match = _SUFFIX_PATTERN.match(title)
+        if match:
+            base, suffix = match.group(1), int(match.group(2))
+            if suffix < self._next_suffix.get(base, 1):
+                self._next_suffix[base] = suffix
+
+    def unique_name(self, base_name: str, reserve: bool = False) -> str:
+        """
+        Возвращает первое свободное имя: base_name, base_name-1, base_name-2, ...
+        
+        Args:
+            base_name: Базовое имя листа
+            reserve: Сразу занять найденное имя, чтобы параллельные создания не получили его же
+            
+        Returns:
+            str: Уникальное имя листа
+        """
+        with self._lock:
+            name = base_name
+            if name in self._taken:
+                counter = self._next_suffix.get(base_name, 1)
+                while f"{base_name}-{counter}" in self._taken:
+                    counter += 1
+                self._next_suffix[base_name] = counter
+                name = f"{base_name}-{counter}"
+            if reserve:
+                self._taken.add(name)
+                self._reserved.add(name)
+            return name
+
+    def release(self, title: str) -> None:
+        """Снимает резерв с имени, если лист с ним так и не был создан"""
+        with self._lock:
+            self._reserved.discard(title)
+            if title not in self._titles.values():
+                self._taken.discard(title)
+                self._release_suffix(title)
+
+    def add(self, sheet_id: int, title: str) -> None:
+        """Учитывает добавленный лист"""
+        with self._lock:
+            self._titles[sheet_id] = title
+            self._taken.add(title)
+
+    def rename(self, sheet_id: int, title: str) -> None:
+        """Учитывает переименование листа"""
+        with self._lock:
+            old_title = self._titles.get(sheet_id)
+            if old_title is not None:
+                self._taken.discard(old_title)
+                self._release_suffix(old_title)
+            self._titles[sheet_id] = title
+            self._taken.add(title)
+            self._reserved.discard(title)
+
+    def remove(self, sheet_id: int) -> None:
+        """Учитывает удаление листа"""
+        with self._lock:
+            title = self._titles.pop(sheet_id, None)
+            if title is not None:
+                self._taken.discard(title)
+                self._release_suffix(title)
+
 class GoogleSheetsAPI:
-    def __init__(self):
-        """Инициализация класса для работы с Google Sheets API"""
+    def __init__(self, credentials_dir: str = 'credentials'):
+        """
+        Инициализация класса для работы с Google Sheets API
+
+        Args:
+            credentials_dir: Каталог с credentials.json и client_secrets.json
+        """
         self.credentials = None
         self.service = None
         self.spreadsheet_id = None
+        self.drive_service = None
+        self.template_cache = TemplateCache()
+        self.title_index = SheetTitleIndex()
+        self._title_index_lock = threading.Lock()
+        self.rate_limiter = SheetsRateLimiter()
+        
+        # Отдельный ограниченный пул потоков, чтобы запросы к API не блокировали цикл событий
+        self.executor = ThreadPoolExecutor(
+            max_workers=SHEETS_EXECUTOR_WORKERS,
+            thread_name_prefix='sheets-api'
+        )
+        # httplib2.Http не потокобезопасен, поэтому у каждого потока свой экземпляр
+        self._thread_local = threading.local()
         
         # Путь к файлу с учетными данными сервисного аккаунта
-        self.credentials_file = os.path.join('credentials', 'credentials.json')
+        self.credentials_dir = credentials_dir
+        self.credentials_file = os.path.join(credentials_dir, 'credentials.json')
         if not os.path.exists(self.credentials_file):
             raise FileNotFoundError(f"Файл {self.credentials_file} не найден")
 
@@ -50,9 +456,10 @@ class GoogleSheetsAPI:
             
             # Загружаем учетные данные сервисного аккаунта
             from google.oauth2.service_account import Credentials
+            scopes = SCOPES + [DRIVE_METADATA_SCOPE] if TEMPLATE_CHECK_MODIFIED else SCOPES
             self.credentials = Credentials.from_service_account_file(
                 self.credentials_file,
-                scopes=SCOPES
+                scopes=scopes
             )
             logger.info("Учетные данные сервисного аккаунта успешно загружены")
             
@@ -60,8 +467,13 @@ class GoogleSheetsAPI:
             self.service = build('sheets', 'v4', credentials=self.credentials)
             logger.info("Сервисный объект успешно создан")
             
+            # Drive нужен только для проверки изменений шаблонов
+            if TEMPLATE_CHECK_MODIFIED:
+                self.drive_service = build('drive', 'v3', credentials=self.credentials)
+                logger.info("Сервисный объект Drive создан для проверки изменений шаблонов")
+            
             # Загружаем ID основной таблицы из файла client_secrets.json
-            client_secrets_path = os.path.join('credentials', 'client_secrets.json')
+            client_secrets_path = os.path.join(self.credentials_dir, 'client_secrets.json')
             if os.path.exists(client_secrets_path):
                 with open(client_secrets_path, 'r') as f:
                     config = json.load(f)
@@ -77,6 +489,78 @@ class GoogleSheetsAPI:
             logger.error(f"Ошибка при аутентификации: {str(e)}")
             raise
 
+    def _execute(self, request):
+        """
+        Выполняет запрос к API через HTTP-клиент текущего потока с учетом квот
+        и повторами при ошибках 429/500/503
+        
+        Args:
+            request: Подготовленный запрос googleapiclient
+            
+        Returns:
+            dict: Ответ API
+        """
+        kind = 'read' if getattr(request, 'method', None) == 'GET' else 'write'
+        # Имя метода API (например, sheets.spreadsheets.batchUpdate) для метрик
+        method = getattr(request, 'methodId', None) or 'unknown'
+        if self.credentials is None:
+            call = request.execute
+        else:
+            http = getattr(self._thread_local, 'http', None)
+            if http is None:
+                http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+                self._thread_local.http = http
+            call = lambda: request.execute(http=http)
+        trace = current_trace()
+        started = time.perf_counter()
+        try:
+            with SHEETS_CALL_SECONDS.time(method=method):
+                response = self.rate_limiter.execute(call, kind)
+        except Exception as e:
+            SHEETS_ERRORS.inc(method=method)
+            if trace is not None:
+                trace.record_call(method, started, payload_size(request), error_status(e))
+            raise
+        if trace is not None:
+            trace.record_call(method, started, payload_size(request), "ok")
+        return response
+
+    async def run_in_executor(self, func, *args):
+        """
+        Выполняет блокирующий метод в пуле потоков Sheets и дожидается результата
+        
+        Args:
+            func: Вызываемый объект
+            *args: Аргументы вызова
+            
+        Returns:
+            Результат func
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def create_project_sheet_async(self, project_name: str, sections: List[str],
+                                         trace: Optional[SheetsTrace] = None) -> Optional[str]:
+        """
+        Асинхронная обертка над create_project_sheet_with_retry
+        
+        Args:
+            project_name: Название проекта
+            sections: Список разделов проекта
+            trace: Трассировка, в которую записываются этапы и вызовы API
+            
+        Returns:
+            Optional[str]: URL созданного листа или None в случае ошибки
+        """
+        return await self.run_in_executor(self.create_project_sheet_with_retry, project_name, sections, trace)
+
+    def close(self) -> None:
+        """
+        Дожидается завершения запущенных запросов и останавливает пул потоков
+        """
+        self.executor.shutdown(wait=True)
+        logger.info("Пул потоков Google Sheets API остановлен")
+
     def get_service(self):
         """
         Возвращает сервисный объект для работы с Google Sheets API
@@ -107,7 +591,7 @@ class GoogleSheetsAPI:
                     'title': title
                 }
             }
-            spreadsheet = self.service.spreadsheets().create(body=spreadsheet).execute()
+            spreadsheet = self._execute(self.service.spreadsheets().create(body=spreadsheet))
             spreadsheet_id = spreadsheet.get('spreadsheetId')
             logger.info(f"Создана новая таблица с ID: {spreadsheet_id}")
             return spreadsheet_id
@@ -129,12 +613,12 @@ class GoogleSheetsAPI:
             body = {
                 'values': values
             }
-            self.service.spreadsheets().values().update(
+            self._execute(self.service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption='RAW',
                 body=body
-            ).execute()
+            ))
             logger.info(f"Данные успешно записаны в диапазон {range_name}")
             
         except Exception as e:
@@ -153,10 +637,10 @@ class GoogleSheetsAPI:
             list: Список списков с прочитанными данными
         """
         try:
-            result = self.service.spreadsheets().values().get(
+            result = self._execute(self.service.spreadsheets().values().get(
                 spreadsheetId=spreadsheet_id,
                 range=range_name
-            ).execute()
+            ))
             values = result.get('values', [])
             logger.info(f"Данные успешно прочитаны из диапазона {range_name}")
             return values
@@ -239,13 +723,15 @@ class GoogleSheetsAPI:
             }
             
             # Выполняем первый запрос для создания листа
-            response = self.service.spreadsheets().batchUpdate(
+            response = self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body={'requests': [request_body['requests'][0]]}
-            ).execute()
+            ))
             
             # Получаем ID созданного листа
             sheet_id = response['replies'][0]['addSheet']['properties']['sheetId']
+            if spreadsheet_id == self.spreadsheet_id:
+                self.title_index.add(sheet_id, sheet_name)
             
             # Заменяем placeholder на реальный ID листа
             formatted_requests = []
@@ -259,10 +745,10 @@ class GoogleSheetsAPI:
             
             # Выполняем второй запрос для форматирования
             if formatted_requests:
-                self.service.spreadsheets().batchUpdate(
+                self._execute(self.service.spreadsheets().batchUpdate(
                     spreadsheetId=spreadsheet_id,
                     body={'requests': formatted_requests}
-                ).execute()
+                ))
             
             logger.info(f"Создан новый лист '{sheet_name}' с ID: {sheet_id}")
             return sheet_id
@@ -285,9 +771,9 @@ class GoogleSheetsAPI:
         """
         try:
             # Получаем информацию о первом листе шаблона
-            template_metadata = self.service.spreadsheets().get(
+            template_metadata = self._execute(self.service.spreadsheets().get(
                 spreadsheetId=template_id
-            ).execute()
+            ))
             source_sheet_id = template_metadata['sheets'][0]['properties']['sheetId']
             
             # Формируем запрос на копирование
@@ -296,13 +782,15 @@ class GoogleSheetsAPI:
             }
             
             # Копируем лист
-            response = self.service.spreadsheets().sheets().copyTo(
+            response = self._execute(self.service.spreadsheets().sheets().copyTo(
                 spreadsheetId=template_id,
                 sheetId=source_sheet_id,
                 body=request_body
-            ).execute()
+            ))
             
             new_sheet_id = response['sheetId']
+            if target_spreadsheet_id == self.spreadsheet_id:
+                self.title_index.add(new_sheet_id, response.get('title', ''))
             
             # Если указано новое имя, переименовываем лист
             if sheet_name:
@@ -318,10 +806,12 @@ class GoogleSheetsAPI:
                     }]
                 }
                 
-                self.service.spreadsheets().batchUpdate(
+                self._execute(self.service.spreadsheets().batchUpdate(
                     spreadsheetId=target_spreadsheet_id,
                     body=rename_request
-                ).execute()
+                ))
+                if target_spreadsheet_id == self.spreadsheet_id:
+                    self.title_index.rename(new_sheet_id, sheet_name)
             
             logger.info(f"Лист успешно скопирован, новый ID: {new_sheet_id}")
             return new_sheet_id
@@ -347,17 +837,35 @@ class GoogleSheetsAPI:
                 }]
             }
             
-            self.service.spreadsheets().batchUpdate(
+            self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body=request_body
-            ).execute()
+            ))
             
+            if spreadsheet_id == self.spreadsheet_id:
+                self.title_index.remove(sheet_id)
             logger.info(f"Лист с ID {sheet_id} успешно удален")
             
         except Exception as e:
             logger.error(f"Ошибка при удалении листа: {str(e)}")
             raise
 
+    def _discard_sheet(self, spreadsheet_id: Optional[str], sheet_id: Optional[int]) -> None:
+        """
+        Удаляет недозаполненную копию шаблона после ошибки, не пробрасывая исключений
+        
+        Args:
+            spreadsheet_id: ID таблицы
+            sheet_id: ID скопированного листа или None, если копирование не выполнялось
+        """
+        if spreadsheet_id is None or sheet_id is None:
+            return
+        try:
+            with stage("discard"):
+                self.delete_sheet(spreadsheet_id, sheet_id)
+        except Exception as e:
+            logger.error(f"Не удалось удалить недозаполненный лист {sheet_id}: {str(e)}")
+
     def get_sheets(self, spreadsheet_id: str) -> list:
         """
         Получает список всех листов в таблице
@@ -369,9 +877,9 @@ class GoogleSheetsAPI:
             list: Список словарей с информацией о листах
         """
         try:
-            spreadsheet = self.service.spreadsheets().get(
+            spreadsheet = self._execute(self.service.spreadsheets().get(
                 spreadsheetId=spreadsheet_id
-            ).execute()
+            ))
             
             sheets = []
             for sheet in spreadsheet['sheets']:
@@ -399,9 +907,9 @@ class GoogleSheetsAPI:
             Optional[dict]: Информация о листе или None, если лист не найден
         """
         try:
-            spreadsheet = self.service.spreadsheets().get(
+            spreadsheet = self._execute(self.service.spreadsheets().get(
                 spreadsheetId=self.spreadsheet_id
-            ).execute()
+            ))
             
             for sheet in spreadsheet.get('sheets', []):
                 if str(sheet['properties']['sheetId']) == str(sheet_id):
@@ -413,31 +921,36 @@ class GoogleSheetsAPI:
             logger.error(f"Ошибка при получении информации о листе: {str(e)}")
             return None
 
-    def _get_unique_sheet_name(self, base_name: str) -> str:
+    def _get_title_index(self) -> SheetTitleIndex:
+        """
+        Возвращает индекс названий листов основной таблицы, загружая его при необходимости
+        
+        Returns:
+            SheetTitleIndex: Актуальный индекс
+        """
+        # Проверка и загрузка под одной блокировкой: параллельные потоки не читают индекс повторно
+        with self._title_index_lock:
+            if not self.title_index.is_loaded():
+                sheets = self._execute(self.service.spreadsheets().get(
+                    spreadsheetId=self.spreadsheet_id,
+                    fields='sheets.properties(title,sheetId)'
+                )).get('sheets', [])
+                self.title_index.load(sheets)
+                logger.info(f"Индекс названий листов загружен: {len(sheets)} листов")
+        return self.title_index
+
+    def _get_unique_sheet_name(self, base_name: str, reserve: bool = False) -> str:
         """
         Генерирует уникальное имя листа, добавляя -1, -2 и т.д. если имя занято
         
         Args:
             base_name: Базовое имя листа
+            reserve: Занять имя в индексе до фактического переименования листа
             
         Returns:
             str: Уникальное имя листа
         """
-        name = base_name
-        counter = 1
-        
-        while True:
-            # Проверяем существование листа
-            sheets = self.service.spreadsheets().get(
-                spreadsheetId=self.spreadsheet_id
-            ).execute().get('sheets', [])
-            
-            exists = any(sheet['properties']['title'] == name for sheet in sheets)
-            if not exists:
-                return name
-                
-            name = f"{base_name}-{counter}"
-            counter += 1
+        return self._get_title_index().unique_name(base_name, reserve=reserve)
 
     def create_project_sheet(self, project_data: dict) -> Optional[str]:
         """
@@ -460,10 +973,276 @@ class GoogleSheetsAPI:
         # Вызываем метод create_project_sheet_with_retry
         return self.create_project_sheet_with_retry(project_name, sections)
     
-    def create_project_sheet_with_retry(self, project_name: str, sections: List[str]) -> Optional[str]:
+    def _fetch_template(self, template_id: str) -> dict:
+        """
+        Загружает первый лист шаблона вместе с данными ячеек одним запросом
+        
+        Args:
+            template_id: ID таблицы-шаблона
+            
+        Returns:
+            dict: Разобранный шаблон (см. _parse_template)
+        """
+        logger.info(f"Fetching template grid data from spreadsheet: {template_id}")
+        spreadsheet = self._execute(self.service.spreadsheets().get(
+            spreadsheetId=template_id,
+            includeGridData=True,
+            fields=TEMPLATE_FIELDS
+        ))
+        return _parse_template(spreadsheet['sheets'][0])
+
+    def _get_template_modified_time(self, template_id: str) -> Optional[str]:
+        """
+        Возвращает время последнего изменения шаблона по данным Drive
+        
+        Args:
+            template_id: ID таблицы-шаблона
+            
+        Returns:
+            Optional[str]: modifiedTime или None, если проверка отключена или не удалась
+        """
+        if not self.drive_service:
+            return None
+        try:
+            response = self._execute(self.drive_service.files().get(
+                fileId=template_id,
+                fields='modifiedTime'
+            ))
+            return response.get('modifiedTime')
+        except Exception as e:
+            logger.warning(f"Не удалось получить modifiedTime шаблона {template_id}: {str(e)}")
+            return None
+
+    def _get_template(self, template_id: str) -> dict:
+        """
+        Возвращает разобранный шаблон из кэша, перечитывая его по истечении TTL
+        или при изменении файла шаблона
+        
+        Args:
+            template_id: ID таблицы-шаблона
+            
+        Returns:
+            dict: Разобранный шаблон (см. _parse_template)
+        """
+        entry = self.template_cache.get(template_id)
+        if entry and self.template_cache.is_fresh(entry):
+            self.template_cache.record(hit=True)
+            return entry['template']
+
+        modified_time = self._get_template_modified_time(template_id)
+        if entry and modified_time and modified_time == entry['modified_time']:
+            logger.info(f"Template {template_id} not modified since {modified_time}, reusing cached copy")
+            self.template_cache.touch(template_id)
+            self.template_cache.record(hit=True)
+            return entry['template']
+
+        self.template_cache.record(hit=False)
+        template = self._fetch_template(template_id)
+        self.template_cache.put(template_id, template, modified_time)
+        return template
+
+    def warm_template_cache(self) -> None:
+        """
+        Заранее загружает шаблоны верхней части и секции в кэш
+        """
+        config = self._load_project_config()
+        if not config:
+            return
+        for key in ('template_top', 'template_section'):
+            self._get_template(config[key])
+        logger.info("Кэш шаблонов прогрет")
+
+    def _load_project_config(self) -> Optional[dict]:
+        """
+        Загружает ID основной таблицы и шаблонов из client_secrets.json
+        
+        Returns:
+            Optional[dict]: Раздел 'installed' конфигурации или None в случае ошибки
+        """
+        client_secrets_path = os.path.join(self.credentials_dir, 'client_secrets.json')
+        logger.info(f"Loading configuration from: {client_secrets_path}")
+        if not os.path.exists(client_secrets_path):
+            logger.error(f"Файл {client_secrets_path} не найден")
+            return None
+            
+        with open(client_secrets_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        logger.info("Configuration loaded successfully")
+        
+        if 'installed' not in config:
+            logger.error("В файле client_secrets.json нет раздела 'installed'")
+            return None
+            
+        # Проверяем наличие необходимых параметров
+        for key in ('main_sheet', 'template_top', 'template_section'):
+            if key not in config['installed']:
+                logger.error(f"В файле client_secrets.json нет параметра '{key}'")
+                return None
+        
+        return config['installed']
+
+    def _build_project_requests(self, sheet_id: int, sheet_name: str, top_template: dict,
+                                section_template: dict, sections: List[str]) -> List[dict]:
+        """
+        Формирует все запросы batchUpdate для заполнения листа проекта.
+        
+        Разделы собираются в памяти из шаблона секции: плейсхолдер {sectionName}
+        заменяется названием раздела, ссылки в формулах сдвигаются на смещение раздела,
+        объединения ячеек и правила условного форматирования переносятся с тем же смещением.
+        
+        Args:
+            sheet_id: ID листа, скопированного из шаблона верхней части
+            sheet_name: Итоговое имя листа
+            top_template: Разобранный шаблон верхней части
+            section_template: Разобранный шаблон секции
+            sections: Список разделов (включая "Прочее")
+            
+        Returns:
+            List[dict]: Запросы для одного вызова batchUpdate
+        """
+        section_rows = section_template['rows'][:section_template['row_count']]
+        section_height = len(section_rows)
+        # Первая строка для разделов (нумерация с 1), как и раньше по столбцу A шаблона
+        start_row = top_template['column_a_rows'] + 1 if top_template['column_a_rows'] else 4
+        last_row = start_row - 1 + section_height * len(sections)
+
+        # Переименование и, при необходимости, расширение сетки листа
+        grid = top_template['grid_properties']
+        properties = {'sheetId': sheet_id, 'title': sheet_name}
+        fields = ['title']
+        grid_update = {}
+        if last_row > grid.get('rowCount', 1000):
+            grid_update['rowCount'] = last_row
+            fields.append('gridProperties.rowCount')
+        if SECTION_COLUMNS > grid.get('columnCount', 26):
+            grid_update['columnCount'] = SECTION_COLUMNS
+            fields.append('gridProperties.columnCount')
+        if grid_update:
+            properties['gridProperties'] = grid_update
+
+        requests = [{
+            'updateSheetProperties': {
+                'properties': properties,
+                'fields': ','.join(fields)
+            }
+        }]
+
+        formula_parts = []
+        current_row = start_row
+        # Правила разделов добавляются после правил, скопированных с шаблоном верхней части
+        rule_index = top_template.get('conditional_format_count', 0)
+        for index, section in enumerate(sections):
+            with stage("render_section", section=index):
+                formula_parts.append(f'E{current_row}')
+                offset = current_row - 1
+                rows = [
+                    {'values': [_render_cell(cell, section, offset) for cell in row]}
+                    for row in section_rows
+                ]
+                logger.info(f"Rendered section {index+1}/{len(sections)}: {section} at row {current_row}")
+
+                if rows:
+                    requests.append({
+                        'updateCells': {
+                            'range': {
+                                'sheetId': sheet_id,
+                                'startRowIndex': offset,
+                                'endRowIndex': offset + section_height,
+                                'startColumnIndex': 0,
+                                'endColumnIndex': SECTION_COLUMNS
+                            },
+                            'rows': rows,
+                            'fields': SECTION_CELL_FIELDS
+                        }
+                    })
+
+                for merge in section_template['merges']:
+                    requests.append({
+                        'mergeCells': {
+                            'range': {
+                                'sheetId': sheet_id,
+                                'startRowIndex': merge['startRowIndex'] + offset,
+                                'endRowIndex': merge['endRowIndex'] + offset,
+                                'startColumnIndex': merge['startColumnIndex'],
+                                'endColumnIndex': merge['endColumnIndex']
+                            },
+                            'mergeType': 'MERGE_ALL'
+                        }
+                    })
+
+                for rule in section_template.get('conditional_formats', []):
+                    requests.append({
+                        'addConditionalFormatRule': {
+                            'rule': _shift_conditional_format(rule, sheet_id, offset),
+                            'index': rule_index
+                        }
+                    })
+                    rule_index += 1
+
+            current_row += section_height
+
+        # Формула суммы в ячейке E2
+        formula = '=' + '+'.join(formula_parts)
+        logger.info(f"Creating formula for sum: {formula}")
+        requests.append({
+            'updateCells': {
+                'range': {
+                    'sheetId': sheet_id,
+                    'startRowIndex': 1,
+                    'endRowIndex': 2,
+                    'startColumnIndex': 4,
+                    'endColumnIndex': 5
+                },
+                'rows': [{
+                    'values': [{
+                        'userEnteredValue': {
+                            'formulaValue': formula
+                        }
+                    }]
+                }],
+                'fields': 'userEnteredValue'
+            }
+        })
+
+        return requests
+
+    def create_project_sheet_with_retry(self, project_name: str, sections: List[str],
+                                        trace: Optional[SheetsTrace] = None) -> Optional[str]:
+        """
+        Создает лист проекта и записывает трассировку создания: время этапов и вызовов API,
+        их размер и статус. Сводка пишется в лог, трассировка целиком - в SHEETS_TRACE_DIR.
+        
+        Args:
+            project_name: Название проекта
+            sections: Список разделов проекта
+            trace: Трассировка, которую нужно заполнить (по умолчанию создается новая)
+            
+        Returns:
+            Optional[str]: URL созданного листа или None в случае ошибки
+        """
+        if trace is None:
+            trace = SheetsTrace("create_project_sheet", project=project_name, sections=len(sections))
+        with activate(trace):
+            url = self._create_project_sheet(project_name, sections)
+        trace.finish("ok" if url else "failed")
+        logger.info(f"Трассировка создания листа '{project_name}': {trace.summary_line()}",
+                    extra={"fields": {"sheets_trace": trace.summary()}})
+        try:
+            trace.export(SHEETS_TRACE_DIR)
+        except OSError as e:
+            logger.warning(f"Не удалось выгрузить трассировку {trace.trace_id}: {str(e)}")
+        return url
+
+    def _create_project_sheet(self, project_name: str, sections: List[str]) -> Optional[str]:
         """
         Создает новый лист проекта с заданными разделами на основе шаблонов.
         
+        Шаблоны берутся из кэша, все разделы собираются в памяти и записываются
+        одним вызовом batchUpdate, поэтому число запросов к API не зависит от количества разделов.
+        Временные ошибки API повторяются в _execute (запись - только при 429), здесь создание
+        повторяется целиком при конфликте имени листа и при ошибках 5xx: частично созданный
+        лист удаляется, повтор выполняется после задержки ограничителя.
+        
         Args:
             project_name: Название проекта
             sections: Список разделов проекта
@@ -472,11 +1251,13 @@ class GoogleSheetsAPI:
             Optional[str]: URL созданного листа или None в случае ошибки
         """
         max_retries = 3
-        retry_delay = 2  # секунды
         
         logger.info(f"Starting create_project_sheet_with_retry for project: {project_name} with sections: {sections}")
         
         for attempt in range(max_retries):
+            sheet_name = None
+            main_sheet_id = None
+            new_sheet_id = None
             try:
                 # Создаем словарь с данными проекта
                 project_data = {
@@ -486,326 +1267,90 @@ class GoogleSheetsAPI:
                 logger.info(f"Project data prepared: {json.dumps(project_data, ensure_ascii=False)}")
                 
                 # Загружаем конфигурацию
-                client_secrets_path = os.path.join('credentials', 'client_secrets.json')
-                logger.info(f"Loading configuration from: {client_secrets_path}")
-                if not os.path.exists(client_secrets_path):
-                    logger.error(f"Файл {client_secrets_path} не найден")
+                config = self._load_project_config()
+                if not config:
                     return None
-                    
-                with open(client_secrets_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                logger.info("Configuration loaded successfully")
                 
-                if 'installed' not in config:
-                    logger.error("В файле client_secrets.json нет раздела 'installed'")
-                    return None
-                    
-                # Проверяем наличие необходимых параметров
-                if 'main_sheet' not in config['installed']:
-                    logger.error("В файле client_secrets.json нет параметра 'main_sheet'")
-                    return None
-                    
-                if 'template_top' not in config['installed']:
-                    logger.error("В файле client_secrets.json нет параметра 'template_top'")
-                    return None
-                    
-                if 'template_section' not in config['installed']:
-                    logger.error("В файле client_secrets.json нет параметра 'template_section'")
-                    return None
+                main_sheet_id = config['main_sheet']
+                template_top_id = config['template_top']
+                template_section_id = config['template_section']
                 
-                main_sheet_id = config['installed']['main_sheet']
-                template_top_id = config['installed']['template_top']
-                template_section_id = config['installed']['template_section']
-                
-                # Получаем уникальное имя листа
-                sheet_name = self._get_unique_sheet_name(project_data['project_name'])
+                # Получаем уникальное имя листа и резервируем его до переименования
+                with stage("unique_name"):
+                    sheet_name = self._get_unique_sheet_name(project_data['project_name'], reserve=True)
                 logger.info(f"Generated unique sheet name: {sheet_name}")
                 
-                # Копируем шаблон верхней части в основную таблицу
-                logger.info(f"Getting template metadata from spreadsheet: {template_top_id}")
-                template_metadata = self.service.spreadsheets().get(
-                    spreadsheetId=template_top_id
-                ).execute()
-                source_sheet_id = template_metadata['sheets'][0]['properties']['sheetId']
-                logger.info(f"Source sheet ID: {source_sheet_id}")
+                # Берем шаблоны из кэша (структура, форматы, формулы и объединения)
+                with stage("templates"):
+                    top_template = self._get_template(template_top_id)
+                    section_template = self._get_template(template_section_id)
+                logger.info(f"Section template: {section_template['row_count']} rows, "
+                            f"{len(section_template['merges'])} merges")
                 
-                # Копируем лист с форматированием
-                request_body = {
-                    'destinationSpreadsheetId': main_sheet_id
-                }
+                # Копируем шаблон верхней части с форматированием
                 logger.info(f"Copying template to main spreadsheet: {main_sheet_id}")
-                
                 try:
-                    response = self.service.spreadsheets().sheets().copyTo(
-                        spreadsheetId=template_top_id,
-                        sheetId=source_sheet_id,
-                        body=request_body
-                    ).execute()
-                    logger.info(f"Template copied successfully: {response}")
-                    
+                    with stage("copy_template"):
+                        response = self._execute(self.service.spreadsheets().sheets().copyTo(
+                            spreadsheetId=template_top_id,
+                            sheetId=top_template['sheet_id'],
+                            body={'destinationSpreadsheetId': main_sheet_id}
+                        ))
                     new_sheet_id = response['sheetId']
+                    self.title_index.add(new_sheet_id, response.get('title', ''))
                     logger.info(f"New sheet ID: {new_sheet_id}")
                 except Exception as e:
                     logger.error(f"Error copying template: {str(e)}")
                     raise
                 
-                # Переименовываем лист
-                rename_request = {
-                    'requests': [{
-                        'updateSheetProperties': {
-                            'properties': {
-                                'sheetId': new_sheet_id,
-                                'title': sheet_name
-                            },
-                            'fields': 'title'
-                        }
-                    }]
-                }
-                
-                self.service.spreadsheets().batchUpdate(
-                    spreadsheetId=main_sheet_id,
-                    body=rename_request
-                ).execute()
-                
-                # Получаем текущее количество строк в шаблоне верхней части
-                top_values = self.read_values(template_top_id, 'A1:A')
-                current_row = len(top_values) + 1 if top_values else 4
-                
-                # Сохраняем начальную строку для формулы
-                formula_parts = []
-                
-                # Для каждой секции копируем шаблон и заменяем placeholder
-                all_sections = sections + ['Прочее']  # Добавляем секцию "Прочее" с заглавной буквы
+                # Добавляем секцию "Прочее" с заглавной буквы
+                all_sections = sections + ['Прочее']
                 logger.info(f"Processing sections: {all_sections}")
                 
-                # Обрабатываем все разделы
-                for index, section in enumerate(all_sections):
-                    logger.info(f"Processing section {index+1}/{len(all_sections)}: {section}")
-                    # Добавляем ссылку на ячейку с суммой для текущей секции
-                    formula_parts.append(f'E{current_row}')
-                    logger.info(f"Added formula part: E{current_row}")
-                    
-                    try:
-                        # Получаем данные из шаблона секции
-                        logger.info(f"Getting section template metadata from: {template_section_id}")
-                        section_metadata = self.service.spreadsheets().get(
-                            spreadsheetId=template_section_id
-                        ).execute()
-                        section_sheet_id = section_metadata['sheets'][0]['properties']['sheetId']
-                        logger.info(f"Section template sheet ID: {section_sheet_id}")
-                        
-                        # Копируем секцию во временный лист
-                        logger.info(f"Copying section template to main spreadsheet")
-                        temp_response = self.service.spreadsheets().sheets().copyTo(
-                            spreadsheetId=template_section_id,
-                            sheetId=section_sheet_id,
-                            body={'destinationSpreadsheetId': main_sheet_id}
-                        ).execute()
-                        logger.info(f"Section template copied successfully: {temp_response}")
-                        
-                        temp_sheet_id = temp_response['sheetId']
-                        temp_sheet_title = temp_response['title']
-                        logger.info(f"Temporary sheet created: ID={temp_sheet_id}, Title={temp_sheet_title}")
-                        
-                        # Продолжаем обработку всех разделов
-                        logger.info(f"Successfully processed section {index+1}/{len(all_sections)}: {section}")
-                    except Exception as e:
-                        logger.error(f"Error processing section {section}: {str(e)}")
-                        raise
-                    
-                    # Читаем данные из временного листа
-                    logger.info(f"Reading values from temporary sheet: {temp_sheet_title}!A1:J")
-                    section_values = self.read_values(main_sheet_id, f'{temp_sheet_title}!A1:J')
-                    logger.info(f"Read {len(section_values) if section_values else 0} rows from temporary sheet")
-                    
-                    if section_values:
-                        logger.info("Getting detailed cell information including formulas")
-                        # Получаем информацию о ячейках, включая формулы
-                        try:
-                            sheet_data = self.service.spreadsheets().get(
-                                spreadsheetId=main_sheet_id,
-                                ranges=[f'{temp_sheet_title}!A1:J'],
-                                includeGridData=True
-                            ).execute()
-                            logger.info("Successfully retrieved sheet data with grid data")
-                        except Exception as e:
-                            logger.error(f"Error getting sheet data: {str(e)}")
-                            raise
-                        
-                        try:
-                            grid_data = sheet_data['sheets'][0]['data'][0]['rowData']
-                            logger.info(f"Retrieved grid data with {len(grid_data)} rows")
-                            
-                            # Собираем обновления для текстовых ячеек
-                            requests = []
-                            logger.info("Starting to process cells for text replacements")
-                            
-                            # Проходим все строки
-                            for row_idx, row in enumerate(grid_data):
-                                if 'values' in row:
-                                    for col_idx, cell in enumerate(row['values']):
-                                        # Проверяем, что это текстовая ячейка без формулы
-                                        if ('userEnteredValue' in cell and 
-                                            'stringValue' in cell['userEnteredValue']):
-                                            cell_value = cell['userEnteredValue']['stringValue']
-                                            if '{sectionName}' in cell_value:
-                                                logger.info(f"Found cell with placeholder at row {row_idx+1}, col {col_idx+1}: {cell_value}")
-                                                
-                                                try:
-                                                    new_value = cell_value.replace('{sectionName}', section.title())
-                                                    logger.info(f"Replacing placeholder with '{section.title()}' at row {row_idx+1}, col {col_idx+1}")
-                                                    
-                                                    requests.append({
-                                                        'updateCells': {
-                                                            'range': {
-                                                                'sheetId': new_sheet_id,
-                                                                'startRowIndex': current_row - 1 + row_idx,
-                                                                'endRowIndex': current_row + row_idx,
-                                                                'startColumnIndex': col_idx,
-                                                                'endColumnIndex': col_idx + 1
-                                                            },
-                                                            'rows': [{
-                                                                'values': [{
-                                                                    'userEnteredValue': {
-                                                                        'stringValue': new_value
-                                                                    }
-                                                                }]
-                                                            }],
-                                                            'fields': 'userEnteredValue'
-                                                        }
-                                                    })
-                                                    logger.info(f"Added update request for cell at row {current_row - 1 + row_idx}, col {col_idx}")
-                                                except Exception as e:
-                                                    logger.error(f"Error creating update request: {str(e)}")
-                                                    raise
-                            
-                            logger.info(f"Total update requests created: {len(requests)}")
-                        except Exception as e:
-                            logger.error(f"Error processing grid data: {str(e)}")
-                            raise
-                        
-                        # Копируем секцию целиком
-                        copy_request = {
-                            'requests': [
-                                {
-                                    'copyPaste': {
-                                        'source': {
-                                            'sheetId': temp_sheet_id,
-                                            'startRowIndex': 0,
-                                            'endRowIndex': len(section_values),
-                                            'startColumnIndex': 0,
-                                            'endColumnIndex': 10  # Явно указываем 10 столбцов
-                                        },
-                                        'destination': {
-                                            'sheetId': new_sheet_id,
-                                            'startRowIndex': current_row - 1,
-                                            'endRowIndex': current_row - 1 + len(section_values),
-                                            'startColumnIndex': 0,
-                                            'endColumnIndex': 10  # Явно указываем 10 столбцов
-                                        },
-                                        'pasteType': 'PASTE_NORMAL'
-                                    }
-                                }
-                            ]
-                        }
-                        
-                        # Применяем копирование
-                        try:
-                            logger.info(f"Executing copy request for section {section}")
-                            copy_response = self.service.spreadsheets().batchUpdate(
-                                spreadsheetId=main_sheet_id,
-                                body=copy_request
-                            ).execute()
-                            logger.info(f"Copy request executed successfully: {copy_response}")
-                        except Exception as e:
-                            logger.error(f"Error executing copy request: {str(e)}")
-                            raise
-                        
-                        # Применяем обновления текстовых ячеек
-                        if requests:
-                            try:
-                                logger.info(f"Executing update request with {len(requests)} requests")
-                                update_request = {'requests': requests}
-                                update_response = self.service.spreadsheets().batchUpdate(
-                                    spreadsheetId=main_sheet_id,
-                                    body=update_request
-                                ).execute()
-                                logger.info(f"Update request executed successfully: {update_response}")
-                            except Exception as e:
-                                logger.error(f"Error executing update request: {str(e)}")
-                                raise
-                        
-                        # Обновляем текущую строку
-                        current_row += len(section_values)
-                    
-                    # Удаляем временный лист
-                    delete_request = {
-                        'requests': [{
-                            'deleteSheet': {
-                                'sheetId': temp_sheet_id
-                            }
-                        }]
-                    }
-                    
-                    try:
-                        logger.info(f"Deleting temporary sheet with ID: {temp_sheet_id}")
-                        delete_response = self.service.spreadsheets().batchUpdate(
-                            spreadsheetId=main_sheet_id,
-                            body=delete_request
-                        ).execute()
-                        logger.info(f"Temporary sheet deleted successfully: {delete_response}")
-                    except Exception as e:
-                        logger.error(f"Error deleting temporary sheet: {str(e)}")
-                        raise
+                with stage("build_requests", sections=len(all_sections)):
+                    requests = self._build_project_requests(
+                        new_sheet_id, sheet_name, top_template, section_template, all_sections
+                    )
                 
-                # Обновляем формулу суммы в ячейке E2
+                # Записываем весь лист одним запросом
                 try:
-                    formula = '=' + '+'.join(formula_parts)
-                    logger.info(f"Creating formula for sum: {formula}")
-                    formula_request = {
-                        'requests': [{
-                            'updateCells': {
-                                'range': {
-                                    'sheetId': new_sheet_id,
-                                    'startRowIndex': 1,
-                                    'endRowIndex': 2,
-                                    'startColumnIndex': 4,
-                                    'endColumnIndex': 5
-                                },
-                                'rows': [{
-                                    'values': [{
-                                        'userEnteredValue': {
-                                            'formulaValue': formula
-                                        }
-                                    }]
-                                }],
-                                'fields': 'userEnteredValue'
-                            }
-                        }]
-                    }
-                    
-                    logger.info("Executing formula update request")
-                    formula_response = self.service.spreadsheets().batchUpdate(
-                        spreadsheetId=main_sheet_id,
-                        body=formula_request
-                    ).execute()
-                    logger.info(f"Formula update executed successfully: {formula_response}")
+                    logger.info(f"Executing batch update with {len(requests)} requests")
+                    with stage("batch_update", sections=len(all_sections)):
+                        self._execute(self.service.spreadsheets().batchUpdate(
+                            spreadsheetId=main_sheet_id,
+                            body={'requests': requests}
+                        ))
+                    logger.info("Batch update executed successfully")
                 except Exception as e:
-                    logger.error(f"Error updating formula: {str(e)}")
+                    logger.error(f"Error executing batch update: {str(e)}")
                     raise
+                self.title_index.rename(new_sheet_id, sheet_name)
                 
                 logger.info(f"Создан лист проекта '{project_name}' с ID: {new_sheet_id}")
                 return f"https://docs.google.com/spreadsheets/d/{main_sheet_id}/edit#gid={new_sheet_id}"
                 
             except HttpError as e:
-                if e.resp.status == 503 and attempt < max_retries - 1:
-                    logger.warning(f"Попытка {attempt + 1} не удалась из-за недоступности сервиса. Ожидание {retry_delay} сек.")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
+                if sheet_name:
+                    self.title_index.release(sheet_name)
+                self._discard_sheet(main_sheet_id, new_sheet_id)
+                if e.resp.status == 400 and 'already exists' in str(e) and attempt < max_retries - 1:
+                    # Лист с таким именем появился в обход индекса: перечитываем индекс
+                    logger.warning(f"Лист '{sheet_name}' уже существует, индекс названий будет перечитан")
+                    self.title_index.invalidate()
+                    continue
+                if e.resp.status >= 500 and attempt < max_retries - 1:
+                    # Запись при 5xx не повторяется в _execute (изменение могло примениться),
+                    # поэтому после удаления копии создание повторяется целиком
+                    delay = self.rate_limiter.backoff(attempt, e)
+                    logger.warning(f"Sheets API вернул {e.resp.status} при создании листа '{project_name}', "
+                                   f"повтор {attempt + 2}/{max_retries} через {delay:.1f} сек.")
                     continue
                 logger.error(f"Ошибка HTTP при создании листа проекта: {str(e)}")
                 return None
             except Exception as e:
+                if sheet_name:
+                    self.title_index.release(sheet_name)
+                self._discard_sheet(main_sheet_id, new_sheet_id)
                 logger.error(f"Ошибка при создании листа проекта: {str(e)}")
                 return None
         
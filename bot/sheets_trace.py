@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+# Каталог для выгрузки трассировок создания листов в JSONL (пусто - не выгружать)
+SHEETS_TRACE_DIR = os.getenv('SHEETS_TRACE_DIR', '')
+
+# Имя файла трассировок в SHEETS_TRACE_DIR
+TRACE_FILE_NAME = 'sheets_traces.jsonl'
+
+# Трассировка, активная в текущем потоке (создание листа целиком идет в одном потоке пула)
+_current = threading.local()
+_export_lock = threading.Lock()
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+def payload_size(request) -> int:
+    """Возвращает размер тела подготовленного запроса googleapiclient в байтах"""
+    body = getattr(request, 'body', None)
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return 0
+
+def short_method(method: str) -> str:
+    """Сокращает имя метода API: sheets.spreadsheets.batchUpdate -> spreadsheets.batchUpdate"""
+    return method[len('sheets.'):] if method.startswith('sheets.') else method
+
+class SheetsTrace:
+    """
+    Трассировка одной операции с Google Sheets (например, создания листа проекта).
+
+    Состоит из этапов (stage) и вызовов API (call). Вызовы записывает
+    GoogleSheetsAPI._execute, когда трассировка активна в потоке; вызов получает
+    имя и атрибуты этапа, внутри которого выполнен (например, номер раздела).
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.status = None
+        self.total_ms = None
+        self.spans = []
+        self._started = time.perf_counter()
+        self._stage = None
+        self._lock = threading.Lock()
+
+    def _offset_ms(self, started: float) -> float:
+        return _ms(started - self._started)
+
+    def _add(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def stage(self, name: str, **attrs):
+        """
+        Измеряет этап операции. Вызовы API внутри этапа помечаются его именем и атрибутами.
+
+        Args:
+            name: Имя этапа (например, copy_template)
+            **attrs: Атрибуты этапа (например, section - номер раздела)
+        """
+        parent = self._stage
+        self._stage = {"stage": name, **attrs}
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except Exception as e:
+            status = error_status(e)
+            raise
+        finally:
+            self._stage = parent
+            self._add({
+                "type": "stage", "name": name, "start_ms": self._offset_ms(started),
+                "ms": _ms(time.perf_counter() - started), "status": status, **attrs
+            })
+
+    def record_call(self, method: str, started: float, payload_bytes: int, status: str) -> None:
+        """
+        Записывает вызов API
+
+        Args:
+            method: Имя метода API (methodId)
+            started: Время начала вызова по time.perf_counter()
+            payload_bytes: Размер тела запроса в байтах
+            status: ok, http_<код> или имя исключения
+        """
+        span = {
+            "type": "call", "name": short_method(str(method)), "start_ms": self._offset_ms(started),
+            "ms": _ms(time.perf_counter() - started), "payload_bytes": payload_bytes, "status": status
+        }
+        if self._stage:
+            span.update(self._stage)
+        self._add(span)
+
+    def finish(self, status: str) -> None:
+        """Завершает трассировку с итоговым статусом (ok, failed и т. п.)"""
+        self.status = status
+        self.total_ms = _ms(time.perf_counter() - self._started)
+
+    def summary(self) -> dict:
+        """
+        Возвращает сводку: общее время, число и время вызовов API, объем отправленных
+        данных, время по этапам и самый медленный вызов
+
+        Returns:
+            dict: Сводка трассировки
+        """
+        with self._lock:
+            spans = list(self.spans)
+        calls = [span for span in spans if span["type"] == "call"]
+        stages = {}
+        for span in spans:
+            # Этапы по разделам суммируются под общим именем
+            if span["type"] == "stage":
+                stages[span["name"]] = round(stages.get(span["name"], 0) + span["ms"], 1)
+        slowest = max(calls, key=lambda span: span["ms"], default=None)
+        total_ms = self.total_ms if self.total_ms is not None else self._offset_ms(time.perf_counter())
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "status": self.status,
+            "total_ms": total_ms,
+            "api_calls": len(calls),
+            "api_ms": round(sum(span["ms"] for span in calls), 1),
+            "payload_bytes": sum(span["payload_bytes"] for span in calls),
+            "stages": stages,
+            "slowest_call": {
+                key: slowest[key] for key in ("name", "ms", "stage") if key in slowest
+            } if slowest else None
+        }
+
+    def summary_line(self) -> str:
+        """Возвращает сводку одной строкой для лога"""
+        summary = self.summary()
+        line = (f"trace={summary['trace_id']} {summary['status'] or 'running'} {summary['total_ms']:.0f} мс, "
+                f"API: {summary['api_calls']} вызовов {summary['api_ms']:.0f} мс "
+                f"{summary['payload_bytes'] / 1024:.1f} КБ")
+        if summary["stages"]:
+            line += "; " + ", ".join(f"{name} {ms:.0f} мс" for name, ms in summary["stages"].items())
+        slowest = summary["slowest_call"]
+        if slowest:
+            line += f"; медленнее всего {slowest['name']} {slowest['ms']:.0f} мс"
+        return line
+
+    def to_dict(self) -> dict:
+        """Возвращает трассировку целиком (сводка, атрибуты и все интервалы)"""
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            **self.summary(),
+            "started_at": round(self.started_at, 3),
+            "attrs": self.attrs,
+            "spans": sorted(spans, key=lambda span: span["start_ms"])
+        }
+
+    def export(self, directory: str = SHEETS_TRACE_DIR) -> Optional[str]:
+        """
+        Дописывает трассировку строкой JSON в файл sheets_traces.jsonl
+
+        Args:
+            directory: Каталог для файла (пусто - не выгружать)
+
+        Returns:
+            Optional[str]: Путь к файлу или None, если выгрузка отключена
+        """
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, TRACE_FILE_NAME)
+        line = json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':'), default=str)
+        with _export_lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        return path
+
+def error_status(error: Exception) -> str:
+    """Возвращает статус интервала для исключения: http_<код> для ошибок API"""
+    resp = getattr(error, 'resp', None)
+    status = getattr(resp, 'status', None)
+    return f"http_{status}" if status else type(error).__name__
+
+def current_trace() -> Optional[SheetsTrace]:
+    """Возвращает трассировку, активную в текущем потоке"""
+    return getattr(_current, 'trace', None)
+
+@contextmanager
+def activate(trace: Optional[SheetsTrace]):
+    """Делает трассировку активной в текущем потоке на время блока"""
+    previous = current_trace()
+    _current.trace = trace
+    try:
+        yield trace
+    finally:
+        _current.trace = previous
+
+@contextmanager
+def stage(name: str, **attrs):
+    """Этап активной трассировки; без трассировки ничего не делает"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name, **attrs):
+        yield
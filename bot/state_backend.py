@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Где хранить состояние бота (историю чатов, контекст пользователей): memory или sqlite
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'data/bot_state.db')
+
+# Сколько ждать блокировки базы другим процессом, в секундах
+STATE_DB_BUSY_TIMEOUT = float(os.getenv('STATE_DB_BUSY_TIMEOUT', '5'))
+
+# Допуск на погрешность вычислений с плавающей точкой при пополнении bucket
+_TOKEN_EPSILON = 1e-9
+
+class StateBackend:
+    """
+    Хранилище состояния "ключ - значение" по пространствам имен.
+
+    Значения - JSON-совместимые объекты. Вместе со значением хранится версия
+    (время записи), по которой кэши в памяти узнают об изменениях из других процессов.
+    Базовый класс ничего не хранит и используется, когда сохранение отключено.
+    """
+
+    # Сохраняет ли хранилище данные за пределами процесса
+    persistent = False
+
+    def get(self, namespace: str, key: str) -> Tuple[Optional[Any], float]:
+        """
+        Возвращает значение и его версию
+
+        Args:
+            namespace: Пространство имен
+            key: Ключ
+
+        Returns:
+            Tuple[Optional[Any], float]: Значение (None, если его нет) и версия (0.0, если нет)
+        """
+        return None, 0.0
+
+    def version(self, namespace: str, key: str) -> float:
+        """Возвращает версию значения (0.0, если значения нет)"""
+        return 0.0
+
+    def put_many(self, records: Iterable[Tuple[str, str, Optional[Any]]]) -> float:
+        """
+        Записывает пачку значений одной транзакцией
+
+        Args:
+            records: Тройки (пространство имен, ключ, значение); значение None удаляет ключ
+
+        Returns:
+            float: Версия, присвоенная записанным значениям
+        """
+        return time.time()
+
+    def claim(self, namespace: str, key: str, owner: str, ttl: float) -> bool:
+        """
+        Атомарно занимает ключ на ttl секунд (аренда). Свободным считается ключ без
+        аренды, с истекшей арендой или уже занятый тем же владельцем.
+
+        Args:
+            namespace: Пространство имен
+            key: Ключ
+            owner: Идентификатор владельца (например, PID воркера)
+            ttl: Срок аренды в секундах
+
+        Returns:
+            bool: True, если ключ занят этим владельцем
+        """
+        return True
+
+    def release(self, namespace: str, key: str, owner: str) -> None:
+        """Освобождает аренду ключа, если она принадлежит владельцу"""
+
+    def take_token(self, namespace: str, key: str, capacity: float, rate: float) -> float:
+        """
+        Атомарно забирает токен из общего token bucket (capacity токенов,
+        пополнение rate токенов в секунду), чтобы квоту делили все процессы
+
+        Args:
+            namespace: Пространство имен
+            key: Ключ bucket
+            capacity: Емкость bucket
+            rate: Скорость пополнения в токенах в секунду
+
+        Returns:
+            float: 0.0, если токен забран, иначе сколько секунд ждать следующего токена
+        """
+        return 0.0
+
+    def close(self) -> None:
+        """Закрывает хранилище"""
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Хранилище состояния в SQLite в режиме WAL.
+
+    WAL позволяет нескольким процессам читать базу одновременно с записью,
+    поэтому один файл можно использовать из нескольких воркеров uvicorn.
+    Аренды ключей хранятся в отдельной таблице и служат межпроцессными блокировками,
+    общие token bucket (квоты внешних API на все воркеры) - в таблице buckets.
+    Соединение общее для потоков и защищено блокировкой.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=STATE_DB_BUSY_TIMEOUT, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL NORMAL не теряет целостность, только последние транзакции при сбое питания
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, version REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, tokens REAL NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._claims = 0
+        logger.info(f"Хранилище состояния SQLite открыто: {path}")
+
+    def get(self, namespace: str, key: str) -> Tuple[Optional[Any], float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, version FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None, 0.0
+        return json.loads(row[0]), row[1]
+
+    def version(self, namespace: str, key: str) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return row[0] if row else 0.0
+
+    def put_many(self, records: Iterable[Tuple[str, str, Optional[Any]]]) -> float:
+        version = time.time()
+        upserts = []
+        deletes = []
+        for namespace, key, value in records:
+            if value is None:
+                deletes.append((namespace, key))
+            else:
+                upserts.append((namespace, key, json.dumps(value, ensure_ascii=False), version))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT INTO state (namespace, key, value, version) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, version = excluded.version",
+                        upserts
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return version
+
+    def claim(self, namespace: str, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._claims += 1
+                if self._claims % 1000 == 0:
+                    # Время от времени удаляем истекшие аренды, чтобы таблица не росла
+                    self._conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+                cursor = self._conn.execute(
+                    "INSERT INTO leases (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (namespace, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+                    (namespace, key, owner, now + ttl, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def release(self, namespace: str, key: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM leases WHERE namespace = ? AND key = ? AND owner = ?", (namespace, key, owner)
+            )
+
+    def take_token(self, namespace: str, key: str, capacity: float, rate: float) -> float:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                if tokens >= 1 - _TOKEN_EPSILON:
+                    tokens = max(0.0, tokens - 1)
+                    delay = 0.0
+                else:
+                    delay = (1 - tokens) / rate
+                self._conn.execute(
+                    "INSERT INTO buckets (namespace, key, tokens, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (namespace, key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (namespace, key, tokens, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return delay
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def create_state_backend(kind: str = STATE_BACKEND, path: str = STATE_DB_PATH) -> StateBackend:
+    """
+    Создает хранилище состояния по настройке STATE_BACKEND
+
+    Args:
+        kind: "sqlite" или "memory"
+        path: Путь к файлу базы SQLite
+
+    Returns:
+        StateBackend: Хранилище состояния
+
+    Raises:
+        ValueError: Если тип хранилища неизвестен
+    """
+    if kind == 'sqlite':
+        return SQLiteStateBackend(path)
+    if kind == 'memory':
+        return StateBackend()
+    raise ValueError(f"Неизвестный тип хранилища состояния: {kind}")
+
+class StateMap:
+    """
+    Словарь, который сразу записывает изменения в хранилище состояния.
+
+    Подходит для редко меняющегося состояния (например, ожидание подтверждения),
+    где пакетная запись не нужна. Чтение всегда идет в хранилище, поэтому изменения
+    из других процессов видны сразу; без хранилища значения живут в памяти.
+    """
+
+    def __init__(self, namespace: str, backend: Optional[StateBackend] = None):
+        self.namespace = namespace
+        self.backend = backend or StateBackend()
+        self._local = {}
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if not self.backend.persistent:
+            return self._local.get(key, default)
+        value, _ = self.backend.get(self.namespace, str(key))
+        return default if value is None else value
+
+    def __getitem__(self, key: Any) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if self.backend.persistent:
+            self.backend.put_many([(self.namespace, str(key), value)])
+        else:
+            self._local[key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        if self.backend.persistent:
+            self.backend.put_many([(self.namespace, str(key), None)])
+        else:
+            del self._local[key]
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key) is not None
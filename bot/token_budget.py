@@ -0,0 +1,133 @@
+import os
+import re
+from typing import List, Tuple
+
+# Бюджет токенов на историю чата в запросе к OpenAI (без системного сообщения)
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+
+# Сжимать ли не поместившиеся сообщения в одну системную заметку и ее размер в токенах
+CHAT_HISTORY_SUMMARY = os.getenv('CHAT_HISTORY_SUMMARY', '0') == '1'
+CHAT_HISTORY_SUMMARY_TOKENS = int(os.getenv('CHAT_HISTORY_SUMMARY_TOKENS', '200'))
+
+# Служебные токены формата чата OpenAI на каждое сообщение (роль и разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_PIECE_PATTERN = re.compile(r'\w+|[^\w\s]')
+_SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?…])\s')
+
+def estimate_tokens(text: str) -> int:
+    """
+    Быстро оценивает число токенов текста без токенизатора.
+
+    Знаки препинания считаются отдельными токенами, слово латиницей - примерно
+    токен на 4 символа, кириллицей и другими алфавитами - на 3 символа.
+    Для gpt-4o оценка обычно немного завышена, что безопасно для бюджета.
+
+    Args:
+        text: Текст
+
+    Returns:
+        int: Оценка числа токенов
+    """
+    tokens = 0
+    for piece in _PIECE_PATTERN.findall(text):
+        per_token = 4 if piece.isascii() else 3
+        tokens += (len(piece) + per_token - 1) // per_token
+    return tokens
+
+def message_tokens(message: dict) -> int:
+    """Оценивает число токенов сообщения чата вместе со служебными"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Обрезает текст так, чтобы его оценка не превышала max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Не больше 4 символов на токен; дальше укорачиваем до попадания в бюджет
+    text = text[:max(max_tokens, 0) * 4]
+    while text and estimate_tokens(text + "…") > max_tokens:
+        text = text[:int(len(text) * 0.9)]
+    return text + "…" if text else ""
+
+def trim_history(history: List[dict], budget: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Оставляет самые новые сообщения, помещающиеся в бюджет токенов.
+
+    Последнее сообщение сохраняется всегда; если оно само больше бюджета,
+    его текст обрезается.
+
+    Args:
+        history: Сообщения от старых к новым
+        budget: Бюджет токенов
+
+    Returns:
+        Tuple[List[dict], List[dict]]: Оставленные и отброшенные сообщения
+    """
+    if not history:
+        return [], []
+    kept = []
+    used = 0
+    for message in reversed(history):
+        tokens = message_tokens(message)
+        if used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    if not kept:
+        last = history[-1]
+        content = _truncate(last["content"], budget - MESSAGE_OVERHEAD_TOKENS)
+        kept.append({"role": last["role"], "content": content})
+    kept.reverse()
+    return kept, history[:len(history) - len(kept)]
+
+def summarize_history(messages: List[dict], max_tokens: int = CHAT_HISTORY_SUMMARY_TOKENS) -> dict:
+    """
+    Сжимает отброшенные сообщения в одну системную заметку без обращения к модели:
+    от каждой реплики остается первое предложение, самые новые реплики важнее.
+
+    Args:
+        messages: Отброшенные сообщения от старых к новым
+        max_tokens: Бюджет токенов заметки
+
+    Returns:
+        dict: Системное сообщение с кратким содержанием
+    """
+    header = "Кратко о предыдущей части разговора:"
+    lines = []
+    used = estimate_tokens(header) + MESSAGE_OVERHEAD_TOKENS
+    for message in reversed(messages):
+        author = "Пользователь" if message["role"] == "user" else "Ассистент"
+        first_sentence = _SENTENCE_END_PATTERN.split(message["content"].strip(), 1)[0]
+        remaining = max_tokens - used
+        if remaining < 8:
+            break
+        # Одна реплика занимает не больше 40 токенов, чтобы в заметку попало несколько
+        line = _truncate(f"- {author}: {first_sentence}", min(40, remaining))
+        tokens = estimate_tokens(line)
+        lines.append(line)
+        used += tokens
+    lines.reverse()
+    return {"role": "system", "content": "\n".join([header] + lines)}
+
+def fit_history(history: List[dict], budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+                summarize: bool = CHAT_HISTORY_SUMMARY,
+                summary_tokens: int = CHAT_HISTORY_SUMMARY_TOKENS) -> Tuple[List[dict], int]:
+    """
+    Укладывает историю чата в бюджет токенов
+
+    Args:
+        history: Сообщения от старых к новым
+        budget: Бюджет токенов на историю вместе с заметкой
+        summarize: Добавлять ли заметку о не поместившихся сообщениях
+        summary_tokens: Бюджет токенов заметки (входит в общий бюджет)
+
+    Returns:
+        Tuple[List[dict], int]: Сообщения для запроса и число отброшенных сообщений
+    """
+    kept, dropped = trim_history(history, budget)
+    if not (summarize and dropped):
+        return kept, len(dropped)
+    # Освобождаем место под заметку, отбрасывая старейшие из оставленных сообщений
+    kept, more_dropped = trim_history(kept, max(budget - summary_tokens, 0))
+    dropped = dropped + more_dropped
+    return [summarize_history(dropped, summary_tokens)] + kept, len(dropped)
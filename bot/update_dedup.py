@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних update_id помнить и сколько секунд считать повтор дубликатом
+UPDATE_DEDUP_SIZE = int(os.getenv('UPDATE_DEDUP_SIZE', '10000'))
+UPDATE_DEDUP_WINDOW = float(os.getenv('UPDATE_DEDUP_WINDOW', '3600'))
+
+class UpdateDeduplicator:
+    """
+    Окно дедупликации обновлений Telegram по update_id.
+
+    Telegram повторно доставляет обновление, если webhook ответил медленно или
+    с ошибкой. Хранит не более max_size последних update_id (LRU) не дольше window секунд.
+
+    При нескольких воркерах повтор может прийти в другой процесс, поэтому с общим
+    хранилищем состояния обновление дополнительно занимается арендой на window секунд.
+    """
+
+    def __init__(self, max_size: int = UPDATE_DEDUP_SIZE, window: float = UPDATE_DEDUP_WINDOW,
+                 backend: Optional[StateBackend] = None, owner: str = ""):
+        self.max_size = max_size
+        self.window = window
+        self.backend = backend or StateBackend()
+        self.owner = owner or str(os.getpid())
+        self._seen = OrderedDict()  # update_id -> время первого получения
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def _expire(self, now: float) -> None:
+        # Записи упорядочены по времени получения, устаревшие всегда в начале
+        while self._seen:
+            update_id, received_at = next(iter(self._seen.items()))
+            if now - received_at < self.window:
+                break
+            self._seen.popitem(last=False)
+
+    async def check(self, update_id: int) -> bool:
+        """
+        Проверяет, встречалось ли обновление, и запоминает его
+
+        Аренда в общем хранилище (SQLite: BEGIN IMMEDIATE с busy_timeout) занимается
+        в пуле потоков, чтобы не задерживать цикл событий.
+
+        Args:
+            update_id: ID обновления Telegram
+
+        Returns:
+            bool: True, если это повторная доставка
+        """
+        now = time.monotonic()
+        self._expire(now)
+        if update_id in self._seen:
+            self.hits += 1
+            logger.info(f"Обновление {update_id} уже обработано, повторная доставка пропущена")
+            return True
+        # Запоминаем до ожидания хранилища, чтобы параллельный повтор в этом
+        # воркере не прошел проверку, пока аренда еще занимается
+        self._seen[update_id] = now
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        if not await self._claim(update_id):
+            # Обновление принадлежит другому воркеру: если тот его забудет после
+            # ошибки, следующая доставка сюда должна быть обработана
+            self._seen.pop(update_id, None)
+            self.hits += 1
+            self.shared_hits += 1
+            logger.info(f"Обновление {update_id} принято другим воркером, повторная доставка пропущена")
+            return True
+        self.misses += 1
+        return False
+
+    async def forget(self, update_id: int) -> None:
+        """
+        Забывает обновление, чтобы его повторная доставка была обработана
+
+        Args:
+            update_id: ID обновления, обработка которого не удалась
+        """
+        self._seen.pop(update_id, None)
+        if not self.backend.persistent:
+            return
+        try:
+            await asyncio.to_thread(self.backend.release, "update", str(update_id), self.owner)
+        except Exception as e:
+            logger.error(f"Не удалось освободить обновление {update_id} в общем хранилище: {str(e)}")
+
+    async def _claim(self, update_id: int) -> bool:
+        if not self.backend.persistent:
+            return True
+        try:
+            return await asyncio.to_thread(self.backend.claim, "update", str(update_id), self.owner, self.window)
+        except Exception as e:
+            # Без общего хранилища лучше обработать возможный дубль, чем потерять обновление
+            logger.error(f"Не удалось проверить обновление {update_id} в общем хранилище: {str(e)}")
+            return True
+
+    def stats(self) -> dict:
+        """Возвращает метрики дедупликации"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._seen),
+            "max_size": self.max_size,
+            "window_seconds": self.window,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
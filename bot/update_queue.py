@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Режим приема webhook: 1 - подтверждать сразу и обрабатывать обновления в фоне
+WEBHOOK_INGEST_MODE = os.getenv('WEBHOOK_INGEST_MODE', '0') == '1'
+
+# Число обработчиков обновлений и максимальное число ожидающих обновлений
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '4'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+
+# Сколько секунд при остановке ждать обработки оставшихся обновлений
+UPDATE_DRAIN_TIMEOUT = float(os.getenv('UPDATE_DRAIN_TIMEOUT', '30'))
+
+class UpdateQueue:
+    """
+    Очередь входящих обновлений Telegram с пулом обработчиков.
+
+    Обновления одного чата всегда попадают к одному обработчику, поэтому
+    сообщения пользователя обрабатываются по порядку, а разные чаты - параллельно.
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable[None]],
+                 workers: int = UPDATE_WORKERS,
+                 max_size: int = UPDATE_QUEUE_SIZE):
+        """
+        Args:
+            handler: Корутина, обрабатывающая обновление
+            workers: Число обработчиков
+            max_size: Максимальное число ожидающих обновлений
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self._queues: List[asyncio.Queue] = []
+        self._tasks = []
+        self._accepting = False
+
+        self.in_progress = 0
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_wait = 0.0
+
+    async def start(self) -> None:
+        """Запускает обработчики"""
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"update-worker-{index}")
+            for index in range(self.workers)
+        ]
+        self._accepting = True
+        logger.info(f"Очередь обновлений запущена: {self.workers} обработчиков, размер {self.max_size}")
+
+    async def stop(self, timeout: float = UPDATE_DRAIN_TIMEOUT) -> None:
+        """
+        Перестает принимать обновления, дожидается обработки принятых и останавливает обработчики
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        self._accepting = False
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь обновлений не опустела за {timeout} сек., осталось {self.depth()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Очередь обновлений остановлена")
+
+    def depth(self) -> int:
+        """Число обновлений, ожидающих обработки"""
+        return sum(queue.qsize() for queue in self._queues)
+
+    def submit(self, update: dict, chat_id: Optional[int] = None) -> bool:
+        """
+        Ставит обновление в очередь без ожидания
+
+        Args:
+            update: Обновление Telegram
+            chat_id: ID чата для сохранения порядка сообщений (None - любой обработчик)
+
+        Returns:
+            bool: True, если обновление принято, False - если очередь заполнена или остановлена
+        """
+        if not self._accepting or self.depth() >= self.max_size:
+            self.rejected += 1
+            logger.warning(f"Обновление {update.get('update_id')} отклонено: очередь заполнена или остановлена")
+            return False
+        key = chat_id if chat_id is not None else update.get('update_id', 0)
+        self._queues[hash(key) % self.workers].put_nowait((time.monotonic(), update))
+        self.accepted += 1
+        return True
+
+    async def _worker(self, index: int) -> None:
+        queue = self._queues[index]
+        while True:
+            enqueued_at, update = await queue.get()
+            self.in_progress += 1
+            self.max_wait = max(self.max_wait, time.monotonic() - enqueued_at)
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {str(e)}")
+            finally:
+                self.in_progress -= 1
+                queue.task_done()
+
+    def stats(self) -> dict:
+        """Возвращает метрики очереди"""
+        return {
+            "depth": self.depth(),
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "in_progress": self.in_progress,
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_wait_seconds": round(self.max_wait, 3)
+        }
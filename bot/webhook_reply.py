@@ -0,0 +1,79 @@
+import os
+import time
+import logging
+from contextvars import ContextVar, Token
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд после получения webhook ответ еще можно вернуть в теле ответа.
+# Более медленные ответы отправляются отдельным запросом sendMessage
+TELEGRAM_INLINE_REPLY_WINDOW = float(os.getenv('TELEGRAM_INLINE_REPLY_WINDOW', '2.0'))
+
+# Слот ответа текущего webhook-запроса. Задачи, созданные во время обработки,
+# наследуют контекст, поэтому слот закрывается явно при формировании ответа
+_reply_slot: ContextVar[Optional[dict]] = ContextVar('webhook_reply_slot', default=None)
+
+def open_reply_slot(window: float = TELEGRAM_INLINE_REPLY_WINDOW) -> Tuple[dict, Token]:
+    """
+    Открывает слот для ответа в теле webhook-ответа
+
+    Args:
+        window: Время в секундах, в течение которого слот принимает ответ
+
+    Returns:
+        Tuple[dict, Token]: Слот и токен для close_reply_slot
+    """
+    slot = {
+        "deadline": time.monotonic() + window,
+        "payload": None,
+        "closed": False
+    }
+    return slot, _reply_slot.set(slot)
+
+def take_reply_slot(method: str, params: dict) -> bool:
+    """
+    Пытается вернуть вызов метода Bot API в теле webhook-ответа
+
+    Args:
+        method: Метод Bot API, например sendMessage
+        params: Параметры метода
+
+    Returns:
+        bool: True, если вызов помещен в слот и отправлять его не нужно
+    """
+    slot = _reply_slot.get()
+    if slot is None or slot["closed"] or slot["payload"] is not None:
+        return False
+    if time.monotonic() > slot["deadline"]:
+        return False
+    slot["payload"] = {"method": method, **params}
+    return True
+
+def pop_held_reply() -> Optional[dict]:
+    """
+    Забирает отложенный в слоте ответ, чтобы отправить его раньше следующего
+
+    Returns:
+        Optional[dict]: Вызов метода из слота или None
+    """
+    slot = _reply_slot.get()
+    if slot is None or slot["closed"] or slot["payload"] is None:
+        return None
+    payload, slot["payload"] = slot["payload"], None
+    return payload
+
+def close_reply_slot(slot: dict, token: Token) -> Optional[dict]:
+    """
+    Закрывает слот и возвращает вызов метода для тела webhook-ответа
+
+    Args:
+        slot: Слот из open_reply_slot
+        token: Токен из open_reply_slot
+
+    Returns:
+        Optional[dict]: Вызов метода ({"method": ..., ...}) или None
+    """
+    slot["closed"] = True
+    _reply_slot.reset(token)
+    return slot["payload"]
@@ -0,0 +1,24 @@
+"""
+Конфигурация gunicorn с воркерами uvicorn.
+
+Запуск: gunicorn -c gunicorn.conf.py app:app
+Число воркеров задается WEB_CONCURRENCY (auto - по числу ядер). При нескольких
+воркерах состояние (история чатов, дедупликация, аренда чатов, квоты Google Sheets
+и лимит заданий на таблицу) делится через SQLite, поэтому нужно STATE_BACKEND=sqlite.
+"""
+import os
+import multiprocessing
+
+_workers = os.getenv('WEB_CONCURRENCY', '1')
+workers = multiprocessing.cpu_count() if _workers == 'auto' else int(_workers)
+
+# Воркеры наследуют окружение мастера: приложение узнает число воркеров из той же переменной
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Сколько ждать дообработки принятых обновлений при остановке воркера
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Микробенчмарк определения типа запроса: исходная цепочка проверок `in`
+(с прежним логированием каждого шага на уровне INFO и без него) против IntentMatcher.
+
+Перед замером проверяет, что оба варианта классифицируют корпус одинаково.
+
+Использование:
+    python scripts/bench_intent.py [--corpus messages.txt] [--repeat 2000]
+"""
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+
+# Добавляем родительскую директорию в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot.intent_matcher import IntentMatcher, CREATE_TABLE_KEYWORDS, HELP_KEYWORDS, QUESTION_MARKERS
+
+# Типичные сообщения боту: команды, вопросы, болтовня, длинные тексты
+DEFAULT_CORPUS = [
+    'Создай проект "Ремонт офиса" с разделами организация, материалы, работы',
+    "Создай проект Фестиваль ГТО с разделами аренда, судьи и звук",
+    "Нужна таблица для проекта День города, разделы: сцена, свет, звук",
+    "У нас новый проект Кожаный мяч 2027. Нужны будут флаги, сувенирка, шатры",
+    "Начинаем проект Марафон 2024, потребуются: регистрация, питание, медики",
+    "сделай таблицу к проекту выпускной",
+    "прект новогодний корпоратив, разделы: ведущий, банкет",
+    "Что ты умеешь?",
+    "какие у тебя есть команды",
+    "Что такое проект в твоем понимании?",
+    "Расскажи о таблицах Google",
+    "расскажи организуй таблицу",
+    "Привет! Как дела?",
+    "Сколько будет стоить аренда сцены на 500 человек в центре города летом?",
+    "Напиши, пожалуйста, поздравление для коллеги с днем рождения, он любит рыбалку и футбол",
+    "Спасибо, всё получилось",
+    "ок",
+    "Подскажи, как лучше организовать работу волонтеров на забеге: регистрация, "
+    "выдача стартовых пакетов, пункты питания, финиш, медицинская помощь и уборка территории после мероприятия",
+]
+
+# Логгер с обработчиком в памяти: форматирование и запись как в рабочем режиме, без диска
+bench_logger = logging.getLogger("bench_intent")
+bench_logger.propagate = False
+
+def legacy_intent(message: str, log: bool = False) -> str:
+    """Исходная реализация _determine_intent; log=True - с прежним логированием шагов"""
+    info = bench_logger.info if log else (lambda *args: None)
+    info(f"DEBUG: Определение типа запроса для сообщения: '{message}'")
+    message_lower = message.lower()
+    for keyword in CREATE_TABLE_KEYWORDS:
+        if keyword in message_lower:
+            info(f"DEBUG: Найдено ключевое слово для создания таблицы: '{keyword}'")
+            return "create_table"
+    if "таблиц" in message_lower and ("раздел" in message_lower or "секци" in message_lower):
+        info("DEBUG: Обнаружено упоминание таблицы и разделов")
+        return "create_table"
+    if "проект" in message_lower and ("раздел" in message_lower or "секци" in message_lower):
+        info("DEBUG: Обнаружено упоминание проекта и разделов")
+        return "create_table"
+    if ("прект" in message_lower or "праект" in message_lower) and "раздел" in message_lower:
+        info("DEBUG: Обнаружена опечатка в слове 'проект' с упоминанием разделов")
+        return "create_table"
+    for marker in QUESTION_MARKERS:
+        if marker in message_lower and ("проект" in message_lower or "таблиц" in message_lower):
+            info("DEBUG: Обнаружен вопрос о проекте или таблице, используем режим чата")
+            return "chat"
+    for keyword in HELP_KEYWORDS:
+        if keyword in message_lower:
+            info(f"DEBUG: Найдено ключевое слово для справки: '{keyword}'")
+            return "help"
+    info("DEBUG: Ключевые слова не найдены, используем режим чата")
+    return "chat"
+
+def measure(classify, corpus, repeat: int) -> float:
+    """Возвращает число сообщений в секунду"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in corpus:
+            classify(message)
+    return repeat * len(corpus) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк определения типа запроса")
+    parser.add_argument("--corpus", help="Файл с сообщениями, по одному в строке")
+    parser.add_argument("--repeat", type=int, default=2000, help="Число проходов по корпусу")
+    args = parser.parse_args()
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, 'r', encoding='utf-8') as f:
+            corpus = [line.strip() for line in f if line.strip()]
+
+    matcher = IntentMatcher()
+    mismatches = [m for m in corpus if legacy_intent(m) != matcher.classify(m)[0]]
+    if mismatches:
+        print("Результаты расходятся:")
+        for message in mismatches:
+            print(f"  {message!r}: {legacy_intent(message)} != {matcher.classify(message)}")
+        sys.exit(1)
+
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    bench_logger.addHandler(handler)
+    bench_logger.setLevel(logging.INFO)
+
+    logged = measure(lambda m: legacy_intent(m, log=True), corpus, args.repeat)
+    legacy = measure(legacy_intent, corpus, args.repeat)
+    matched = measure(lambda m: matcher.classify(m)[0], corpus, args.repeat)
+    print(f"Сообщений в корпусе: {len(corpus)}, проходов: {args.repeat}")
+    print(f"Цепочка проверок с логированием: {logged:12,.0f} сообщений/сек")
+    print(f"Цепочка проверок без логирования: {legacy:11,.0f} сообщений/сек")
+    print(f"IntentMatcher:                    {matched:12,.0f} сообщений/сек")
+    print(f"Ускорение относительно прежней реализации: {matched / logged:.2f}x")
+
+if __name__ == "__main__":
+    main()
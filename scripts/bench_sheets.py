@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Бенчмарк создания листа проекта на эмуляторе Google Sheets API без обращения к Google.
+
+Создает листы проектов с разным числом разделов через GoogleSheetsAPI, подключенный
+к SheetsEmulator с заданной задержкой вызовов и квотами, и выводит для каждого размера
+число вызовов API, объем запросов и время создания (p50/p95/max).
+
+Использование:
+    python scripts/bench_sheets.py [--sections 1,5,10,20,50] [--runs 5] [--latency 0.05]
+                                   [--cold] [--json results.json] [--max-calls 4]
+
+С --max-calls скрипт завершается с кодом 1, если создание листа потребовало больше
+вызовов API, чем указано (проверка регрессий в CI).
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+# Добавляем родительскую директорию в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot.metrics import percentile
+from bot.rate_limiter import SheetsRateLimiter
+from bot.sheets_api import GoogleSheetsAPI
+from scripts.sheets_emulator import SheetsEmulator, emulated_sheets_api
+from bot.sheets_trace import SheetsTrace
+
+def build_api(emulator: SheetsEmulator, workdir: str, limiter_quota: int) -> GoogleSheetsAPI:
+    """Создает GoogleSheetsAPI на эмуляторе (учетные данные записываются в workdir)"""
+    api = emulated_sheets_api(emulator, workdir)
+    # Ограничитель бота с квотой бенчмарка: по умолчанию он не тормозит, но повторяет 429
+    api.rate_limiter = SheetsRateLimiter(read_quota=limiter_quota, write_quota=limiter_quota,
+                                         burst=limiter_quota, backoff_base=0.05, backoff_max=1.0)
+    return api
+
+def bench_size(api: GoogleSheetsAPI, emulator: SheetsEmulator, sections: int, runs: int, cold: bool) -> dict:
+    """Создает runs листов с заданным числом разделов и возвращает сводку"""
+    timings = []
+    calls = []
+    payload = []
+    failures = 0
+    for run in range(runs):
+        if cold:
+            api.template_cache.invalidate()
+            api.title_index.invalidate()
+        emulator.reset_stats()
+        trace = SheetsTrace("bench", sections=sections)
+        started = time.perf_counter()
+        url = api.create_project_sheet_with_retry(f"Проект {sections}-{run}", [f"раздел {i + 1}" for i in range(sections)], trace)
+        timings.append((time.perf_counter() - started) * 1000)
+        calls.append(emulator.stats()['total_calls'])
+        payload.append(trace.summary()['payload_bytes'])
+        if not url:
+            failures += 1
+            continue
+        # Удаляем лист, чтобы основная таблица не росла от прогона к прогону
+        api.delete_sheet(api.spreadsheet_id, int(url.rsplit('gid=', 1)[1]))
+    return {
+        'sections': sections,
+        'runs': runs,
+        'failures': failures,
+        'calls': max(calls),
+        'payload_kb': round(max(payload) / 1024, 1),
+        'p50_ms': round(percentile(timings, 50), 1),
+        'p95_ms': round(percentile(timings, 95), 1),
+        'max_ms': round(max(timings), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк создания листа проекта на эмуляторе Google Sheets")
+    parser.add_argument("--sections", default="1,5,10,20,50", help="Числа разделов через запятую")
+    parser.add_argument("--runs", type=int, default=5, help="Созданий листа на каждый размер")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка вызова API, сек.")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Разброс задержки (доля от задержки)")
+    parser.add_argument("--per-kb-latency", type=float, default=0.002, help="Доп. задержка на КБ тела запроса, сек.")
+    parser.add_argument("--read-quota", type=int, help="Квота эмулятора на чтение, запросов в минуту")
+    parser.add_argument("--write-quota", type=int, help="Квота эмулятора на запись, запросов в минуту")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля случайных ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After в ответах 429, сек.")
+    parser.add_argument("--limiter-quota", type=int, default=100000, help="Квота ограничителя бота, запросов в минуту")
+    parser.add_argument("--cold", action="store_true", help="Сбрасывать кэш шаблонов и индекс названий перед каждым созданием")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно случайных задержек и ошибок")
+    parser.add_argument("--json", help="Записать результаты в JSON-файл")
+    parser.add_argument("--max-calls", type=int, help="Код выхода 1, если создание листа требует больше вызовов API")
+    parser.add_argument("--verbose", action="store_true", help="Не приглушать логи GoogleSheetsAPI")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        for name in ('bot.sheets_api', 'bot.rate_limiter'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    emulator = SheetsEmulator(latency=args.latency, jitter=args.jitter, per_kb_latency=args.per_kb_latency,
+                              read_quota=args.read_quota, write_quota=args.write_quota,
+                              error_rate=args.error_rate, retry_after=args.retry_after, seed=args.seed)
+    sizes = [int(value) for value in args.sections.split(',') if value.strip()]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        api = build_api(emulator, workdir, args.limiter_quota)
+        if not args.cold:
+            api.warm_template_cache()
+        started = time.perf_counter()
+        results = [bench_size(api, emulator, size, args.runs, args.cold) for size in sizes]
+        wall = time.perf_counter() - started
+        api.close()
+
+    print(f"Задержка вызова {args.latency * 1000:.0f} мс ±{args.jitter:.0%}, "
+          f"{args.per_kb_latency * 1000:.1f} мс/КБ, кэш шаблонов: {'холодный' if args.cold else 'теплый'}")
+    print(f"{'разделов':>8} {'вызовов':>8} {'КБ':>8} {'p50, мс':>9} {'p95, мс':>9} {'max, мс':>9} {'ошибок':>7}")
+    for result in results:
+        print(f"{result['sections']:>8} {result['calls']:>8} {result['payload_kb']:>8} {result['p50_ms']:>9} "
+              f"{result['p95_ms']:>9} {result['max_ms']:>9} {result['failures']:>7}")
+    print(f"Общее время: {wall:.2f} сек.")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'wall_seconds': round(wall, 3), 'results': results}, f,
+                      ensure_ascii=False, indent=2)
+
+    failed = [result for result in results if result['failures']]
+    too_many = [result for result in results if args.max_calls is not None and result['calls'] > args.max_calls]
+    if too_many:
+        print(f"Больше {args.max_calls} вызовов API: разделов {', '.join(str(r['sections']) for r in too_many)}")
+    if failed or too_many:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
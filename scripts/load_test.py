@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+"""
+Нагрузочный тест webhook бота: воспроизводит поток обновлений Telegram (сообщения чата,
+создание таблиц, справка, /start, правки сообщений, my_chat_member и повторные доставки)
+против app.py в том же процессе через httpx.ASGITransport.
+
+OpenAI, Telegram Bot API и Google Sheets заменены заглушками с настраиваемой задержкой:
+клиенты OpenAI и Telegram работают через httpx.MockTransport (ответы разбираются как
+настоящие), Google Sheets - через SheetsEmulator. Приложение запускается своим обработчиком
+startup, поэтому очереди, дедупликация, история и ограничители работают как в проде.
+
+Выводит пропускную способность (запросов в секунду), задержку webhook по типам
+обновлений (p50/p95/p99/max), задержку цикла событий и число вызовов заглушек.
+Задержка цикла измеряется в том же цикле, где работает генератор нагрузки, поэтому
+включает и его (небольшие) накладные расходы.
+
+Использование:
+    python scripts/load_test.py [--requests 2000] [--concurrency 50 | --rate 200]
+                                [--openai-latency 0.8] [--telegram-latency 0.05]
+                                [--sheets-latency 0.2] [--mix chat=45,create=15,...]
+                                [--env WEBHOOK_INGEST_MODE=1] [--json results.json]
+
+--rate задает открытую модель нагрузки (обновления приходят с заданной частотой независимо
+от ответов, задержка считается от запланированного времени отправки), без него
+--concurrency клиентов отправляют обновления друг за другом.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import itertools
+import tempfile
+
+# Добавляем родительскую директорию в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot.metrics import percentile
+
+# Доли типов обновлений в потоке по умолчанию
+DEFAULT_MIX = "chat=45,create=15,help=10,start=10,edit=10,member=5,duplicate=5"
+
+CHAT_MESSAGES = [
+    "Привет! Как дела?",
+    "Сколько будет стоить аренда сцены на 500 человек в центре города летом?",
+    "Напиши поздравление для коллеги с днем рождения, он любит рыбалку и футбол",
+    "Что такое проект в твоем понимании?",
+    "Подскажи, как лучше организовать работу волонтеров на забеге",
+    "Спасибо, всё получилось",
+    "Какие документы нужны для согласования уличного мероприятия?",
+    "ок",
+]
+
+CREATE_TABLE_MESSAGES = [
+    'Создай проект "Ремонт офиса" с разделами организация, материалы, работы',
+    "Создай проект Фестиваль ГТО с разделами аренда, судьи и звук",
+    "Нужна таблица для проекта День города, разделы: сцена, свет, звук",
+    "У нас новый проект Кожаный мяч. Нужны будут флаги, сувенирка, шатры",
+    "сделай таблицу к проекту выпускной, разделы: ведущий, банкет, фото",
+]
+
+HELP_MESSAGES = ["Что ты умеешь?", "какие у тебя есть команды", "помощь"]
+
+def parse_mix(value: str) -> dict:
+    """Разбирает доли типов обновлений вида chat=45,create=15"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in UpdateStream.KINDS:
+            raise argparse.ArgumentTypeError(f"Неизвестный тип обновления: {name}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+class Latency:
+    """Задержка заглушки: среднее значение с равномерным разбросом jitter (доля от среднего)"""
+
+    def __init__(self, mean: float, jitter: float, rng: random.Random):
+        self.mean = mean
+        self.jitter = jitter
+        self.rng = rng
+
+    def sample(self) -> float:
+        if not self.mean:
+            return 0.0
+        return max(0.0, self.mean * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+class UpdateStream:
+    """Генератор обновлений Telegram заданного состава для набора чатов"""
+
+    KINDS = ("chat", "create", "help", "start", "edit", "member", "duplicate")
+
+    def __init__(self, chats: int, mix: dict, rng: random.Random):
+        self.chats = chats
+        self.kinds = [kind for kind in mix if mix[kind] > 0]
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.rng = rng
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.recent = []
+
+    def _user(self, chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "from": self._user(chat_id),
+            "chat": {"id": chat_id, "type": "private"},
+            "date": int(time.time()),
+            "text": text
+        }
+
+    def next(self):
+        """Возвращает тип и тело очередного обновления"""
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == "duplicate" and not self.recent:
+            kind = "chat"
+        if kind == "duplicate":
+            # Telegram повторяет доставку, если не получил ответ вовремя
+            return kind, self.rng.choice(self.recent)
+        chat_id = 100000 + self.rng.randrange(self.chats)
+        body = {"update_id": next(self.update_ids)}
+        if kind == "chat":
+            body["message"] = self._message(chat_id, self.rng.choice(CHAT_MESSAGES))
+        elif kind == "create":
+            body["message"] = self._message(chat_id, self.rng.choice(CREATE_TABLE_MESSAGES))
+        elif kind == "help":
+            body["message"] = self._message(chat_id, self.rng.choice(HELP_MESSAGES))
+        elif kind == "start":
+            body["message"] = self._message(chat_id, "/start")
+        elif kind == "edit":
+            edited = self._message(chat_id, self.rng.choice(CHAT_MESSAGES) + " (исправлено)")
+            edited["edit_date"] = edited["date"]
+            body["edited_message"] = edited
+        else:
+            body["my_chat_member"] = {
+                "chat": {"id": -chat_id, "title": f"Группа {chat_id}", "type": "group"},
+                "from": self._user(chat_id),
+                "date": int(time.time()),
+                "old_chat_member": {"user": {"id": 1, "is_bot": True, "first_name": "Bot"}, "status": "left"},
+                "new_chat_member": {"user": {"id": 1, "is_bot": True, "first_name": "Bot"}, "status": "member"}
+            }
+        self.recent = (self.recent + [body])[-100:]
+        return kind, body
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-load-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 100, "total_tokens": 200}
+    }
+
+def _stream_body(content: str) -> bytes:
+    """Ответ OpenAI в формате server-sent events (stream=True)"""
+    pieces = [content[i:i + 40] for i in range(0, len(content), 40)]
+    events = []
+    for index, piece in enumerate(pieces + [None]):
+        chunk = {
+            "id": "chatcmpl-load-test",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "gpt-4o",
+            "choices": [{
+                "index": 0,
+                "delta": {"content": piece} if piece is not None else {},
+                "finish_reason": None if piece is not None else "stop"
+            }]
+        }
+        events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode('utf-8')
+
+def openai_stub(latency: Latency, reply_chars: int, counters: dict):
+    """Клиент AsyncOpenAI, запросы которого обрабатывает заглушка с задержкой"""
+    import httpx
+    from openai import AsyncOpenAI
+
+    reply = ("Это ответ заглушки OpenAI для нагрузочного теста. " * (reply_chars // 50 + 1))[:reply_chars]
+    project_ids = itertools.count(1)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        await asyncio.sleep(latency.sample())
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            counters["openai_extract"] += 1
+            content = json.dumps({"project_name": f"Нагрузка {next(project_ids)}",
+                                  "sections": ["звук", "свет", "сцена"]}, ensure_ascii=False)
+            return httpx.Response(200, json=_completion(content))
+        counters["openai_chat"] += 1
+        if payload.get("stream"):
+            return httpx.Response(200, content=_stream_body(reply), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=_completion(reply))
+
+    return AsyncOpenAI(api_key="load-test", base_url="http://openai.stub/v1", max_retries=0,
+                       http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+def telegram_stub(latency: Latency, counters: dict):
+    """Клиент Telegram Bot API, запросы которого обрабатывает заглушка с задержкой"""
+    import httpx
+
+    message_ids = itertools.count(1)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        method = request.url.path.rsplit('/', 1)[-1]
+        params = json.loads(request.content or b'{}')
+        await asyncio.sleep(latency.sample())
+        counters["telegram"][method] = counters["telegram"].get(method, 0) + 1
+        result = {
+            "message_id": params.get("message_id") or next(message_ids),
+            "chat": {"id": params.get("chat_id")},
+            "date": int(time.time()),
+            "text": params.get("text", "")
+        }
+        return httpx.Response(200, json={"ok": True, "result": result})
+
+    return httpx.AsyncClient(base_url="https://api.telegram.org/botload-test/",
+                             transport=httpx.MockTransport(handler))
+
+async def sample_loop_lag(interval: float, lags: list, stop: asyncio.Event) -> None:
+    """Измеряет, насколько позже заданного просыпается asyncio.sleep(interval)"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - started - interval))
+
+def _summary(values: list) -> dict:
+    """Перцентили задержек в миллисекундах"""
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(max(values, default=0.0) * 1000, 1)
+    }
+
+async def run(args) -> dict:
+    """Запускает приложение с заглушками, подает нагрузку и возвращает результаты"""
+    import httpx
+    import app as app_module
+    from bot.command_processor import CommandProcessor
+    from scripts.sheets_emulator import SheetsEmulator, emulated_sheets_api
+
+    level = getattr(logging, args.log_level)
+    for logger in [logging.getLogger()] + [
+        item for item in logging.root.manager.loggerDict.values() if isinstance(item, logging.Logger)
+    ]:
+        logger.setLevel(level)
+
+    rng = random.Random(args.seed)
+    counters = {"openai_chat": 0, "openai_extract": 0, "telegram": {}}
+    emulator = SheetsEmulator(latency=args.sheets_latency, jitter=0.3, seed=args.seed)
+    telegram_client = telegram_stub(Latency(args.telegram_latency, 0.5, rng), counters)
+    openai_client = openai_stub(Latency(args.openai_latency, 0.5, rng), args.reply_chars, counters)
+
+    workdir = tempfile.TemporaryDirectory()
+    original_processor = app_module.CommandProcessor
+    try:
+        sheets_api = emulated_sheets_api(emulator, workdir.name)
+        sheets_api.warm_template_cache()
+
+        def stubbed_processor() -> CommandProcessor:
+            # initialize() не создает клиенты, которые уже заданы
+            processor = original_processor()
+            processor.telegram_client = telegram_client
+            processor.openai_client = openai_client
+            processor.sheets_api = sheets_api
+            return processor
+
+        app_module.CommandProcessor = stubbed_processor
+        await app_module.startup_event()
+
+        headers = {}
+        if os.getenv("WEBHOOK_SECRET"):
+            headers["X-Telegram-Bot-Api-Secret-Token"] = os.getenv("WEBHOOK_SECRET")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app),
+                                   base_url="http://bot", headers=headers, timeout=None)
+        stream = UpdateStream(args.chats, args.mix, rng)
+        results = []
+        lags = []
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(sample_loop_lag(args.lag_interval, lags, stop))
+
+        async def send(kind: str, body: dict, scheduled: float) -> None:
+            try:
+                response = await client.post("/webhook", json=body)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            results.append((kind, status, time.perf_counter() - scheduled))
+
+        started = time.perf_counter()
+        if args.rate:
+            # Открытая модель: обновления отправляются по расписанию, не дожидаясь ответов
+            tasks = []
+            for index in range(args.requests):
+                delay = started + index / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                kind, body = stream.next()
+                tasks.append(asyncio.create_task(send(kind, body, started + index / args.rate)))
+            await asyncio.gather(*tasks)
+        else:
+            remaining = itertools.count()
+
+            async def worker() -> None:
+                while next(remaining) < args.requests:
+                    kind, body = stream.next()
+                    await send(kind, body, time.perf_counter())
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+        # Дожидаемся фоновой работы: очереди обновлений и создания таблиц
+        drain_started = time.perf_counter()
+        while time.perf_counter() - drain_started < args.drain_timeout:
+            stats = (await client.get("/stats")).json()
+            pending = sum(stats.get(name, {}).get("depth", 0) + stats.get(name, {}).get("in_progress", 0)
+                          for name in ("updates", "sheet_jobs"))
+            if not pending:
+                break
+            await asyncio.sleep(0.1)
+        drain = time.perf_counter() - drain_started
+        stats = (await client.get("/stats")).json()
+
+        stop.set()
+        await lag_task
+        await client.aclose()
+        await app_module.shutdown_event()
+    finally:
+        app_module.CommandProcessor = original_processor
+        workdir.cleanup()
+
+    by_kind = {}
+    statuses = {}
+    for kind, status, elapsed in results:
+        by_kind.setdefault(kind, []).append(elapsed)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(results),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(results) / wall, 1) if wall else 0.0,
+        "latency": _summary([elapsed for _, _, elapsed in results]),
+        "latency_by_kind": {kind: _summary(values) for kind, values in sorted(by_kind.items())},
+        "statuses": statuses,
+        "loop_lag": _summary(lags),
+        "drain_seconds": round(drain, 3),
+        "stubs": {
+            "openai_chat": counters["openai_chat"],
+            "openai_extract": counters["openai_extract"],
+            "telegram": counters["telegram"],
+            "sheets": emulator.stats()["calls"]
+        },
+        "sheet_jobs": stats.get("sheet_jobs"),
+        "update_dedup": stats.get("update_dedup"),
+        "loop_watchdog": stats.get("loop_watchdog")
+    }
+
+def print_report(result: dict, args) -> None:
+    mode = f"{args.rate} обн./с (открытая модель)" if args.rate else f"{args.concurrency} клиентов"
+    print(f"Обновлений: {result['requests']}, {mode}, чатов: {args.chats}")
+    print(f"Задержки заглушек: OpenAI {args.openai_latency * 1000:.0f} мс, "
+          f"Telegram {args.telegram_latency * 1000:.0f} мс, Sheets {args.sheets_latency * 1000:.0f} мс")
+    print(f"Время: {result['wall_seconds']} сек., {result['requests_per_second']} запросов/сек.")
+    print(f"{'тип':>10} {'число':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    rows = list(result["latency_by_kind"].items()) + [("все", result["latency"]), ("цикл", result["loop_lag"])]
+    for name, summary in rows:
+        print(f"{name:>10} {summary['count']:>7} {summary['p50_ms']:>9} {summary['p95_ms']:>9} "
+              f"{summary['p99_ms']:>9} {summary['max_ms']:>9}")
+    print(f"Коды ответов: {result['statuses']}")
+    print(f"Заглушки: {json.dumps(result['stubs'], ensure_ascii=False)}")
+    if result["sheet_jobs"]:
+        jobs = result["sheet_jobs"]
+        print(f"Создание таблиц: выполнено {jobs['completed']}, ошибок {jobs['failed']}, "
+              f"отклонено {jobs['rejected']}, в очереди {jobs['depth'] + jobs['in_progress']} "
+              f"(ожидание фоновой работы {result['drain_seconds']} сек.)")
+    watchdog = result["loop_watchdog"]
+    if watchdog and watchdog["samples"]:
+        print(f"Сторож цикла: p99 {watchdog['lag_p99_ms']} мс, max {watchdog['lag_max_ms']} мс, "
+              f"блокировок дольше {watchdog['threshold_ms']} мс: {watchdog['blocks']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook бота с заглушками внешних API")
+    parser.add_argument("--requests", type=int, default=2000, help="Число обновлений")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных клиентов (закрытая модель)")
+    parser.add_argument("--rate", type=float, help="Обновлений в секунду (открытая модель)")
+    parser.add_argument("--chats", type=int, default=200, help="Число различных чатов")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Доли типов обновлений (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument("--openai-latency", type=float, default=0.8, help="Задержка заглушки OpenAI, сек.")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Задержка заглушки Telegram, сек.")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="Задержка вызова эмулятора Sheets, сек.")
+    parser.add_argument("--reply-chars", type=int, default=400, help="Длина ответа заглушки OpenAI")
+    parser.add_argument("--lag-interval", type=float, default=0.01, help="Интервал измерения задержки цикла, сек.")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Сколько ждать завершения фоновой работы (очереди, таблицы), сек.")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Переменная окружения приложения (например, WEBHOOK_INGEST_MODE=1)")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Уровень логов приложения во время теста")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора обновлений и задержек")
+    parser.add_argument("--json", help="Записать результаты в JSON-файл")
+    args = parser.parse_args()
+
+    # Настройки читаются модулями бота при импорте, поэтому задаются до него
+    for item in args.env:
+        key, _, value = item.partition('=')
+        os.environ[key] = value
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "load-test")
+
+    result = asyncio.run(run(args))
+    print_report(result, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, **result}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
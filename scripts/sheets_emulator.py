@@ -0,0 +1,776 @@
+"""
+Эмулятор Google Sheets API в памяти для тестов, бенчмарков и нагрузочного теста.
+
+Не входит в пакет бота: поведение API (сетка, copyPaste, квоты, задержки) реализовано
+здесь независимо от bot/sheets_api.py, чтобы эмулятор проверял клиент, а не повторял его.
+"""
+import os
+import re
+import copy
+import json
+import time
+import random
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from bot.sheets_api import GoogleSheetsAPI
+
+# Ограничения сетки нового листа, как у Google Sheets
+DEFAULT_ROW_COUNT = 1000
+DEFAULT_COLUMN_COUNT = 26
+
+# Запросы batchUpdate, которые меняют только оформление: принимаются без изменения данных
+_FORMAT_ONLY_REQUESTS = (
+    'repeatCell', 'autoResizeDimensions', 'updateDimensionProperties', 'updateBorders',
+    'setDataValidation', 'addConditionalFormatRule', 'unmergeCells'
+)
+
+_A1_CELL_PATTERN = re.compile(r'^([A-Z]*)([0-9]*)$')
+
+# Ссылка на ячейку целиком в одном токене формулы: $A$1, A1, $a1 и т. п.
+_FORMULA_REF_PATTERN = re.compile(r'(\$?)([A-Za-z]{1,3})(\$?)([0-9]+)')
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def _column_letters(index: int) -> str:
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def _split_fields(fields: str) -> List[str]:
+    """Возвращает поля верхнего уровня маски: 'a,b(c,d)' -> ['a', 'b']"""
+    names = []
+    depth = 0
+    current = ''
+    for char in fields:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            names.append(current.strip())
+            current = ''
+            continue
+        if depth == 0 and char != ')':
+            current += char
+    if current.strip():
+        names.append(current.strip())
+    return names
+
+def _is_name_char(char: str) -> bool:
+    return char.isalnum() or char in '_.$'
+
+def _shift_relative_rows(formula: str, offset: int) -> str:
+    """
+    Сдвигает относительные строки ссылок в формуле, как copyPaste Google Sheets
+
+    Своя реализация эмулятора, не связанная с кодом бота: формула разбирается
+    на токены, строковые литералы и имена функций переносятся без изменений,
+    а токены-ссылки вида A1/$A1 получают сдвиг строки.
+    """
+    if not offset:
+        return formula
+    result = []
+    position = 0
+    while position < len(formula):
+        char = formula[position]
+        if char == '"':
+            # Литерал до закрывающей кавычки (удвоенная кавычка - два литерала подряд)
+            end = formula.find('"', position + 1)
+            end = len(formula) if end < 0 else end + 1
+            result.append(formula[position:end])
+            position = end
+            continue
+        if not _is_name_char(char):
+            result.append(char)
+            position += 1
+            continue
+        end = position
+        while end < len(formula) and _is_name_char(formula[end]):
+            end += 1
+        token = formula[position:end]
+        match = _FORMULA_REF_PATTERN.fullmatch(token)
+        is_function = end < len(formula) and formula[end] == '('
+        if match and not is_function and not match.group(3):
+            column_abs, column, _, row = match.groups()
+            token = f"{column_abs}{column}{int(row) + offset}"
+        result.append(token)
+        position = end
+    return ''.join(result)
+
+def _cell_value(value) -> dict:
+    """Переводит значение из values().update в userEnteredValue"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, (int, float)):
+        return {'numberValue': value}
+    text = str(value)
+    if text.startswith('='):
+        return {'formulaValue': text}
+    return {'stringValue': text}
+
+def _display_value(cell: dict):
+    """Значение ячейки в ответе values().get (формулы возвращаются как есть)"""
+    value = cell.get('userEnteredValue', {})
+    for key in ('stringValue', 'formulaValue'):
+        if key in value:
+            return value[key]
+    if 'numberValue' in value:
+        number = value['numberValue']
+        return str(int(number)) if float(number).is_integer() else str(number)
+    if 'boolValue' in value:
+        return 'TRUE' if value['boolValue'] else 'FALSE'
+    return ''
+
+def _error(status: int, message: str, headers: Optional[dict] = None) -> HttpError:
+    """Создает HttpError в формате ответа Google API"""
+    response = httplib2.Response({'status': str(status), **(headers or {})})
+    reason = {400: 'INVALID_ARGUMENT', 404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED'}.get(status, 'UNKNOWN')
+    content = json.dumps({'error': {'code': status, 'message': message, 'status': reason}}).encode('utf-8')
+    return HttpError(response, content, uri='emulator://sheets')
+
+class _Sheet:
+    """Лист эмулятора: свойства, ячейки (строки rowData) и объединения"""
+
+    def __init__(self, sheet_id: int, title: str, row_count: int = DEFAULT_ROW_COUNT,
+                 column_count: int = DEFAULT_COLUMN_COUNT):
+        self.properties = {
+            'sheetId': sheet_id,
+            'title': title,
+            'index': 0,
+            'sheetType': 'GRID',
+            'gridProperties': {'rowCount': row_count, 'columnCount': column_count}
+        }
+        self.rows = []
+        self.merges = []
+
+    @property
+    def sheet_id(self) -> int:
+        return self.properties['sheetId']
+
+    @property
+    def title(self) -> str:
+        return self.properties['title']
+
+    def check_range(self, end_row: int, end_column: int) -> None:
+        grid = self.properties['gridProperties']
+        if end_row > grid['rowCount'] or end_column > grid['columnCount']:
+            raise _error(400, f"Range ({self.title}!R{end_row}C{end_column}) exceeds grid limits. "
+                              f"Max rows: {grid['rowCount']}, max columns: {grid['columnCount']}")
+
+    def cell(self, row: int, column: int) -> dict:
+        if row < len(self.rows) and column < len(self.rows[row]):
+            return self.rows[row][column]
+        return {}
+
+    def set_cell(self, row: int, column: int, cell: dict) -> None:
+        while len(self.rows) <= row:
+            self.rows.append([])
+        values = self.rows[row]
+        while len(values) <= column:
+            values.append({})
+        values[column] = cell
+
+    def state(self) -> tuple:
+        """Снимок листа для отката batchUpdate (ячейки заменяются, а не изменяются на месте)"""
+        return copy.deepcopy(self.properties), [list(row) for row in self.rows], list(self.merges)
+
+    def restore(self, state: tuple) -> None:
+        self.properties, self.rows, self.merges = state
+
+    def to_dict(self, include_grid_data: bool) -> dict:
+        sheet = {'properties': copy.deepcopy(self.properties)}
+        if self.merges:
+            sheet['merges'] = copy.deepcopy(self.merges)
+        if include_grid_data:
+            sheet['data'] = [{
+                'startRow': 0,
+                'startColumn': 0,
+                'rowData': [{'values': copy.deepcopy(row)} if row else {} for row in self.rows]
+            }]
+        return sheet
+
+class _Request:
+    """Подготовленный запрос с интерфейсом HttpRequest из googleapiclient"""
+
+    def __init__(self, emulator: 'SheetsEmulator', method_id: str, http_method: str,
+                 handler, body: Optional[dict] = None):
+        self._emulator = emulator
+        self._handler = handler
+        self.methodId = method_id
+        self.method = http_method
+        self.uri = f"emulator://{method_id}"
+        self.body = json.dumps(body, ensure_ascii=False) if body is not None else None
+
+    def execute(self, http=None, num_retries: int = 0) -> dict:
+        return self._emulator._call(self)
+
+class _Values:
+    def __init__(self, emulator: 'SheetsEmulator'):
+        self._emulator = emulator
+
+    def get(self, spreadsheetId: str, range: str, **kwargs) -> _Request:
+        return _Request(self._emulator, 'sheets.spreadsheets.values.get', 'GET',
+                        lambda: self._emulator._values_get(spreadsheetId, range))
+
+    def update(self, spreadsheetId: str, range: str, body: dict, valueInputOption: str = 'RAW',
+               **kwargs) -> _Request:
+        return _Request(self._emulator, 'sheets.spreadsheets.values.update', 'PUT',
+                        lambda: self._emulator._values_update(spreadsheetId, range, body, valueInputOption),
+                        body)
+
+class _SheetsResource:
+    def __init__(self, emulator: 'SheetsEmulator'):
+        self._emulator = emulator
+
+    def copyTo(self, spreadsheetId: str, sheetId: int, body: dict, **kwargs) -> _Request:
+        return _Request(self._emulator, 'sheets.spreadsheets.sheets.copyTo', 'POST',
+                        lambda: self._emulator._copy_to(spreadsheetId, sheetId, body['destinationSpreadsheetId']),
+                        body)
+
+class _Spreadsheets:
+    def __init__(self, emulator: 'SheetsEmulator'):
+        self._emulator = emulator
+
+    def get(self, spreadsheetId: str, includeGridData: bool = False, **kwargs) -> _Request:
+        return _Request(self._emulator, 'sheets.spreadsheets.get', 'GET',
+                        lambda: self._emulator._get(spreadsheetId, includeGridData))
+
+    def create(self, body: dict, **kwargs) -> _Request:
+        return _Request(self._emulator, 'sheets.spreadsheets.create', 'POST',
+                        lambda: self._emulator._create(body), body)
+
+    def batchUpdate(self, spreadsheetId: str, body: dict, **kwargs) -> _Request:
+        return _Request(self._emulator, 'sheets.spreadsheets.batchUpdate', 'POST',
+                        lambda: self._emulator._batch_update(spreadsheetId, body), body)
+
+    def sheets(self) -> _SheetsResource:
+        return _SheetsResource(self._emulator)
+
+    def values(self) -> _Values:
+        return _Values(self._emulator)
+
+class SheetsEmulator:
+    """
+    Эмулятор Google Sheets API v4 в памяти, подставляемый вместо сервисного объекта
+    для бенчмарков и тестов без обращения к Google:
+
+        api.service = SheetsEmulator(latency=0.1)
+
+    Поддерживаются вызовы, которые делает бот: spreadsheets().get, create, batchUpdate
+    (addSheet, deleteSheet, updateSheetProperties, updateCells, copyPaste, mergeCells;
+    запросы оформления принимаются без изменения данных), sheets().copyTo,
+    values().get и values().update. Формулы хранятся, но не вычисляются.
+
+    Время вызова складывается из latency (с разбросом jitter, доля от latency),
+    переопределения по методу в latency_by_method (например, {'batchUpdate': 0.5})
+    и per_kb_latency на каждый килобайт тела запроса. Квоты read_quota/write_quota
+    (запросов в минуту в скользящем окне) и случайная доля отказов error_rate
+    приводят к HTTP 429 с заголовком Retry-After, как у настоящего API.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 latency_by_method: Optional[Dict[str, float]] = None,
+                 per_kb_latency: float = 0.0,
+                 read_quota: Optional[int] = None, write_quota: Optional[int] = None,
+                 error_rate: float = 0.0, retry_after: float = 1.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.latency_by_method = dict(latency_by_method or {})
+        self.per_kb_latency = per_kb_latency
+        self.quotas = {'read': read_quota, 'write': write_quota}
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._spreadsheets = {}
+        self._next_sheet_id = 1000
+        self._windows = {'read': deque(), 'write': deque()}
+        # Снимки листов, измененных текущим batchUpdate
+        self._touched = None
+        self.calls = {}
+        self.errors = {}
+        self.busy_seconds = 0.0
+
+    # Наполнение и проверка состояния
+
+    def add_spreadsheet(self, spreadsheet_id: str, title: str = '') -> None:
+        """Создает пустую таблицу с заданным ID"""
+        with self._lock:
+            self._spreadsheets[spreadsheet_id] = {'title': title or spreadsheet_id, 'sheets': []}
+
+    def add_sheet(self, spreadsheet_id: str, title: str, rows: Optional[List[List[dict]]] = None,
+                  merges: Optional[List[dict]] = None, row_count: int = DEFAULT_ROW_COUNT,
+                  column_count: int = DEFAULT_COLUMN_COUNT) -> int:
+        """
+        Добавляет лист с данными в таблицу (таблица создается при необходимости)
+
+        Args:
+            spreadsheet_id: ID таблицы
+            title: Название листа
+            rows: Ячейки по строкам в формате CellData (userEnteredValue, userEnteredFormat и т. д.)
+            merges: Объединения в формате GridRange без sheetId
+            row_count: Число строк сетки
+            column_count: Число столбцов сетки
+
+        Returns:
+            int: ID листа
+        """
+        with self._lock:
+            spreadsheet = self._spreadsheets.setdefault(spreadsheet_id, {'title': spreadsheet_id, 'sheets': []})
+            sheet = self._new_sheet(spreadsheet, title, row_count, column_count)
+            sheet.rows = copy.deepcopy(rows or [])
+            sheet.merges = [{'sheetId': sheet.sheet_id, **merge} for merge in (merges or [])]
+            return sheet.sheet_id
+
+    def sheet_titles(self, spreadsheet_id: str) -> List[str]:
+        """Возвращает названия листов таблицы по порядку"""
+        with self._lock:
+            return [sheet.title for sheet in self._spreadsheet(spreadsheet_id)['sheets']]
+
+    def sheet_rows(self, spreadsheet_id: str, title: str) -> List[List[dict]]:
+        """Возвращает копию ячеек листа по строкам"""
+        with self._lock:
+            return copy.deepcopy(self._sheet_by_title(self._spreadsheet(spreadsheet_id), title).rows)
+
+    def sheet_merges(self, spreadsheet_id: str, title: str) -> List[dict]:
+        """Возвращает копию объединений листа"""
+        with self._lock:
+            return copy.deepcopy(self._sheet_by_title(self._spreadsheet(spreadsheet_id), title).merges)
+
+    def stats(self) -> dict:
+        """Возвращает число вызовов и ошибок по методам и суммарное время вызовов"""
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'total_calls': sum(self.calls.values()),
+                'errors': dict(self.errors),
+                'busy_seconds': round(self.busy_seconds, 3)
+            }
+
+    def reset_stats(self) -> None:
+        """Обнуляет счетчики вызовов"""
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+            self.busy_seconds = 0.0
+
+    # Ресурсы в стиле googleapiclient
+
+    def spreadsheets(self) -> _Spreadsheets:
+        return _Spreadsheets(self)
+
+    # Выполнение вызова: задержка, квоты, обработчик
+
+    def _delay(self, request: _Request) -> float:
+        name = request.methodId.rsplit('.', 1)[-1]
+        delay = self.latency_by_method.get(name, self.latency)
+        if self.jitter and delay:
+            delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        if self.per_kb_latency and request.body:
+            delay += self.per_kb_latency * len(request.body.encode('utf-8')) / 1024
+        return max(delay, 0.0)
+
+    def _check_quota(self, kind: str) -> Optional[HttpError]:
+        """Учитывает вызов в окне квоты; возвращает ошибку 429, если квота исчерпана"""
+        headers = {'retry-after': str(self.retry_after)}
+        if self.error_rate and self._random.random() < self.error_rate:
+            return _error(429, "Quota exceeded (emulated random failure)", headers)
+        quota = self.quotas[kind]
+        if quota is None:
+            return None
+        now = time.monotonic()
+        window = self._windows[kind]
+        while window and window[0] <= now - 60:
+            window.popleft()
+        if len(window) >= quota:
+            return _error(429, f"Quota exceeded for quota metric '{kind.title()} requests' "
+                               f"and limit '{kind.title()} requests per minute per user'", headers)
+        window.append(now)
+        return None
+
+    def _call(self, request: _Request) -> dict:
+        kind = 'read' if request.method == 'GET' else 'write'
+        name = request.methodId[len('sheets.'):]
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = self._delay(request)
+            self.busy_seconds += delay
+            error = self._check_quota(kind)
+        if delay:
+            time.sleep(delay)
+        try:
+            if error is not None:
+                raise error
+            with self._lock:
+                return copy.deepcopy(request._handler())
+        except HttpError as e:
+            with self._lock:
+                key = f"{name}:{e.resp.status}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+            raise
+
+    # Обработчики методов (вызываются под блокировкой)
+
+    def _spreadsheet(self, spreadsheet_id: str) -> dict:
+        spreadsheet = self._spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            raise _error(404, f"Requested entity was not found: {spreadsheet_id}")
+        return spreadsheet
+
+    def _sheet_by_id(self, spreadsheet: dict, sheet_id: int) -> _Sheet:
+        for sheet in spreadsheet['sheets']:
+            if sheet.sheet_id == sheet_id:
+                if self._touched is not None and sheet not in self._touched:
+                    self._touched[sheet] = sheet.state()
+                return sheet
+        raise _error(400, f"No grid with id: {sheet_id}")
+
+    def _sheet_by_title(self, spreadsheet: dict, title: str) -> _Sheet:
+        for sheet in spreadsheet['sheets']:
+            if sheet.title == title:
+                return sheet
+        raise _error(400, f"Unable to parse range: {title}")
+
+    def _check_title(self, spreadsheet: dict, title: str, sheet_id: Optional[int] = None) -> None:
+        for sheet in spreadsheet['sheets']:
+            if sheet.title == title and sheet.sheet_id != sheet_id:
+                raise _error(400, f'Invalid requests[0]: A sheet with the name "{title}" already exists. '
+                                  f'Please enter another name.')
+
+    def _new_sheet(self, spreadsheet: dict, title: str, row_count: int = DEFAULT_ROW_COUNT,
+                   column_count: int = DEFAULT_COLUMN_COUNT) -> _Sheet:
+        self._check_title(spreadsheet, title)
+        self._next_sheet_id += 1
+        sheet = _Sheet(self._next_sheet_id, title, row_count, column_count)
+        sheet.properties['index'] = len(spreadsheet['sheets'])
+        spreadsheet['sheets'].append(sheet)
+        return sheet
+
+    def _get(self, spreadsheet_id: str, include_grid_data: bool) -> dict:
+        # Маска полей не применяется: лишние поля в ответе вызывающему коду не мешают
+        spreadsheet = self._spreadsheet(spreadsheet_id)
+        return {
+            'spreadsheetId': spreadsheet_id,
+            'properties': {'title': spreadsheet['title']},
+            'sheets': [sheet.to_dict(include_grid_data) for sheet in spreadsheet['sheets']]
+        }
+
+    def _create(self, body: dict) -> dict:
+        self._next_sheet_id += 1
+        spreadsheet_id = f"emulated-{self._next_sheet_id}"
+        title = body.get('properties', {}).get('title', spreadsheet_id)
+        spreadsheet = self._spreadsheets[spreadsheet_id] = {'title': title, 'sheets': []}
+        self._new_sheet(spreadsheet, 'Sheet1')
+        return {'spreadsheetId': spreadsheet_id, 'properties': {'title': title}}
+
+    def _copy_to(self, spreadsheet_id: str, sheet_id: int, destination_id: str) -> dict:
+        source = self._sheet_by_id(self._spreadsheet(spreadsheet_id), sheet_id)
+        destination = self._spreadsheet(destination_id)
+        # Копия получает имя "Копия <название>", при совпадении - с номером
+        title = f"Копия {source.title}"
+        titles = {sheet.title for sheet in destination['sheets']}
+        number = 2
+        while title in titles:
+            title = f"Копия {source.title} {number}"
+            number += 1
+        grid = source.properties['gridProperties']
+        sheet = self._new_sheet(destination, title, grid['rowCount'], grid['columnCount'])
+        sheet.rows = copy.deepcopy(source.rows)
+        sheet.merges = [{**merge, 'sheetId': sheet.sheet_id} for merge in source.merges]
+        return copy.deepcopy(sheet.properties)
+
+    def _batch_update(self, spreadsheet_id: str, body: dict) -> dict:
+        spreadsheet = self._spreadsheet(spreadsheet_id)
+        # Как и в API, запросы применяются атомарно: при ошибке изменения отменяются
+        sheets = list(spreadsheet['sheets'])
+        self._touched = {}
+        replies = []
+        try:
+            for request in body.get('requests', []):
+                replies.append(self._apply(spreadsheet, request))
+        except HttpError:
+            spreadsheet['sheets'] = sheets
+            for sheet, state in self._touched.items():
+                sheet.restore(state)
+            raise
+        finally:
+            self._touched = None
+        return {'spreadsheetId': spreadsheet_id, 'replies': replies}
+
+    def _apply(self, spreadsheet: dict, request: dict) -> dict:
+        if len(request) != 1:
+            raise _error(400, f"Invalid request: {list(request)}")
+        kind, params = next(iter(request.items()))
+        if kind == 'addSheet':
+            properties = params.get('properties', {})
+            grid = properties.get('gridProperties', {})
+            sheet = self._new_sheet(spreadsheet, properties.get('title', f"Лист{len(spreadsheet['sheets']) + 1}"),
+                                    grid.get('rowCount', DEFAULT_ROW_COUNT),
+                                    grid.get('columnCount', DEFAULT_COLUMN_COUNT))
+            return {'addSheet': {'properties': copy.deepcopy(sheet.properties)}}
+        if kind == 'deleteSheet':
+            sheet = self._sheet_by_id(spreadsheet, params['sheetId'])
+            spreadsheet['sheets'].remove(sheet)
+            return {}
+        if kind == 'updateSheetProperties':
+            self._update_properties(spreadsheet, params['properties'], params['fields'])
+            return {}
+        if kind == 'updateCells':
+            self._update_cells(spreadsheet, params)
+            return {}
+        if kind == 'copyPaste':
+            self._copy_paste(spreadsheet, params)
+            return {}
+        if kind == 'mergeCells':
+            grid_range = params['range']
+            sheet = self._sheet_by_id(spreadsheet, grid_range['sheetId'])
+            sheet.check_range(grid_range['endRowIndex'], grid_range['endColumnIndex'])
+            sheet.merges.append(dict(grid_range))
+            return {}
+        if kind in _FORMAT_ONLY_REQUESTS:
+            return {}
+        raise _error(400, f"Request type {kind} is not supported by the emulator")
+
+    def _update_properties(self, spreadsheet: dict, properties: dict, fields: str) -> None:
+        sheet = self._sheet_by_id(spreadsheet, properties['sheetId'])
+        for field in fields.split(','):
+            field = field.strip()
+            if field == 'title':
+                self._check_title(spreadsheet, properties['title'], sheet.sheet_id)
+                sheet.properties['title'] = properties['title']
+            elif field.startswith('gridProperties.'):
+                name = field[len('gridProperties.'):]
+                sheet.properties['gridProperties'][name] = properties['gridProperties'][name]
+            elif field in properties:
+                sheet.properties[field] = properties[field]
+
+    def _update_cells(self, spreadsheet: dict, params: dict) -> None:
+        if 'range' in params:
+            grid_range = params['range']
+            start_row = grid_range.get('startRowIndex', 0)
+            start_column = grid_range.get('startColumnIndex', 0)
+        else:
+            grid_range = params['start']
+            start_row = grid_range.get('rowIndex', 0)
+            start_column = grid_range.get('columnIndex', 0)
+        sheet = self._sheet_by_id(spreadsheet, grid_range['sheetId'])
+        rows = params.get('rows', [])
+        width = max((len(row.get('values', [])) for row in rows), default=0)
+        sheet.check_range(start_row + len(rows), start_column + width)
+        fields = _split_fields(params['fields'])
+        for row_offset, row in enumerate(rows):
+            for column_offset, cell in enumerate(row.get('values', [])):
+                row_index = start_row + row_offset
+                column_index = start_column + column_offset
+                if fields == ['*']:
+                    updated = copy.deepcopy(cell)
+                else:
+                    updated = dict(sheet.cell(row_index, column_index))
+                    for field in fields:
+                        if field in cell:
+                            updated[field] = copy.deepcopy(cell[field])
+                        else:
+                            updated.pop(field, None)
+                sheet.set_cell(row_index, column_index, updated)
+
+    def _copy_paste(self, spreadsheet: dict, params: dict) -> None:
+        source_range = params['source']
+        destination_range = params['destination']
+        source = self._sheet_by_id(spreadsheet, source_range['sheetId'])
+        destination = self._sheet_by_id(spreadsheet, destination_range['sheetId'])
+        paste_type = params.get('pasteType', 'PASTE_NORMAL')
+
+        source_rows = range(source_range.get('startRowIndex', 0), source_range['endRowIndex'])
+        source_columns = range(source_range.get('startColumnIndex', 0), source_range['endColumnIndex'])
+        start_row = destination_range.get('startRowIndex', 0)
+        start_column = destination_range.get('startColumnIndex', 0)
+        # Диапазон назначения заполняется копиями источника целиком, как в API
+        end_row = max(destination_range.get('endRowIndex', 0), start_row + len(source_rows))
+        end_column = max(destination_range.get('endColumnIndex', 0), start_column + len(source_columns))
+        destination.check_range(end_row, end_column)
+
+        block = [[copy.deepcopy(source.cell(row, column)) for column in source_columns] for row in source_rows]
+        for row_index in range(start_row, end_row):
+            source_row_offset = (row_index - start_row) % len(source_rows)
+            offset = row_index - source_rows[source_row_offset]
+            for column_index in range(start_column, end_column):
+                cell = copy.deepcopy(block[source_row_offset][(column_index - start_column) % len(source_columns)])
+                if paste_type == 'PASTE_FORMAT':
+                    cell = dict(destination.cell(row_index, column_index),
+                                **{k: v for k, v in cell.items() if k == 'userEnteredFormat'})
+                elif paste_type == 'PASTE_VALUES':
+                    cell = dict(destination.cell(row_index, column_index),
+                                **{k: v for k, v in cell.items() if k == 'userEnteredValue'})
+                # Относительные ссылки формул сдвигаются на смещение по строкам
+                formula = cell.get('userEnteredValue', {}).get('formulaValue')
+                if formula is not None:
+                    cell['userEnteredValue'] = {'formulaValue': _shift_relative_rows(formula, offset)}
+                destination.set_cell(row_index, column_index, cell)
+
+        if paste_type == 'PASTE_NORMAL':
+            height = len(source_rows)
+            for merge in list(source.merges):
+                if merge['startRowIndex'] >= source_rows.start and merge['endRowIndex'] <= source_rows.stop:
+                    for block_start in range(start_row, end_row, height):
+                        offset = block_start - source_rows.start
+                        destination.merges.append({
+                            **merge, 'sheetId': destination.sheet_id,
+                            'startRowIndex': merge['startRowIndex'] + offset,
+                            'endRowIndex': merge['endRowIndex'] + offset
+                        })
+
+    def _parse_range(self, spreadsheet: dict, a1_range: str):
+        """Разбирает диапазон A1 ('Лист!A1:C3', 'Лист', 'A1:B2') в лист и границы"""
+        if '!' in a1_range:
+            title, cells = a1_range.rsplit('!', 1)
+        elif _A1_CELL_PATTERN.match(a1_range.split(':')[0]) and any(ch.isdigit() for ch in a1_range):
+            title, cells = None, a1_range
+        else:
+            title, cells = a1_range, ''
+        if title is None:
+            if not spreadsheet['sheets']:
+                raise _error(400, f"Unable to parse range: {a1_range}")
+            sheet = spreadsheet['sheets'][0]
+        else:
+            sheet = self._sheet_by_title(spreadsheet, title.strip("'").replace("''", "'"))
+        grid = sheet.properties['gridProperties']
+        if not cells:
+            return sheet, 0, 0, grid['rowCount'], grid['columnCount']
+        parts = cells.split(':')
+        start = _A1_CELL_PATTERN.match(parts[0])
+        end = _A1_CELL_PATTERN.match(parts[-1])
+        if start is None or end is None:
+            raise _error(400, f"Unable to parse range: {a1_range}")
+        start_column = _column_index(start.group(1)) if start.group(1) else 0
+        start_row = int(start.group(2)) - 1 if start.group(2) else 0
+        end_column = _column_index(end.group(1)) + 1 if end.group(1) else grid['columnCount']
+        end_row = int(end.group(2)) if end.group(2) else grid['rowCount']
+        return sheet, start_row, start_column, end_row, end_column
+
+    def _values_get(self, spreadsheet_id: str, a1_range: str) -> dict:
+        sheet, start_row, start_column, end_row, end_column = self._parse_range(
+            self._spreadsheet(spreadsheet_id), a1_range)
+        values = []
+        for row in range(start_row, min(end_row, len(sheet.rows))):
+            row_values = [_display_value(sheet.cell(row, column)) for column in range(start_column, end_column)]
+            # Как в API, пустые ячейки в конце строки и пустые строки в конце не возвращаются
+            while row_values and row_values[-1] == '':
+                row_values.pop()
+            values.append(row_values)
+        while values and not values[-1]:
+            values.pop()
+        result = {'range': f"{sheet.title}!{_column_letters(start_column)}{start_row + 1}:"
+                           f"{_column_letters(end_column - 1)}{end_row}", 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def _values_update(self, spreadsheet_id: str, a1_range: str, body: dict, value_input_option: str) -> dict:
+        sheet, start_row, start_column, _, _ = self._parse_range(self._spreadsheet(spreadsheet_id), a1_range)
+        values = body.get('values', [])
+        width = max((len(row) for row in values), default=0)
+        sheet.check_range(start_row + len(values), start_column + width)
+        for row_offset, row in enumerate(values):
+            for column_offset, value in enumerate(row):
+                if value_input_option == 'USER_ENTERED':
+                    entered = _cell_value(value)
+                else:
+                    entered = {'numberValue': value} if isinstance(value, (int, float)) and not isinstance(value, bool) \
+                        else {'stringValue': str(value)}
+                cell = dict(sheet.cell(start_row + row_offset, start_column + column_offset))
+                cell['userEnteredValue'] = entered
+                sheet.set_cell(start_row + row_offset, start_column + column_offset, cell)
+        return {
+            'spreadsheetId': spreadsheet_id,
+            'updatedRange': f"{sheet.title}!{_column_letters(start_column)}{start_row + 1}:"
+                            f"{_column_letters(start_column + max(width, 1) - 1)}{start_row + max(len(values), 1)}",
+            'updatedRows': len(values),
+            'updatedColumns': width,
+            'updatedCells': sum(len(row) for row in values)
+        }
+
+def seed_project_templates(emulator: SheetsEmulator, section_rows: int = 8) -> dict:
+    """
+    Создает в эмуляторе основную таблицу и шаблоны верхней части и секции проекта,
+    похожие на рабочие: шапку из трех строк и секцию с заголовком, позициями и итогом
+
+    Args:
+        emulator: Эмулятор
+        section_rows: Число строк позиций в шаблоне секции
+
+    Returns:
+        dict: Конфигурация как в разделе 'installed' client_secrets.json
+    """
+    bold = {'textFormat': {'bold': True}}
+    money = {'numberFormat': {'type': 'NUMBER', 'pattern': '#,##0.00'}}
+    top_rows = [
+        [{'userEnteredValue': {'stringValue': 'Проект'}, 'userEnteredFormat': bold}],
+        [{'userEnteredValue': {'stringValue': 'Итого по проекту'}, 'userEnteredFormat': bold},
+         {}, {}, {}, {'userEnteredValue': {'numberValue': 0}, 'userEnteredFormat': money}],
+        [{'userEnteredValue': {'stringValue': header}, 'userEnteredFormat': bold}
+         for header in ('Статья', 'Подрядчик', 'Кол-во', 'Цена', 'Сумма', 'Статус',
+                        'Оплата', 'Дата', 'Ответственный', 'Комментарий')],
+    ]
+    first_item = 2
+    last_item = first_item + section_rows - 1
+    section = [[
+        {'userEnteredValue': {'stringValue': '{sectionName}'}, 'userEnteredFormat': bold},
+        {}, {}, {},
+        {'userEnteredValue': {'formulaValue': f'=SUM(E{first_item}:E{last_item})'}, 'userEnteredFormat': money},
+    ]]
+    for row in range(first_item, last_item + 1):
+        section.append([
+            {'userEnteredValue': {'stringValue': ''}, 'note': 'Позиция'},
+            {}, {'userEnteredValue': {'numberValue': 1}}, {'userEnteredFormat': money},
+            {'userEnteredValue': {'formulaValue': f'=C{row}*D{row}'}, 'userEnteredFormat': money},
+            {'userEnteredValue': {'stringValue': 'план'},
+             'dataValidation': {'condition': {'type': 'ONE_OF_LIST', 'values': [
+                 {'userEnteredValue': 'план'}, {'userEnteredValue': 'заказано'}, {'userEnteredValue': 'оплачено'}]}}},
+        ])
+    emulator.add_spreadsheet('main', 'Проекты')
+    emulator.add_sheet('main', 'Сводка')
+    emulator.add_sheet('template_top', 'Шаблон', top_rows)
+    emulator.add_sheet('template_section', 'Секция', section,
+                       merges=[{'startRowIndex': 0, 'endRowIndex': 1, 'startColumnIndex': 0, 'endColumnIndex': 4}])
+    return {'main_sheet': 'main', 'template_top': 'template_top', 'template_section': 'template_section'}
+
+def emulated_sheets_api(emulator: SheetsEmulator, workdir: str, section_rows: int = 8) -> GoogleSheetsAPI:
+    """
+    Создает GoogleSheetsAPI, работающий с эмулятором, в котором созданы шаблоны проекта
+
+    Учетные данные и ID таблиц записываются в каталог workdir/credentials, который
+    передается клиенту явно (текущая директория процесса не меняется).
+
+    Args:
+        emulator: Эмулятор
+        workdir: Рабочий каталог (например, временный)
+        section_rows: Число строк позиций в шаблоне секции
+
+    Returns:
+        GoogleSheetsAPI: Клиент с эмулятором вместо сервисного объекта
+    """
+    config = seed_project_templates(emulator, section_rows)
+    credentials_dir = os.path.join(workdir, 'credentials')
+    os.makedirs(credentials_dir, exist_ok=True)
+    with open(os.path.join(credentials_dir, 'credentials.json'), 'w') as f:
+        f.write('{}')
+    with open(os.path.join(credentials_dir, 'client_secrets.json'), 'w', encoding='utf-8') as f:
+        json.dump({'installed': config}, f)
+
+    api = GoogleSheetsAPI(credentials_dir=credentials_dir)
+    api.service = emulator
+    api.spreadsheet_id = config['main_sheet']
+    return api
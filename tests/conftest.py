@@ -2,7 +2,7 @@ import pytest
 from unittest.mock import patch
 
 @pytest.fixture(autouse=True)
-def mock_config():
+def mock_config(monkeypatch):
     """Автоматически подменяем конфигурацию во всех тестах"""
     config = {
         "OPENAI_API_KEY": "test-key",
@@ -10,6 +10,8 @@ def mock_config():
         "GOOGLE_SHEETS_ID": "test-sheet-id",
         "GOOGLE_CREDENTIALS_FILE": "test-credentials.json"
     }
-    with patch('bot.command_processor.load_config', return_value=config), \
-         patch('bot.sheets_api.load_config', return_value=config):
+    # Модули бота читают ключи из переменных окружения, а не через load_config
+    for key in ("OPENAI_API_KEY", "TELEGRAM_BOT_TOKEN", "GOOGLE_SHEETS_ID"):
+        monkeypatch.setenv(key, config[key])
+    with patch('bot.config.load_config', return_value=config):
         yield config
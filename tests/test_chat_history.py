@@ -0,0 +1,135 @@
+import pytest
+import threading
+from unittest.mock import patch
+from bot.chat_history import ChatHistoryStore
+from bot.state_backend import SQLiteStateBackend
+
+@pytest.mark.asyncio
+async def test_chat_keeps_last_messages():
+    """Тест: в чате хранятся только последние max_messages сообщений, размер пересчитывается"""
+    store = ChatHistoryStore(max_messages=3)
+    for i in range(5):
+        await store.append(1, "user", f"сообщение {i}")
+
+    assert [m["content"] for m in await store.get(1)] == ["сообщение 2", "сообщение 3", "сообщение 4"]
+    single = ChatHistoryStore(max_messages=3)
+    for i in range(2, 5):
+        await single.append(1, "user", f"сообщение {i}")
+    assert store.stats()["bytes"] == single.stats()["bytes"]
+
+@pytest.mark.asyncio
+async def test_least_recently_used_chat_evicted():
+    """Тест: при превышении числа чатов вытесняется давно неактивный чат целиком"""
+    store = ChatHistoryStore(max_chats=2)
+    await store.append(1, "user", "a")
+    await store.append(2, "user", "b")
+    await store.get(1)
+    await store.append(3, "user", "c")
+
+    assert 1 in store and 3 in store and 2 not in store
+    assert store.stats()["evictions"]["max_chats"] == 1
+
+@pytest.mark.asyncio
+async def test_idle_chats_expire():
+    """Тест: чаты без активности дольше idle_ttl забываются"""
+    store = ChatHistoryStore(idle_ttl=60)
+    with patch('bot.chat_history.time.monotonic', return_value=0):
+        await store.append(1, "user", "a")
+    with patch('bot.chat_history.time.monotonic', return_value=120):
+        await store.append(2, "user", "b")
+
+    assert 1 not in store
+    assert store.stats()["evictions"]["idle"] == 1
+
+@pytest.mark.asyncio
+async def test_byte_budget_enforced():
+    """Тест: общий объем истории не превышает бюджет байт"""
+    store = ChatHistoryStore(max_bytes=2000)
+    for chat_id in range(10):
+        await store.append(chat_id, "user", "x" * 500)
+    stats = store.stats()
+    assert stats["bytes"] <= 2000
+    assert stats["chats"] == 2
+    assert stats["evictions"]["max_bytes"] == 8
+
+    # Слишком длинный чат теряет старые сообщения, но последнее сохраняется
+    await store.append(42, "user", "y" * 1500)
+    await store.append(42, "assistant", "z" * 1500)
+    assert await store.get(42) == [{"role": "assistant", "content": "z" * 1500}]
+
+    store.clear(42)
+    assert store.stats()["bytes"] == 0 and await store.get(42) == []
+
+@pytest.mark.asyncio
+async def test_history_written_behind_in_batches(tmp_path):
+    """Тест: сообщения пишутся в хранилище пачкой при сбросе и переживают перезапуск"""
+    path = str(tmp_path / "state.db")
+    backend = SQLiteStateBackend(path)
+    store = ChatHistoryStore(backend=backend, flush_interval=60)
+    await store.start()
+    await store.append(1, "user", "привет")
+    await store.append(1, "assistant", "здравствуйте")
+    await store.append(2, "user", "второй чат")
+
+    assert backend.get("chat_history", "1") == (None, 0.0)
+    await store.stop()
+    assert store.stats()["flushes"] == 1
+    assert store.stats()["rows_written"] == 2
+
+    restarted = ChatHistoryStore(backend=SQLiteStateBackend(path))
+    assert await restarted.get(1) == [
+        {"role": "user", "content": "привет"},
+        {"role": "assistant", "content": "здравствуйте"}
+    ]
+    assert restarted.stats()["bytes"] == store.stats()["bytes"] - store._chats[2]["bytes"]
+
+@pytest.mark.asyncio
+async def test_history_consistent_across_workers(tmp_path):
+    """Тест: воркер видит изменения истории, записанные другим воркером"""
+    path = str(tmp_path / "state.db")
+    first = ChatHistoryStore(backend=SQLiteStateBackend(path))
+    second = ChatHistoryStore(backend=SQLiteStateBackend(path))
+
+    await first.append(1, "user", "a")
+    await first.flush()
+    assert await second.get(1) == [{"role": "user", "content": "a"}]
+
+    await first.append(1, "user", "b")
+    await first.flush()
+    assert [m["content"] for m in await second.get(1)] == ["a", "b"]
+    assert second.stats()["reloads"] == 1
+
+    first.clear(1)
+    await first.flush()
+    assert await second.get(1) == []
+
+@pytest.mark.asyncio
+async def test_evicted_unflushed_history_not_lost(tmp_path):
+    """Тест: вытесненная до записи история сохраняется при следующем сбросе"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    store = ChatHistoryStore(backend=backend, max_chats=1)
+    await store.append(1, "user", "a")
+    await store.append(2, "user", "b")
+    assert 1 not in store
+
+    await store.append(1, "user", "c")
+    assert [m["content"] for m in await store.get(1)] == ["a", "c"]
+    await store.flush()
+    assert backend.get("chat_history", "2")[0] == [{"role": "user", "content": "b"}]
+    assert [m["content"] for m in backend.get("chat_history", "1")[0]] == ["a", "c"]
+
+@pytest.mark.asyncio
+async def test_backend_reads_run_off_loop(tmp_path):
+    """Тест: проверка версии и чтение истории из хранилища выполняются вне потока цикла событий"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    backend.put_many([("chat_history", "1", [{"role": "user", "content": "a"}])])
+    store = ChatHistoryStore(backend=backend)
+    threads = []
+    for name in ("get", "version"):
+        method = getattr(backend, name)
+        setattr(backend, name, lambda *args, method=method: threads.append(threading.get_ident()) or method(*args))
+
+    assert await store.get(1) == [{"role": "user", "content": "a"}]
+    assert await store.get(1) == [{"role": "user", "content": "a"}]
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
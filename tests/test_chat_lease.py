@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from bot.chat_lease import ChatLeases
+from bot.state_backend import SQLiteStateBackend
+
+@pytest.mark.asyncio
+async def test_chat_processed_by_one_worker_at_a_time(tmp_path):
+    """Тест: второй воркер ждет, пока первый закончит обработку сообщения чата"""
+    path = str(tmp_path / "state.db")
+    first = ChatLeases(SQLiteStateBackend(path), owner="w1", poll_interval=0.01)
+    second = ChatLeases(SQLiteStateBackend(path), owner="w2", poll_interval=0.01)
+    events = []
+
+    async def handle(leases, name, delay):
+        async with leases.hold(7):
+            events.append(f"{name} start")
+            await asyncio.sleep(delay)
+            events.append(f"{name} end")
+
+    first_task = asyncio.create_task(handle(first, "w1", 0.1))
+    await asyncio.sleep(0.02)
+    await asyncio.gather(first_task, handle(second, "w2", 0))
+
+    assert events == ["w1 start", "w1 end", "w2 start", "w2 end"]
+    assert second.stats()["waits"] == 1
+    assert first.stats()["local_chats"] == 0
+
+@pytest.mark.asyncio
+async def test_messages_of_chat_ordered_within_worker(tmp_path):
+    """Тест: внутри воркера сообщения одного чата обрабатываются по очереди"""
+    leases = ChatLeases(SQLiteStateBackend(str(tmp_path / "state.db")), owner="w1")
+    events = []
+
+    async def handle(name):
+        async with leases.hold(7):
+            events.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name} end")
+
+    await asyncio.gather(handle("a"), handle("b"), handle("c"))
+    assert events == ["a start", "a end", "b start", "b end", "c start", "c end"]
+    assert leases.stats()["local_chats"] == 0
+
+@pytest.mark.asyncio
+async def test_lease_wait_times_out(tmp_path):
+    """Тест: если чат не освобожден вовремя, сообщение обрабатывается без аренды"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    backend.claim("chat", "7", "crashed", ttl=60)
+    leases = ChatLeases(backend, owner="w1", wait_timeout=0.05, poll_interval=0.01)
+
+    async with leases.hold(7):
+        pass
+    assert leases.stats()["timeouts"] == 1
+    assert not backend.claim("chat", "7", "w2", ttl=60)
@@ -1,18 +1,28 @@
 import unittest
+import asyncio
 import os
 import json
 from dotenv import load_dotenv
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from bot.gpt_command_parser import GPTCommandParser, ParsingError
+from bot.command_parser import CommandParser
 
 class TestGPTCommandParser(unittest.TestCase):
+    """Интеграционные тесты с настоящим OpenAI API (нужен OPENAI_API_KEY в окружении или .env)"""
+
     @classmethod
     def setUpClass(cls):
         """Инициализация парсера перед всеми тестами"""
         load_dotenv()
+        if not os.getenv('OPENAI_API_KEY'):
+            raise unittest.SkipTest("OPENAI_API_KEY не задан, интеграционные тесты GPT пропущены")
         cls.parser = GPTCommandParser()
 
+    def _parse(self, text):
+        """Выполняет асинхронный разбор команды"""
+        return asyncio.run(self._parse(text))
+
     def test_valid_create_project_commands(self):
         """Тест корректных команд создания проекта"""
         test_cases = [
@@ -44,7 +54,7 @@ class TestGPTCommandParser(unittest.TestCase):
 
         for case in test_cases:
             with self.subTest(input=case["input"]):
-                result = self.parser.parse_command(case["input"])
+                result = self._parse(case["input"])
                 self.assertEqual(result["project_name"], case["expected"]["project_name"])
                 self.assertEqual(set(result["sections"]), set(case["expected"]["sections"]))
                 self.assertTrue(result["is_create_table_command"])
@@ -59,7 +69,7 @@ class TestGPTCommandParser(unittest.TestCase):
 
         for command in test_cases:
             with self.subTest(command=command):
-                result = self.parser.parse_command(command)
+                result = self._parse(command)
                 self.assertFalse(result["is_create_table_command"])
                 self.assertEqual(result["project_name"], "")
                 self.assertEqual(result["sections"], [])
@@ -87,7 +97,7 @@ class TestGPTCommandParser(unittest.TestCase):
 
         for case in test_cases:
             with self.subTest(input=case["input"]):
-                result = self.parser.parse_command(case["input"])
+                result = self._parse(case["input"])
                 self.assertEqual(result["project_name"], case["expected"]["project_name"])
                 self.assertEqual(set(result["sections"]), set(case["expected"]["sections"]))
                 self.assertEqual(result["is_create_table_command"], case["expected"]["is_create_table_command"])
@@ -108,10 +118,10 @@ class TestGPTCommandParser(unittest.TestCase):
             with self.subTest(input=case["input"]):
                 if case["should_raise"]:
                     with self.assertRaises(ParsingError):
-                        self.parser.parse_command(case["input"])
+                        self._parse(case["input"])
                 else:
                     try:
-                        result = self.parser.parse_command(case["input"])
+                        result = self._parse(case["input"])
                         self.assertIsInstance(result, dict)
                         self.assertIn("project_name", result)
                         self.assertIn("sections", result)
@@ -134,5 +144,40 @@ class TestGPTCommandParser(unittest.TestCase):
                 with self.assertRaises(ParsingError):
                     self.parser.validate_response(response)
 
+class TestRuleCommandParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = CommandParser()
+
+    def test_confident_commands(self):
+        """Тест уверенного разбора типичных команд с сохранением регистра"""
+        test_cases = [
+            ("Создай проект Фестиваль ГТО с разделами аренда, судьи и звук",
+             "Фестиваль ГТО", ["аренда", "судьи", "звук"]),
+            ("Нужна таблица для проекта День города, разделы: сцена, свет, звук",
+             "День города", ["сцена", "свет", "звук"]),
+            ('@sok_bot создай проект "Ремонт офиса" с разделами организация, материалы, работы',
+             "Ремонт офиса", ["организация", "материалы", "работы"]),
+            ("Начинаем проект Марафон 2024, потребуются: регистрация, питание, медики",
+             "Марафон 2024", ["регистрация", "питание", "медики"]),
+        ]
+
+        for command, name, sections in test_cases:
+            with self.subTest(command=command):
+                result = self.parser.parse_with_confidence(command)
+                self.assertEqual(result["project_name"], name)
+                self.assertEqual(result["sections"], sections)
+                self.assertGreaterEqual(result["confidence"], 0.8)
+
+    def test_ambiguous_commands_have_low_confidence(self):
+        """Тест: неполные и неоднозначные сообщения получают низкую уверенность"""
+        for command in [
+            "Создай проект Городской праздник",
+            "что такое таблица с разделами?",
+            "как сделать таблицу в excel с разделами продажи, закупки",
+            "Привет, как дела?",
+        ]:
+            with self.subTest(command=command):
+                self.assertLess(self.parser.parse_with_confidence(command)["confidence"], 0.8)
+
 if __name__ == '__main__':
     unittest.main()
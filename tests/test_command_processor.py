@@ -1,7 +1,13 @@
+import asyncio
+import time
 import pytest
 import json
+import httpx
 from unittest.mock import Mock, patch, AsyncMock
-from bot.command_processor import CommandProcessor
+from bot.command_processor import CommandProcessor, _create_telegram_client
+from bot.command_parser import CommandParser
+from bot.extraction_cache import ExtractionCache
+from bot.chat_history import ChatHistoryStore
 
 @pytest.fixture
 def mock_openai_client():
@@ -32,98 +38,302 @@ def mock_telegram_message():
         "text": 'Создай проект "Тестовый проект" с разделами организация, техника, персонал'
     }
 
-@pytest.fixture
-def mock_config():
-    return {
-        "OPENAI_API_KEY": "test-key",
-        "TELEGRAM_BOT_TOKEN": "test-token",
-        "GOOGLE_SHEETS_ID": "test-sheet-id"
+def _project_processor(create):
+    """CommandProcessor для создания таблиц: правила, кэш извлечения и моки очереди и Sheets"""
+    processor = _async_processor(create)
+    processor.extraction_cache = ExtractionCache(path='')
+    processor.command_parser = CommandParser()
+    processor.extraction_stats = {
+        "rules_hits": 0, "rules_escalations": 0, "rules_seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0
     }
+    processor.sheet_jobs = Mock(submit=Mock(return_value=0))
+    processor.sheets_api = Mock(spreadsheet_id="test-sheet-id")
+    processor.send_telegram_message = AsyncMock()
+    return processor
 
 @pytest.mark.asyncio
-async def test_extract_project_info(mock_openai_client, mock_config):
+async def test_extract_project_info(mock_openai_client):
     """Тест извлечения информации о проекте из сообщения"""
-    with patch('openai.OpenAI', return_value=mock_openai_client), \
-         patch('bot.command_processor.load_config', return_value=mock_config):
-        processor = CommandProcessor()
-        result = await processor._extract_project_info(
-            'Создай проект "Тестовый проект" с разделами организация, техника, персонал'
-        )
-        
-        assert result["project_name"] == "Тестовый проект"
-        assert result["sections"] == ["организация", "техника", "персонал"]
-        
-        # Проверяем, что был вызван правильный метод OpenAI с JSON форматом
-        mock_openai_client.chat.completions.create.assert_called_once()
-        args = mock_openai_client.chat.completions.create.call_args[1]
-        assert args["response_format"]["type"] == "json_object"
+    processor = _async_processor(mock_openai_client.chat.completions.create)
+    result = await processor._extract_project_info(
+        'Создай проект "Тестовый проект" с разделами организация, техника, персонал'
+    )
+    
+    assert result["project_name"] == "Тестовый проект"
+    assert result["sections"] == ["организация", "техника", "персонал"]
+    
+    # Проверяем, что был вызван правильный метод OpenAI с JSON форматом
+    mock_openai_client.chat.completions.create.assert_called_once()
+    args = mock_openai_client.chat.completions.create.call_args[1]
+    assert args["response_format"]["type"] == "json_object"
 
 @pytest.mark.asyncio
-async def test_process_command(mock_openai_client, mock_config):
+async def test_process_command(mock_openai_client):
     """Тест обработки команды создания проекта"""
-    with patch('openai.OpenAI', return_value=mock_openai_client), \
-         patch('bot.command_processor.load_config', return_value=mock_config), \
-         patch('bot.sheets_api.GoogleSheetsAPI.create_project_sheet_with_retry') as mock_create_sheet, \
-         patch('telegram.Bot.send_message') as mock_send:
-        
-        # Настраиваем моки
-        mock_create_sheet.return_value = "https://docs.google.com/spreadsheets/d/xxx/edit#gid=123"
-        mock_send = AsyncMock()
-        
-        processor = CommandProcessor()
-        await processor.process_command(
-            chat_id=2462754,
-            command='Создай проект "Тестовый проект" с разделами организация, техника, персонал'
-        )
-        
-        # Проверяем, что методы были вызваны с правильными параметрами
-        mock_openai_client.chat.completions.create.assert_called_once()
-        mock_create_sheet.assert_called_once_with(
-            "Тестовый проект",
-            ["организация", "техника", "персонал"]
-        )
+    processor = _project_processor(mock_openai_client.chat.completions.create)
+    answer = await processor.process_command(
+        'Создай проект "Тестовый проект" с разделами организация, техника, персонал', 2462754
+    )
+    await asyncio.sleep(0)
+    
+    # Команда разобрана правилами без ChatGPT и поставлена в очередь создания таблиц
+    assert answer == ""
+    mock_openai_client.chat.completions.create.assert_not_called()
+    processor.sheet_jobs.submit.assert_called_once_with(
+        2462754,
+        {"project_name": "Тестовый проект", "sections": ["организация", "техника", "персонал"]},
+        "test-sheet-id"
+    )
+    processor.send_telegram_message.assert_awaited_once()
 
 @pytest.mark.asyncio
-async def test_process_command_duplicate_name(mock_openai_client, mock_config):
+async def test_process_command_duplicate_name(mock_openai_client):
     """Тест обработки случая, когда лист с таким именем уже существует"""
-    with patch('openai.OpenAI', return_value=mock_openai_client), \
-         patch('bot.command_processor.load_config', return_value=mock_config), \
-         patch('bot.sheets_api.GoogleSheetsAPI.create_project_sheet_with_retry') as mock_create_sheet, \
-         patch('telegram.Bot.send_message') as mock_send:
-        
-        # Возвращаем URL с измененным именем (добавлен "-1")
-        mock_create_sheet.return_value = "https://docs.google.com/spreadsheets/d/xxx/edit#gid=123"
-        mock_send = AsyncMock()
-        
-        processor = CommandProcessor()
-        await processor.process_command(
-            chat_id=2462754,
-            command='Создай проект "Тестовый проект" с разделами организация, техника, персонал'
-        )
-        
-        # Проверяем, что методы были вызваны
-        mock_openai_client.chat.completions.create.assert_called_once()
-        mock_create_sheet.assert_called_once()
+    processor = _project_processor(mock_openai_client.chat.completions.create)
+    # Лист создан под измененным именем (добавлен "-1"), пользователь получает его ссылку
+    url = "https://docs.google.com/spreadsheets/d/xxx/edit#gid=123"
+    processor.sheets_api.create_project_sheet_async = AsyncMock(return_value=url)
+    
+    await processor._create_table_async(
+        2462754, {"project_name": "Тестовый проект", "sections": ["организация", "техника", "персонал"]}
+    )
+    
+    processor.sheets_api.create_project_sheet_async.assert_awaited_once()
+    text = processor.send_telegram_message.call_args[0][1]
+    assert "✅" in text and url in text
 
 @pytest.mark.asyncio
-async def test_process_command_extraction_failed(mock_config):
+async def test_process_command_extraction_failed():
     """Тест обработки ошибки при извлечении информации о проекте"""
-    with patch('openai.OpenAI') as mock_openai, \
-         patch('bot.command_processor.load_config', return_value=mock_config), \
-         patch('telegram.Bot.send_message') as mock_send:
-        
-        # Настраиваем мок для ошибки
-        mock_client = Mock()
-        mock_client.chat.completions.create = AsyncMock(side_effect=Exception("API Error"))
-        mock_openai.return_value = mock_client
-        mock_send = AsyncMock()
-        
-        processor = CommandProcessor()
-        await processor.process_command(
-            chat_id=2462754,
-            command='Неправильный формат команды'
-        )
-        
-        # Проверяем, что отправлено сообщение об ошибке
-        mock_client.chat.completions.create.assert_called_once()
-        assert mock_send.call_count == 1  # Должно быть отправлено сообщение об ошибке
+    create = AsyncMock(side_effect=Exception("API Error"))
+    processor = _project_processor(create)
+    
+    # Неоднозначная команда передается в ChatGPT, который отвечает ошибкой
+    answer = await processor.process_command("Сделай таблицу про праздник, там будет сцена", 2462754)
+    
+    # Проверяем, что возвращено сообщение об ошибке, а задание не поставлено
+    create.assert_called_once()
+    assert answer.startswith("Не удалось извлечь информацию о проекте")
+    processor.sheet_jobs.submit.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_send_telegram_message_reuses_pooled_client():
+    """Тест: сообщения отправляются через один долгоживущий клиент Telegram"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"ok": True})
+
+    processor = CommandProcessor()
+    processor.telegram_client = httpx.AsyncClient(
+        base_url="https://api.telegram.org/bottest-token/",
+        transport=httpx.MockTransport(handler)
+    )
+    client = processor.telegram_client
+
+    await processor.send_telegram_message(1, "первое")
+    await processor.send_telegram_message(1, "второе")
+
+    assert [r.url.path for r in requests] == ["/bottest-token/sendMessage"] * 2
+    assert json.loads(requests[1].content)["text"] == "второе"
+
+    await processor.shutdown()
+    assert client.is_closed
+    assert processor.telegram_client is None
+
+def test_create_telegram_client_limits():
+    """Тест настроек пула соединений клиента Telegram"""
+    with patch('bot.command_processor.TELEGRAM_MAX_CONNECTIONS', 7):
+        client = _create_telegram_client("test-token")
+    assert str(client.base_url) == "https://api.telegram.org/bottest-token/"
+    assert client.timeout.connect == 5
+    assert client._transport._pool._max_connections == 7
+
+def _async_processor(create):
+    """CommandProcessor с моком AsyncOpenAI без обращения к внешним сервисам"""
+    processor = CommandProcessor()
+    processor.openai_client = Mock()
+    processor.openai_client.chat.completions.create = create
+    processor.openai_semaphore = asyncio.Semaphore(2)
+    processor.openai_stats = {"calls": 0, "errors": 0, "timeouts": 0, "in_flight": 0, "waiting": 0}
+    processor.chat_history = ChatHistoryStore()
+    processor.prompt_stats = {"requests": 0, "prompt_tokens": 0, "max_prompt_tokens": 0,
+                              "trimmed_messages": 0, "summaries": 0}
+    return processor
+
+@pytest.mark.asyncio
+async def test_chats_answered_concurrently_within_limit():
+    """Тест: запросы разных чатов к OpenAI выполняются параллельно в пределах лимита"""
+    in_flight = 0
+    peak = 0
+
+    async def create(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return Mock(choices=[Mock(message=Mock(content="ответ"))])
+
+    processor = _async_processor(create)
+    started = time.monotonic()
+    answers = await asyncio.gather(*(
+        processor.process_command("как дела?", chat_id) for chat_id in range(4)
+    ))
+
+    assert answers == ["ответ"] * 4
+    assert peak == 2
+    assert time.monotonic() - started < 0.2
+    assert processor.openai_stats["calls"] == 4
+    assert processor.openai_stats["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_openai_timeout_returns_error_message():
+    """Тест: зависший запрос к OpenAI прерывается по таймауту"""
+    async def create(**kwargs):
+        await asyncio.sleep(1)
+
+    processor = _async_processor(create)
+    with patch('bot.command_processor.OPENAI_REQUEST_TIMEOUT', 0.01):
+        answer = await processor._chat_with_ai("как дела?", 1)
+
+    assert answer.startswith("К сожалению")
+    assert processor.openai_stats["timeouts"] == 1
+
+def _stream(*parts):
+    """Мок потока OpenAI из заданных фрагментов текста"""
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+
+        async def chunks():
+            for part in parts:
+                # Как и настоящий поток, между фрагментами отдаем управление циклу событий
+                await asyncio.sleep(0)
+                yield Mock(choices=[Mock(delta=Mock(content=part))])
+        return chunks()
+    return create
+
+def _bot_api_recorder(processor):
+    calls = []
+
+    async def call_bot_api(method, params):
+        calls.append((method, dict(params)))
+        return {"message_id": len(calls)}
+
+    processor._call_bot_api = call_bot_api
+    processor.stream_stats = {"messages": 0, "edits": 0, "throttled": 0}
+    return calls
+
+@pytest.mark.asyncio
+async def test_stream_reply_sends_first_tokens_then_throttled_edits():
+    """Тест: первые токены отправляются сразу, остальные - одной правкой в пределах интервала"""
+    processor = _async_processor(_stream("Привет", ", ", "мир", "!"))
+    calls = _bot_api_recorder(processor)
+
+    with patch('bot.command_processor.TELEGRAM_EDIT_INTERVAL', 100):
+        await processor._stream_chat_with_ai("привет", 1)
+
+    assert calls == [
+        ("sendMessage", {"chat_id": 1, "text": "Привет"}),
+        ("editMessageText", {"chat_id": 1, "message_id": 1, "text": "Привет, мир!"}),
+    ]
+    assert (await processor.chat_history.get(1))[-1] == {"role": "assistant", "content": "Привет, мир!"}
+
+@pytest.mark.asyncio
+async def test_stream_reply_continues_in_new_message_over_limit():
+    """Тест: текст длиннее лимита Telegram продолжается в новом сообщении"""
+    processor = _async_processor(_stream("0123456789", "abcdef"))
+    calls = _bot_api_recorder(processor)
+
+    with patch('bot.command_processor.TELEGRAM_EDIT_INTERVAL', 0), \
+         patch('bot.command_processor.TELEGRAM_MESSAGE_LIMIT', 10):
+        await processor._stream_chat_with_ai("привет", 1)
+
+    assert [(method, params["text"]) for method, params in calls] == [
+        ("sendMessage", "0123456789"),
+        ("sendMessage", "abcdef"),
+    ]
+
+@pytest.mark.asyncio
+async def test_stream_reply_releases_openai_slot_before_telegram_waits():
+    """Тест: медленный Telegram не задерживает чтение потока и не держит место в лимите OpenAI"""
+    processor = _async_processor(_stream("Привет", ", ", "мир", "!"))
+    in_flight = []
+
+    async def call_bot_api(method, params):
+        in_flight.append((method, processor.openai_stats["in_flight"]))
+        await asyncio.sleep(0.1)
+        return {"message_id": 1}
+
+    processor._call_bot_api = call_bot_api
+    processor.stream_stats = {"messages": 0, "edits": 0, "throttled": 0}
+
+    with patch('bot.command_processor.TELEGRAM_EDIT_INTERVAL', 100):
+        await processor._stream_chat_with_ai("привет", 1)
+
+    # Первое сообщение отправлено во время чтения потока, итоговая правка - после освобождения места
+    assert in_flight == [("sendMessage", 1), ("editMessageText", 0)]
+    assert processor.openai_stats["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_stream_reply_empty_completion_sends_fallback():
+    """Тест: пустой потоковый ответ заменяется сообщением об ошибке"""
+    processor = _async_processor(_stream("", " "))
+    calls = _bot_api_recorder(processor)
+    processor.send_telegram_message = AsyncMock()
+
+    await processor._stream_chat_with_ai("привет", 1)
+
+    assert calls == []
+    processor.send_telegram_message.assert_awaited_once()
+    assert processor.send_telegram_message.call_args[0][1].startswith("К сожалению")
+
+@pytest.mark.asyncio
+async def test_stream_reply_falls_back_to_send_after_throttled_final_edits(caplog):
+    """Тест: если итоговую правку трижды ограничили, ответ отправляется новым сообщением"""
+    processor = _async_processor(_stream("Привет", ", мир!"))
+    calls = []
+    throttled = httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 0}},
+                               request=httpx.Request("POST", "https://api.telegram.org/editMessageText"))
+
+    async def call_bot_api(method, params):
+        calls.append((method, params["text"]))
+        if method == "editMessageText":
+            raise httpx.HTTPStatusError("429", request=throttled.request, response=throttled)
+        return {"message_id": len(calls)}
+
+    processor._call_bot_api = call_bot_api
+    processor.stream_stats = {"messages": 0, "edits": 0, "throttled": 0}
+
+    with patch('bot.command_processor.TELEGRAM_EDIT_INTERVAL', 100):
+        await processor._stream_chat_with_ai("привет", 1)
+
+    assert calls == [("sendMessage", "Привет")] + [("editMessageText", "Привет, мир!")] * 3 + \
+        [("sendMessage", "Привет, мир!")]
+    assert processor.stream_stats["throttled"] == 3
+    assert "итоговую правку" in caplog.text
+
+@pytest.mark.asyncio
+async def test_rules_tier_skips_llm_for_confident_commands():
+    """Тест: уверенно разобранная команда не вызывает ChatGPT, неоднозначная - вызывает"""
+    processor = CommandProcessor()
+    processor.extraction_cache = ExtractionCache(path='')
+    processor.command_parser = CommandParser()
+    processor.extraction_stats = {
+        "rules_hits": 0, "rules_escalations": 0, "rules_seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0
+    }
+    processor._extract_project_info = AsyncMock(return_value={"project_name": "Праздник", "sections": ["сцена"]})
+
+    result = await processor._get_project_info("Создай проект Фестиваль ГТО с разделами аренда, судьи и звук")
+    assert result == {"project_name": "Фестиваль ГТО", "sections": ["аренда", "судьи", "звук"]}
+    processor._extract_project_info.assert_not_awaited()
+
+    await processor._get_project_info("Хочу таблицу про праздник, там будет сцена")
+    processor._extract_project_info.assert_awaited_once()
+
+    stats = processor.get_stats()["extraction"]
+    assert stats["rules_hits"] == 1
+    assert stats["rules_escalations"] == 1
+    assert stats["llm_calls"] == 1
+    assert stats["llm_calls_saved"] == 1
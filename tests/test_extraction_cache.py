@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+from bot.command_processor import CommandProcessor
+from bot.command_parser import CommandParser
+from bot.extraction_cache import ExtractionCache, normalize_message
+
+RESULT = {"project_name": "День города", "sections": ["сцена", "звук"]}
+
+def test_normalize_message():
+    """Тест нормализации: регистр, пробелы и упоминание бота"""
+    assert normalize_message("@SokProjectBot  Создай\tтаблицу\n День ГОРОДА ") == "создай таблицу день города"
+
+def test_cache_lru_and_ttl():
+    """Тест вытеснения по размеру и истечения TTL"""
+    clock = [1000.0]
+    with patch('bot.extraction_cache.time.time', side_effect=lambda: clock[0]):
+        cache = ExtractionCache(max_size=2, ttl=60, path='')
+        cache.put("a", {"n": 1})
+        cache.put("b", {"n": 2})
+        assert cache.get("A") == {"n": 1}
+        cache.put("c", {"n": 3})
+        assert cache.get("b") is None
+        assert cache.get("a") == {"n": 1}
+
+        clock[0] += 61
+        assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+
+def test_cache_persists_between_instances(tmp_path):
+    """Тест сохранения кэша на диск и загрузки после перезапуска"""
+    path = str(tmp_path / "extraction_cache.json")
+    cache = ExtractionCache(path=path)
+    cache.put("Создай таблицу День города", RESULT)
+    cache.save()
+
+    restored = ExtractionCache(path=path)
+    restored.load()
+    assert restored.get("создай  таблицу день города") == RESULT
+
+@pytest.mark.asyncio
+async def test_repeated_message_skips_llm():
+    """Тест: повторное сообщение не вызывает извлечение через GPT"""
+    processor = CommandProcessor()
+    processor.extraction_cache = ExtractionCache(path='')
+    processor.command_parser = CommandParser()
+    processor.extraction_stats = {
+        "rules_hits": 0, "rules_escalations": 0, "rules_seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0
+    }
+    processor._extract_project_info = AsyncMock(return_value=dict(RESULT))
+
+    assert await processor._get_project_info("Создай таблицу День города") == RESULT
+    assert await processor._get_project_info("создай таблицу  день города") == RESULT
+    processor._extract_project_info.assert_awaited_once()
+
+    # Неудачное извлечение не кэшируется
+    processor._extract_project_info = AsyncMock(return_value={})
+    assert await processor._get_project_info("что-то другое") == {}
+    assert await processor._get_project_info("что-то другое") == {}
+    assert processor._extract_project_info.await_count == 2
@@ -0,0 +1,27 @@
+import pytest
+from bot.intent_matcher import IntentMatcher
+
+@pytest.mark.parametrize("message, intent, rule", [
+    ("Сделай таблицу для проекта День города", "create_table", "create_keyword"),
+    ('Создай проект "Ремонт офиса" с разделами организация, материалы', "create_table", "project_with_sections"),
+    ("Нужна таблица для проекта День города, разделы: сцена, свет", "create_table", "table_with_sections"),
+    ("Нужна ТАБЛИЦА, секции: сцена, свет", "create_table", "table_with_sections"),
+    ("У нас проект Марафон, разделы: регистрация", "create_table", "project_with_sections"),
+    ("прект корпоратив, разделы: ведущий", "create_table", "project_typo_with_sections"),
+    ("прект корпоратив, секции: ведущий", "chat", "default"),
+    ("Что такое проект?", "chat", "question_about_project"),
+    ("Что такое таблица с разделами?", "create_table", "table_with_sections"),
+    ("Что ты умеешь?", "help", "help_keyword"),
+    ("Что значит команды?", "help", "help_keyword"),
+    ("Привет! Как дела?", "chat", "default"),
+    ("", "chat", "default"),
+])
+def test_classify_reports_intent_and_rule(message, intent, rule):
+    """Тест: тип запроса и сработавшее правило совпадают с прежней цепочкой проверок"""
+    assert IntentMatcher().classify(message) == (intent, rule)
+
+def test_overlapping_keywords_are_all_found():
+    """Тест: ключевое слово внутри другого найденного фрагмента не теряется"""
+    # "расскажи о" заканчивается на первую букву "организуй таблицу"
+    assert IntentMatcher().classify("расскажи организуй таблицу") == ("create_table", "create_keyword")
+    assert IntentMatcher().classify("таблицу к проекту, разделы: звук") == ("create_table", "create_keyword")
@@ -0,0 +1,98 @@
+import io
+import json
+import logging
+import threading
+import httpx
+import pytest
+from unittest.mock import patch
+import app as app_module
+from bot.log_setup import JsonFormatter, setup_logging, stop_logging, should_log_body
+from bot.update_dedup import UpdateDeduplicator
+
+def test_json_formatter_single_line_with_fields():
+    """Тест: запись форматируется в одну JSON-строку с дополнительными полями"""
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "Обновление %s", (5,), None)
+    record.fields = {"update_id": 5, "ms": 1.5}
+    line = JsonFormatter().format(record)
+
+    assert "\n" not in line
+    data = json.loads(line)
+    assert data["msg"] == "Обновление 5"
+    assert data["update_id"] == 5 and data["level"] == "INFO"
+
+def test_queued_handlers_write_from_listener_thread():
+    """Тест: с очередью запись выполняет отдельный поток, после остановки обработчики возвращаются"""
+    written = []
+
+    class ThreadRecorder(logging.Handler):
+        def emit(self, record):
+            written.append((threading.current_thread(), self.format(record)))
+
+    target = logging.getLogger("test_log_setup.queued")
+    handler = ThreadRecorder()
+    target.addHandler(handler)
+    target.setLevel(logging.INFO)
+    try:
+        setup_logging(log_format="json", use_queue=True)
+        assert handler not in target.handlers
+        target.info("сообщение %s", {"a": 1})
+    finally:
+        stop_logging()
+
+    assert handler in target.handlers
+    assert len(written) == 1
+    thread, line = written[0]
+    assert thread is not threading.current_thread()
+    assert json.loads(line)["msg"] == "сообщение {'a': 1}"
+    target.removeHandler(handler)
+
+def test_body_logged_on_debug_or_sampled():
+    """Тест: тело обновления пишется на уровне DEBUG или для выборки обновлений"""
+    target = logging.getLogger("test_log_setup.body")
+    target.setLevel(logging.INFO)
+    assert not should_log_body(target, sample_rate=0)
+    assert should_log_body(target, sample_rate=1)
+    target.setLevel(logging.DEBUG)
+    assert should_log_body(target, sample_rate=0)
+
+@pytest.mark.asyncio
+async def test_webhook_logs_one_line_per_update():
+    """Тест: на обновление приходится одна строка лога без заголовков и тела"""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    app_module.logger.addHandler(handler)
+    app_module.logger.setLevel(logging.INFO)
+
+    class Processor:
+        async def process_message(self, message):
+            pass
+
+    update = {
+        "update_id": 77,
+        "message": {
+            "message_id": 1,
+            "from": {"id": 5, "is_bot": False, "first_name": "Test"},
+            "chat": {"id": 5, "type": "private"},
+            "date": 1740700549,
+            "text": "привет"
+        }
+    }
+    transport = httpx.ASGITransport(app=app_module.app)
+    try:
+        with patch.object(app_module, 'command_processor', Processor()), \
+             patch.object(app_module, 'update_dedup', UpdateDeduplicator()):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post("/webhook", json=update)
+    finally:
+        app_module.logger.removeHandler(handler)
+        app_module.logger.setLevel(logging.NOTSET)
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["update_id"] == 77
+    assert lines[0]["chat_id"] == 5
+    assert lines[0]["text_len"] == 6
+    assert lines[0]["outcome"] == "processed"
+    assert "привет" not in lines[0]["msg"]
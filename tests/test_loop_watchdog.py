@@ -0,0 +1,69 @@
+import time
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+import app as app_module
+from bot.loop_watchdog import LoopWatchdog
+
+def blocking_call(seconds: float) -> None:
+    time.sleep(seconds)
+
+@pytest.mark.asyncio
+async def test_measures_lag_without_blocks():
+    """Тест: пульс собирает задержку цикла, без блокировок стек не пишется"""
+    watchdog = LoopWatchdog(interval=0.01, threshold=0.2)
+    await watchdog.start()
+    await asyncio.sleep(0.1)
+    await watchdog.stop()
+
+    stats = watchdog.stats()
+    assert not stats["enabled"]
+    assert stats["samples"] >= 3
+    assert stats["blocks"] == 0
+    assert stats["last_block"] is None
+    assert set(watchdog.lag_percentiles()) == {0.5, 0.9, 0.99}
+
+@pytest.mark.asyncio
+async def test_reports_stack_of_blocking_call():
+    """Тест: блокировка цикла дольше порога записывается один раз со стеком вызова"""
+    watchdog = LoopWatchdog(interval=0.01, threshold=0.05)
+    await watchdog.start()
+    await asyncio.sleep(0.03)
+    blocking_call(0.3)
+    await asyncio.sleep(0.05)
+    await watchdog.stop()
+
+    stats = watchdog.stats()
+    assert stats["blocks"] == 1
+    assert "blocking_call" in stats["last_block"]["stack"]
+    # После окончания блокировки записана ее полная длительность
+    assert stats["last_block"]["blocked_ms"] >= 250
+    assert stats["lag_max_ms"] >= 250
+
+@pytest.mark.asyncio
+async def test_endpoint_toggles_watchdog_and_exposes_metrics():
+    """Тест: /debug/loop-watchdog включает сторож на лету, перцентили видны в /metrics"""
+    watchdog = LoopWatchdog(interval=0.01, threshold=0.5)
+    transport = httpx.ASGITransport(app=app_module.app)
+    with patch.object(app_module, 'loop_watchdog', watchdog), \
+         patch.object(app_module, 'WEBHOOK_SECRET', None):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/debug/loop-watchdog", json={"enabled": True, "threshold_ms": 100})
+            assert response.status_code == 200
+            assert response.json()["enabled"]
+            assert watchdog.threshold == 0.1
+
+            await asyncio.sleep(0.05)
+            metrics = (await client.get("/metrics")).text
+            assert 'bot_event_loop_lag_seconds{quantile="0.99"}' in metrics
+            assert "bot_loop_watchdog_enabled 1" in metrics
+
+            response = await client.post("/debug/loop-watchdog", json={"enabled": False})
+            assert not response.json()["enabled"]
+            metrics = (await client.get("/metrics")).text
+            assert "bot_event_loop_lag_seconds{" not in metrics
+
+            response = await client.post("/debug/loop-watchdog", json={"enabled": True, "threshold_ms": 0})
+            assert response.status_code == 400
+    assert not watchdog.enabled
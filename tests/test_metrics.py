@@ -0,0 +1,93 @@
+import httpx
+import pytest
+from unittest.mock import Mock, patch
+import app as app_module
+from bot.metrics import MetricsRegistry, SHEETS_CALL_SECONDS, SHEETS_ERRORS, percentile
+from bot.rate_limiter import SheetsRateLimiter
+from bot.sheets_api import GoogleSheetsAPI
+from bot.update_dedup import UpdateDeduplicator
+
+def test_histogram_renders_cumulative_buckets():
+    """Тест: гистограмма выводится в формате Prometheus с накопительными корзинами"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Тест", ["site"], buckets=(0.1, 1))
+    histogram.observe(0.05, site="chat")
+    histogram.observe(0.5, site="chat")
+    histogram.observe(5, site="chat")
+
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{site="chat",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{site="chat",le="1"} 2' in text
+    assert 'test_seconds_bucket{site="chat",le="+Inf"} 3' in text
+    assert 'test_seconds_sum{site="chat"} 5.55' in text
+    assert 'test_seconds_count{site="chat"} 3' in text
+
+def test_counter_and_callback_gauge():
+    """Тест: счетчик с метками и показатель, вычисляемый при чтении"""
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Тест", ["status"])
+    counter.inc(status="429")
+    counter.inc(2, status="429")
+    registry.gauge("test_depth", "Тест", ["queue"], func=lambda: {("updates",): 4})
+
+    text = registry.render()
+    assert 'test_total{status="429"} 3' in text
+    assert 'test_depth{queue="updates"} 4' in text
+    with pytest.raises(ValueError):
+        counter.inc(kind="x")
+
+def test_percentile_interpolates():
+    """Тест: перцентили считаются с интерполяцией между соседними значениями"""
+    assert percentile([], 95) == 0.0
+    assert percentile([5], 50) == 5
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile(list(range(101)), 95) == 95
+
+def test_sheets_calls_timed_by_method():
+    """Тест: вызовы Sheets API учитываются по имени метода, ошибки - отдельно"""
+    api = object.__new__(GoogleSheetsAPI)
+    api.credentials = None
+    api.rate_limiter = SheetsRateLimiter(max_retries=0)
+    request = Mock(method="POST", methodId="sheets.spreadsheets.batchUpdate")
+    request.execute.return_value = {}
+    before = SHEETS_CALL_SECONDS.count(method="sheets.spreadsheets.batchUpdate")
+
+    api._execute(request)
+    request.execute.side_effect = RuntimeError("сбой")
+    with pytest.raises(RuntimeError):
+        api._execute(request)
+
+    assert SHEETS_CALL_SECONDS.count(method="sheets.spreadsheets.batchUpdate") == before + 2
+    assert SHEETS_ERRORS.value(method="sheets.spreadsheets.batchUpdate") >= 1
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_webhook_latency():
+    """Тест: /metrics отдает гистограмму обработки webhook и глубину очередей"""
+    class Processor:
+        sheet_jobs = Mock(stats=Mock(return_value={"depth": 2, "in_progress": 1, "failed": 0, "rejected": 0}))
+
+        async def process_message(self, message):
+            pass
+
+    update = {
+        "update_id": 501,
+        "message": {
+            "message_id": 1,
+            "from": {"id": 5, "is_bot": False, "first_name": "Test"},
+            "chat": {"id": 5, "type": "private"},
+            "date": 1740700549,
+            "text": "привет"
+        }
+    }
+    transport = httpx.ASGITransport(app=app_module.app)
+    with patch.object(app_module, 'command_processor', Processor()), \
+         patch.object(app_module, 'update_dedup', UpdateDeduplicator()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/webhook", json=update)
+            response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'bot_webhook_seconds_count{outcome="processed"}' in response.text
+    assert 'bot_queue_depth{queue="sheet_jobs"} 2' in response.text
@@ -0,0 +1,112 @@
+import httplib2
+import pytest
+from unittest.mock import Mock, patch
+from googleapiclient.errors import HttpError
+from bot.rate_limiter import SheetsRateLimiter, SharedTokenBucket, TokenBucket
+from bot.state_backend import SQLiteStateBackend
+
+def _http_error(status, retry_after=None):
+    headers = {'status': str(status)}
+    if retry_after is not None:
+        headers['retry-after'] = str(retry_after)
+    return HttpError(httplib2.Response(headers), b'{}')
+
+def test_token_bucket_waits_when_empty():
+    """Тест ожидания токена при пустом bucket"""
+    clock = [0.0]
+
+    def sleep(delay):
+        clock[0] += delay
+
+    with patch('bot.rate_limiter.time.monotonic', side_effect=lambda: clock[0]), \
+         patch('bot.rate_limiter.time.sleep', side_effect=sleep) as mock_sleep:
+        bucket = TokenBucket(capacity=2, rate=8)
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(0.125)
+    mock_sleep.assert_called_once()
+
+def test_retries_quota_errors_with_retry_after():
+    """Тест повтора 429 с учетом Retry-After"""
+    limiter = SheetsRateLimiter(read_quota=600, write_quota=600, max_retries=3)
+    call = Mock(side_effect=[_http_error(429, retry_after=7), _http_error(503), {'ok': True}])
+
+    with patch('bot.rate_limiter.time.sleep') as mock_sleep:
+        assert limiter.execute(call, 'read') == {'ok': True}
+
+    delays = [c.args[0] for c in mock_sleep.call_args_list]
+    assert delays[0] >= 7
+    assert 0 <= delays[1] <= 2
+    stats = limiter.stats()
+    assert stats['read_calls'] == 3
+    assert stats['retries'] == 2
+    assert stats['errors_by_status'] == {429: 1, 503: 1}
+
+def test_gives_up_after_max_retries_and_skips_client_errors():
+    """Тест: после исчерпания повторов и при ошибках 4xx исключение пробрасывается"""
+    limiter = SheetsRateLimiter(read_quota=600, write_quota=600, max_retries=2)
+
+    with patch('bot.rate_limiter.time.sleep'), pytest.raises(HttpError):
+        limiter.execute(Mock(side_effect=_http_error(500)), 'read')
+    assert limiter.stats()['read_calls'] == 3
+
+    call = Mock(side_effect=_http_error(400))
+    with pytest.raises(HttpError):
+        limiter.execute(call, 'read')
+    assert call.call_count == 1
+    assert limiter.stats()['failures'] == 2
+
+def test_writes_retried_only_on_quota_errors():
+    """Тест: запись повторяется при 429, но не при 5xx"""
+    limiter = SheetsRateLimiter(read_quota=600, write_quota=600, max_retries=3)
+
+    call = Mock(side_effect=[_http_error(429), {'ok': True}])
+    with patch('bot.rate_limiter.time.sleep'):
+        assert limiter.execute(call, 'write') == {'ok': True}
+    assert call.call_count == 2
+
+    call = Mock(side_effect=_http_error(503))
+    with patch('bot.rate_limiter.time.sleep'), pytest.raises(HttpError):
+        limiter.execute(call, 'write')
+    assert call.call_count == 1
+
+def test_invalid_quota_rejected():
+    """Тест проверки квот: скорость пополнения всегда положительна"""
+    with pytest.raises(ValueError):
+        SheetsRateLimiter(read_quota=0)
+    limiter = SheetsRateLimiter(read_quota=1, write_quota=1)
+    assert limiter.buckets['read'].rate > 0
+
+def test_shared_quota_spent_by_all_workers(tmp_path):
+    """Тест: после share_quota ограничители двух воркеров расходуют одну квоту"""
+    path = str(tmp_path / "state.db")
+    clock = [1000.0]
+
+    def sleep(delay):
+        clock[0] += delay
+
+    first = SheetsRateLimiter(read_quota=120, write_quota=120, burst=1)
+    second = SheetsRateLimiter(read_quota=120, write_quota=120, burst=1)
+    first.share_quota(SQLiteStateBackend(path))
+    second.share_quota(SQLiteStateBackend(path))
+    assert isinstance(second.buckets['write'], SharedTokenBucket)
+    assert second.stats()['shared_quota']
+
+    with patch('bot.state_backend.time.time', side_effect=lambda: clock[0]), \
+         patch('bot.rate_limiter.time.sleep', side_effect=sleep):
+        first.execute(Mock(return_value={}), kind='write')
+        second.execute(Mock(return_value={}), kind='write')
+
+    # Запас на всплеск - 1 запрос, дальше 119 запросов в минуту на оба воркера
+    assert first.stats()['throttled_seconds'] == 0
+    assert second.stats()['throttled_seconds'] == pytest.approx(60 / 119, abs=1e-3)
+
+def test_shared_quota_falls_back_to_local_bucket():
+    """Тест: при ошибке общего хранилища квота соблюдается локальным bucket"""
+    backend = Mock(persistent=True)
+    backend.take_token.side_effect = RuntimeError("database is locked")
+    limiter = SheetsRateLimiter(read_quota=600, write_quota=600)
+    limiter.share_quota(backend)
+
+    assert limiter.execute(Mock(return_value={'ok': True})) == {'ok': True}
+    assert limiter.buckets['read'].local._tokens < limiter.buckets['read'].capacity
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from bot.sheet_jobs import SheetJobQueue, QueueFullError
+from bot.state_backend import SQLiteStateBackend
+
+@pytest.mark.asyncio
+async def test_queue_limits_concurrency_and_reports_position():
+    """Тест ограничения параллелизма и позиции в очереди"""
+    release = asyncio.Event()
+    running = []
+    peak = 0
+
+    async def handler(job):
+        nonlocal peak
+        running.append(job["chat_id"])
+        peak = max(peak, len(running))
+        await release.wait()
+        running.remove(job["chat_id"])
+
+    queue = SheetJobQueue(handler, workers=3, max_size=3, per_spreadsheet_limit=2)
+    await queue.start()
+
+    assert queue.submit(1, {}, "main") == 0
+    assert queue.submit(2, {}, "main") == 0
+    await asyncio.sleep(0)
+    # Третий обработчик свободен, но лимит на таблицу - 2 задания
+    assert queue.submit(3, {}, "main") == 1
+    assert queue.submit(4, {}, "main") == 2
+    # Задание другой таблицы не ждет за заданиями, упершимися в лимит
+    assert queue.submit(5, {}, "other") == 0
+    await asyncio.sleep(0.01)
+    assert sorted(running) == [1, 2, 5]
+    assert peak == 3
+    assert queue.stats()["in_progress"] == 3
+
+    assert queue.submit(6, {}, "main") == 3
+    with pytest.raises(QueueFullError):
+        queue.submit(7, {}, "main")
+
+    release.set()
+    await queue.stop()
+
+    stats = queue.stats()
+    assert stats["completed"] == 6
+    assert stats["rejected"] == 1
+    assert stats["depth"] == 0
+    assert stats["in_progress"] == 0
+
+@pytest.mark.asyncio
+async def test_queue_counts_failures():
+    """Тест: ошибка в задании не останавливает обработчик"""
+    async def handler(job):
+        if job["chat_id"] == 1:
+            raise RuntimeError("boom")
+
+    queue = SheetJobQueue(handler, workers=1, max_size=10)
+    await queue.start()
+    queue.submit(1, {}, "main")
+    queue.submit(2, {}, "main")
+    await queue.stop()
+
+    stats = queue.stats()
+    assert stats["failed"] == 1
+    assert stats["completed"] == 1
+
+@pytest.mark.asyncio
+async def test_spreadsheet_limit_shared_between_workers(tmp_path):
+    """Тест: лимит заданий на таблицу действует на очереди всех воркеров через общее хранилище"""
+    path = str(tmp_path / "state.db")
+    release = asyncio.Event()
+    running = []
+    peak = 0
+
+    async def handler(job):
+        nonlocal peak
+        running.append(job["chat_id"])
+        peak = max(peak, len(running))
+        await release.wait()
+        running.remove(job["chat_id"])
+
+    queues = [
+        SheetJobQueue(handler, workers=2, per_spreadsheet_limit=1, backend=SQLiteStateBackend(path),
+                      owner=f"w{index}", slot_poll_interval=0.01)
+        for index in range(2)
+    ]
+    for queue in queues:
+        await queue.start()
+    queues[0].submit(1, {}, "main")
+    queues[1].submit(2, {}, "main")
+    await asyncio.sleep(0.1)
+
+    assert len(running) == 1
+    assert sum(queue.stats()["slot_waits"] for queue in queues) >= 1
+
+    release.set()
+    for queue in queues:
+        await queue.stop(timeout=5)
+    assert peak == 1
+    assert sum(queue.stats()["completed"] for queue in queues) == 2
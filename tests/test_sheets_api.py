@@ -1,13 +1,13 @@
+import itertools
+import json
+import threading
+import httplib2
 import pytest
-from unittest.mock import Mock, patch, AsyncMock
-from bot.sheets_api import GoogleSheetsAPI
-
-@pytest.fixture
-def mock_config():
-    return {
-        "GOOGLE_SHEETS_ID": "test-sheet-id",
-        "GOOGLE_CREDENTIALS_FILE": "test-credentials.json"
-    }
+from googleapiclient.errors import HttpError
+from unittest.mock import Mock, patch
+from bot.rate_limiter import SheetsRateLimiter
+from bot.sheets_api import GoogleSheetsAPI, SheetTitleIndex, _shift_formula_rows
+from bot.sheets_trace import SheetsTrace
 
 @pytest.fixture
 def mock_sheets_service():
@@ -21,12 +21,10 @@ def mock_sheets_service():
     return mock_service
 
 @pytest.fixture
-def mock_sheets_api(mock_config):
-    with patch('bot.sheets_api.load_config', return_value=mock_config), \
-         patch('google.oauth2.service_account.Credentials.from_service_account_file'):
-        api = GoogleSheetsAPI()
-        api.spreadsheet_id = 'test_spreadsheet_id'
-        return api
+def mock_sheets_api(project_config):
+    api = GoogleSheetsAPI()
+    api.spreadsheet_id = 'test_spreadsheet_id'
+    return api
 
 def test_get_unique_sheet_name(mock_sheets_service, mock_sheets_api):
     """Тест генерации уникального имени листа"""
@@ -39,7 +37,8 @@ def test_get_unique_sheet_name(mock_sheets_service, mock_sheets_api):
         name = mock_sheets_api._get_unique_sheet_name("Существующий проект")
         assert name == "Существующий проект-1"
         
-        # Тест 3: Имя с суффиксом тоже занято
+        # Тест 3: Имя с суффиксом тоже занято (индекс названий перечитывается)
+        mock_sheets_api.title_index.invalidate()
         mock_sheets_service.spreadsheets().get().execute.return_value = {
             'sheets': [
                 {'properties': {'title': 'Тест', 'sheetId': '123'}},
@@ -60,41 +59,372 @@ def test_get_sheet_info(mock_sheets_service, mock_sheets_api):
         info = mock_sheets_api.get_sheet_info('999')
         assert info is None
 
-@pytest.mark.asyncio
-async def test_create_project_sheet_with_retry(mock_sheets_api):
+def test_create_project_sheet_with_retry(project_config):
     """Тест создания листа проекта с повторными попытками"""
-    mock_service = Mock()
-    
-    # Настраиваем мок для успешного создания листа
-    mock_service.spreadsheets().get().execute.return_value = {'sheets': []}
-    mock_service.spreadsheets().batchUpdate().execute.return_value = {
-        'replies': [{'addSheet': {'properties': {'sheetId': '789'}}}]
-    }
-    mock_service.spreadsheets().values().update().execute = AsyncMock()
-    
-    with patch.object(mock_sheets_api, 'service', mock_service):
-        # Тест успешного создания
-        url = await mock_sheets_api.create_project_sheet_with_retry(
-            "Новый проект",
-            ["Раздел 1", "Раздел 2"]
-        )
-        assert url is not None
-        assert "789" in url
-        
-        # Проверяем вызовы методов
-        mock_service.spreadsheets().batchUpdate.assert_called_once()
-        mock_service.spreadsheets().values().update.assert_called()
+    api, mock_service = _templates_api()
 
-@pytest.mark.asyncio
-async def test_create_project_sheet_error_handling(mock_sheets_api):
+    # Тест успешного создания
+    url = api.create_project_sheet_with_retry("Новый проект", ["Раздел 1", "Раздел 2"])
+    assert url is not None
+    assert "789" in url
+
+    # Проверяем вызовы методов: копия шаблона и одна запись всех разделов
+    mock_service.spreadsheets().sheets().copyTo.assert_called()
+    mock_service.spreadsheets().batchUpdate.assert_called_once()
+
+def test_create_project_sheet_error_handling(project_config):
     """Тест обработки ошибок при создании листа"""
-    mock_service = Mock()
+    api, mock_service = _templates_api()
     mock_service.spreadsheets().batchUpdate.side_effect = Exception("Service error")
-    
-    with patch.object(mock_sheets_api, 'service', mock_service), \
-         pytest.raises(Exception) as exc_info:
-        await mock_sheets_api.create_project_sheet_with_retry(
-            "Проблемный проект",
-            ["Раздел 1"]
-        )
-    assert "Service error" in str(exc_info.value)
+
+    assert api.create_project_sheet_with_retry("Проблемный проект", ["Раздел 1"]) is None
+
+@pytest.fixture
+def project_config(tmp_path, monkeypatch):
+    """Рабочая директория с client_secrets.json и credentials.json"""
+    credentials_dir = tmp_path / 'credentials'
+    credentials_dir.mkdir()
+    (credentials_dir / 'credentials.json').write_text('{}')
+    (credentials_dir / 'client_secrets.json').write_text(json.dumps({
+        'installed': {
+            'main_sheet': 'main',
+            'template_top': 'top',
+            'template_section': 'section'
+        }
+    }))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def _template_sheet(sheet_id, rows, merges=None):
+    """Лист шаблона в формате ответа spreadsheets().get с includeGridData"""
+    return {'sheets': [{
+        'properties': {'sheetId': sheet_id, 'title': 'Шаблон',
+                       'gridProperties': {'rowCount': 1000, 'columnCount': 26}},
+        'merges': merges or [],
+        'data': [{'rowData': [{'values': row} for row in rows]}]
+    }]}
+
+TOP_TEMPLATE = _template_sheet(11, [
+    [{'userEnteredValue': {'stringValue': 'Проект'}}],
+    [{'userEnteredValue': {'stringValue': 'Итого'}}],
+    [{'userEnteredValue': {'stringValue': 'Статья'}}],
+])
+
+SECTION_TEMPLATE = _template_sheet(22, [
+    [{'userEnteredValue': {'stringValue': 'Раздел {sectionName}'},
+      'userEnteredFormat': {'textFormat': {'bold': True}}},
+     {}, {}, {}, {'userEnteredValue': {'formulaValue': '=SUM(E2:E3)'}}],
+    [{'userEnteredValue': {'stringValue': 'Позиция'}}],
+    [{'userEnteredValue': {'numberValue': 1}}],
+], merges=[{'sheetId': 22, 'startRowIndex': 0, 'endRowIndex': 1,
+            'startColumnIndex': 0, 'endColumnIndex': 4}])
+
+def _templates_api():
+    """GoogleSheetsAPI с моком сервиса, отдающим шаблоны по ID таблицы"""
+    mock_service = Mock()
+    templates = {'top': TOP_TEMPLATE, 'section': SECTION_TEMPLATE}
+
+    def get(spreadsheetId, **kwargs):
+        request = Mock()
+        request.execute.return_value = templates.get(spreadsheetId, {'sheets': []})
+        return request
+
+    mock_service.spreadsheets().get.side_effect = get
+    sheet_ids = itertools.count(789)
+    mock_service.spreadsheets().sheets().copyTo().execute.side_effect = \
+        lambda: {'sheetId': next(sheet_ids), 'title': 'Копия Шаблон'}
+
+    api = GoogleSheetsAPI()
+    api.spreadsheet_id = 'main'
+    api.service = mock_service
+    return api, mock_service
+
+def test_shift_formula_rows():
+    """Тест сдвига относительных ссылок в формулах"""
+    assert _shift_formula_rows('=SUM(E2:E3)', 10) == '=SUM(E12:E13)'
+    assert _shift_formula_rows('=$A$1+A$1+$B2', 5) == '=$A$1+A$1+$B7'
+    assert _shift_formula_rows('=LOG10(C3)&"A1"', 2) == '=LOG10(C5)&"A1"'
+    assert _shift_formula_rows("='Лист 1'!B4", 1) == "='Лист 1'!B5"
+
+def test_create_project_sheet_single_batch_update(project_config):
+    """Тест: все разделы записываются одним batchUpdate"""
+    api, mock_service = _templates_api()
+    sections = [f"раздел {i}" for i in range(10)]
+
+    url = api.create_project_sheet_with_retry("Новый проект", sections)
+
+    assert url == "https://docs.google.com/spreadsheets/d/main/edit#gid=789"
+    mock_service.spreadsheets().batchUpdate.assert_called_once()
+    requests = mock_service.spreadsheets().batchUpdate.call_args[1]['body']['requests']
+
+    assert requests[0]['updateSheetProperties']['properties']['title'] == "Новый проект"
+    cells = [r['updateCells'] for r in requests if 'updateCells' in r]
+    merges = [r['mergeCells'] for r in requests if 'mergeCells' in r]
+    assert len(cells) == len(sections) + 2  # разделы, "Прочее" и формула E2
+    assert len(merges) == len(sections) + 1
+
+    # Второй раздел начинается через 3 строки после первого (строки 4 и 7)
+    second = cells[1]
+    assert second['range']['startRowIndex'] == 6
+    first_row = second['rows'][0]['values']
+    assert first_row[0]['userEnteredValue']['stringValue'] == 'Раздел Раздел 1'
+    assert first_row[0]['userEnteredFormat'] == {'textFormat': {'bold': True}}
+    assert first_row[4]['userEnteredValue']['formulaValue'] == '=SUM(E8:E9)'
+    assert merges[1]['range']['startRowIndex'] == 6
+
+    total = cells[-1]
+    assert total['range']['startRowIndex'] == 1
+    expected = '=' + '+'.join(f'E{4 + 3 * i}' for i in range(len(sections) + 1))
+    assert total['rows'][0]['values'][0]['userEnteredValue']['formulaValue'] == expected
+
+def test_create_project_sheet_copies_conditional_formats(project_config):
+    """Тест: условное форматирование шаблона секции переносится на каждый раздел со сдвигом"""
+    api, mock_service = _templates_api()
+    highlight = {'backgroundColor': {'red': 1}}
+    section = dict(SECTION_TEMPLATE['sheets'][0], conditionalFormats=[
+        {'ranges': [{'sheetId': 22, 'startRowIndex': 1, 'endRowIndex': 3,
+                     'startColumnIndex': 4, 'endColumnIndex': 5}],
+         'booleanRule': {'condition': {'type': 'CUSTOM_FORMULA',
+                                       'values': [{'userEnteredValue': '=$E2>$F$1'}]},
+                         'format': highlight}},
+        # Правило за пределами заполненных строк шаблона не переносится
+        {'ranges': [{'sheetId': 22, 'startRowIndex': 50, 'endRowIndex': 60}],
+         'booleanRule': {'condition': {'type': 'NOT_BLANK'}, 'format': highlight}}
+    ])
+    top = dict(TOP_TEMPLATE['sheets'][0], conditionalFormats=[
+        {'ranges': [{'sheetId': 11, 'startRowIndex': 0, 'endRowIndex': 1}],
+         'booleanRule': {'condition': {'type': 'NOT_BLANK'}, 'format': highlight}}
+    ])
+    templates = {'top': {'sheets': [top]}, 'section': {'sheets': [section]}}
+
+    def get(spreadsheetId, **kwargs):
+        request = Mock()
+        request.execute.return_value = templates.get(spreadsheetId, {'sheets': []})
+        return request
+
+    mock_service.spreadsheets().get.side_effect = get
+
+    assert api.create_project_sheet_with_retry("Новый проект", ["звук"])
+    requests = mock_service.spreadsheets().batchUpdate.call_args[1]['body']['requests']
+    rules = [r['addConditionalFormatRule'] for r in requests if 'addConditionalFormatRule' in r]
+
+    # Разделы "звук" и "Прочее" начинаются со строк 4 и 7
+    assert [rule['index'] for rule in rules] == [1, 2]
+    first, second = rules[0]['rule'], rules[1]['rule']
+    assert first['ranges'] == [{'sheetId': 789, 'startRowIndex': 4, 'endRowIndex': 6,
+                                'startColumnIndex': 4, 'endColumnIndex': 5}]
+    assert first['booleanRule']['condition']['values'] == [{'userEnteredValue': '=$E5>$F$1'}]
+    assert first['booleanRule']['format'] == highlight
+    assert second['ranges'][0]['startRowIndex'] == 7
+    assert second['booleanRule']['condition']['values'] == [{'userEnteredValue': '=$E8>$F$1'}]
+
+def test_template_cache_skips_repeated_reads(project_config):
+    """Тест: шаблоны читаются один раз и берутся из кэша при повторных созданиях"""
+    api, mock_service = _templates_api()
+
+    api.warm_template_cache()
+    template_reads = [c for c in mock_service.spreadsheets().get.call_args_list
+                      if c.kwargs.get('includeGridData')]
+    assert len(template_reads) == 2
+
+    api.create_project_sheet_with_retry("Проект 1", ["звук"])
+    api.create_project_sheet_with_retry("Проект 2", ["свет"])
+    template_reads = [c for c in mock_service.spreadsheets().get.call_args_list
+                      if c.kwargs.get('includeGridData')]
+    assert len(template_reads) == 2
+    assert api.template_cache.stats()['hits'] == 4
+
+    # По истечении TTL шаблон перечитывается
+    api.template_cache.ttl = 0
+    api.create_project_sheet_with_retry("Проект 3", ["сцена"])
+    template_reads = [c for c in mock_service.spreadsheets().get.call_args_list
+                      if c.kwargs.get('includeGridData')]
+    assert len(template_reads) == 4
+
+def test_title_index_suffixes():
+    """Тест подбора свободного суффикса по индексу названий"""
+    index = SheetTitleIndex()
+    index.load([
+        {'properties': {'title': 'Тест', 'sheetId': 1}},
+        {'properties': {'title': 'Тест-1', 'sheetId': 2}},
+        {'properties': {'title': 'Тест-2', 'sheetId': 3}},
+    ])
+
+    assert index.unique_name('Новый') == 'Новый'
+    assert index.unique_name('Тест') == 'Тест-3'
+
+    # Зарезервированное имя не выдается повторно
+    assert index.unique_name('Тест', reserve=True) == 'Тест-3'
+    assert index.unique_name('Тест') == 'Тест-4'
+    index.release('Тест-3')
+    assert index.unique_name('Тест') == 'Тест-3'
+
+    # Удаленный лист освобождает свой суффикс, переименованный - занимает новый
+    index.remove(2)
+    assert index.unique_name('Тест') == 'Тест-1'
+    index.add(4, 'Копия Тест')
+    index.rename(4, 'Тест-1')
+    assert index.unique_name('Тест') == 'Тест-3'
+
+def test_title_index_keeps_reservations_on_reload():
+    """Тест: перезагрузка индекса не освобождает зарезервированные имена"""
+    index = SheetTitleIndex()
+    index.load([{'properties': {'title': 'Тест', 'sheetId': 1}}])
+    assert index.unique_name('Тест', reserve=True) == 'Тест-1'
+
+    index.load([{'properties': {'title': 'Тест', 'sheetId': 1}}])
+    assert index.unique_name('Тест') == 'Тест-2'
+
+    index.add(2, 'Копия Тест')
+    index.rename(2, 'Тест-1')
+    index.remove(2)
+    index.load([{'properties': {'title': 'Тест', 'sheetId': 1}}])
+    assert index.unique_name('Тест') == 'Тест-1'
+
+def test_title_index_concurrent_load_fetches_once(project_config):
+    """Тест: параллельные обращения к незагруженному индексу читают его одним запросом"""
+    api, mock_service = _templates_api()
+    barrier = threading.Barrier(4)
+
+    def reserve():
+        barrier.wait()
+        return api._get_unique_sheet_name("Проект", reserve=True)
+
+    threads = []
+    names = []
+    for _ in range(4):
+        thread = threading.Thread(target=lambda: names.append(reserve()))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    index_reads = [c for c in mock_service.spreadsheets().get.call_args_list
+                   if c.kwargs.get('spreadsheetId') == 'main']
+    assert len(index_reads) == 1
+    assert sorted(names) == ["Проект", "Проект-1", "Проект-2", "Проект-3"]
+
+def test_title_index_single_fetch(project_config):
+    """Тест: названия листов читаются одним запросом с маской полей"""
+    api, mock_service = _templates_api()
+    api.warm_template_cache()
+
+    for _ in range(3):
+        api.create_project_sheet_with_retry("Новый проект", ["звук"])
+
+    index_reads = [c for c in mock_service.spreadsheets().get.call_args_list
+                   if c.kwargs.get('spreadsheetId') == 'main']
+    assert len(index_reads) == 1
+    assert index_reads[0].kwargs['fields'] == 'sheets.properties(title,sheetId)'
+
+    titles = [
+        c.kwargs['body']['requests'][0]['updateSheetProperties']['properties']['title']
+        for c in mock_service.spreadsheets().batchUpdate.call_args_list
+    ]
+    assert titles == ["Новый проект", "Новый проект-1", "Новый проект-2"]
+
+@pytest.mark.asyncio
+async def test_create_project_sheet_async_runs_in_executor(project_config):
+    """Тест: создание листа выполняется в пуле потоков Sheets, а не в цикле событий"""
+    api, _ = _templates_api()
+    threads = []
+    create = api.create_project_sheet_with_retry
+
+    def tracked_create(project_name, sections, trace=None):
+        threads.append(threading.current_thread().name)
+        return create(project_name, sections, trace)
+
+    api.create_project_sheet_with_retry = tracked_create
+    try:
+        url = await api.create_project_sheet_async("Новый проект", ["звук"])
+    finally:
+        api.close()
+
+    assert url.endswith("gid=789")
+    assert threads and threads[0].startswith('sheets-api')
+
+def test_create_project_sheet_discards_copy_on_failure(project_config):
+    """Тест: после ошибки копия шаблона удаляется, ошибка удаления не пробрасывается"""
+    api, mock_service = _templates_api()
+    api.warm_template_cache()
+    error = HttpError(httplib2.Response({'status': '400'}), b'{}')
+    mock_service.spreadsheets().batchUpdate().execute.side_effect = [error, RuntimeError("delete failed")]
+
+    assert api.create_project_sheet_with_retry("Новый проект", ["звук"]) is None
+
+    delete_requests = [
+        c.kwargs['body']['requests'][0]
+        for c in mock_service.spreadsheets().batchUpdate.call_args_list
+        if 'deleteSheet' in c.kwargs.get('body', {}).get('requests', [{}])[0]
+    ]
+    assert delete_requests == [{'deleteSheet': {'sheetId': 789}}]
+    assert api._get_unique_sheet_name("Новый проект") == "Новый проект"
+
+def test_create_project_sheet_retries_whole_creation_on_5xx(project_config):
+    """Тест: при 5xx копия удаляется и создание повторяется целиком после задержки"""
+    api, mock_service = _templates_api()
+    api.warm_template_cache()
+    api.rate_limiter = SheetsRateLimiter(read_quota=100000, write_quota=100000, burst=1000,
+                                         backoff_base=0.001, backoff_max=0.01)
+    error = HttpError(httplib2.Response({'status': '503'}), b'{}')
+    # batchUpdate: заполнение -> 503, удаление копии, повторное заполнение
+    mock_service.spreadsheets().batchUpdate().execute.side_effect = [error, {}, {}]
+
+    url = api.create_project_sheet_with_retry("Новый проект", ["звук"])
+
+    assert url == "https://docs.google.com/spreadsheets/d/main/edit#gid=790"
+    requests = [c.kwargs['body']['requests'][0] for c in mock_service.spreadsheets().batchUpdate.call_args_list
+                if 'body' in c.kwargs]
+    assert requests[1] == {'deleteSheet': {'sheetId': 789}}
+    assert api.rate_limiter.stats()['retries'] == 1
+
+    # Если 5xx повторяется на всех попытках, создание завершается неудачей
+    mock_service.spreadsheets().batchUpdate().execute.side_effect = [error, {}] * 3
+    assert api.create_project_sheet_with_retry("Другой проект", ["звук"]) is None
+    assert api.rate_limiter.stats()['retries'] == 3
+
+def test_create_project_sheet_trace(project_config, tmp_path):
+    """Тест: создание листа записывает трассировку этапов и вызовов API и выгружает ее"""
+    api, mock_service = _templates_api()
+    api.warm_template_cache()
+    trace = SheetsTrace("create_project_sheet")
+    trace_dir = tmp_path / 'traces'
+
+    with patch('bot.sheets_api.SHEETS_TRACE_DIR', str(trace_dir)):
+        url = api.create_project_sheet_with_retry("Новый проект", ["звук", "свет"], trace)
+
+    assert url.endswith("gid=789")
+    summary = trace.summary()
+    assert summary["status"] == "ok"
+    assert set(summary["stages"]) == {
+        "unique_name", "templates", "copy_template", "build_requests", "render_section", "batch_update"
+    }
+    # Индекс названий, копирование шаблона и запись листа
+    assert summary["api_calls"] == 3
+    calls = [span for span in trace.spans if span["type"] == "call"]
+    batch = [span for span in calls if span["stage"] == "batch_update"]
+    assert len(batch) == 1 and batch[0]["sections"] == 3
+    sections = sorted(span["section"] for span in trace.spans if span["name"] == "render_section")
+    assert sections == [0, 1, 2]
+
+    lines = (trace_dir / 'sheets_traces.jsonl').read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 1
+    exported = json.loads(lines[0])
+    assert exported["trace_id"] == trace.trace_id
+    assert len(exported["spans"]) == len(trace.spans)
+
+def test_create_project_sheet_trace_records_failed_call(project_config):
+    """Тест: неудачный вызов попадает в трассировку с кодом ответа, удаление копии - отдельным этапом"""
+    api, mock_service = _templates_api()
+    api.warm_template_cache()
+    error = HttpError(httplib2.Response({'status': '500'}), b'{}')
+    mock_service.spreadsheets().batchUpdate().execute.side_effect = [error, {}]
+    trace = SheetsTrace("create_project_sheet")
+
+    assert api.create_project_sheet_with_retry("Новый проект", ["звук"], trace) is None
+
+    assert trace.status == "failed"
+    failed = [span for span in trace.spans if span["status"] == "http_500"]
+    assert {span["type"] for span in failed} == {"call", "stage"}
+    assert "discard" in trace.summary()["stages"]
+    assert "failed" in trace.summary_line()
@@ -0,0 +1,116 @@
+import pytest
+from googleapiclient.errors import HttpError
+from bot.rate_limiter import SheetsRateLimiter
+from scripts.sheets_emulator import SheetsEmulator, emulated_sheets_api, _shift_relative_rows
+
+@pytest.fixture
+def emulated_api(tmp_path):
+    """GoogleSheetsAPI, подключенный к эмулятору с шаблонами проекта"""
+    emulator = SheetsEmulator()
+    api = emulated_sheets_api(emulator, str(tmp_path), section_rows=3)
+    yield api, emulator
+    api.close()
+
+def test_create_project_sheet_on_emulator(emulated_api):
+    """Тест: лист проекта создается в эмуляторе с разделами, формулами и объединениями"""
+    api, emulator = emulated_api
+
+    url = api.create_project_sheet_with_retry("Фестиваль", ["звук", "свет"])
+
+    assert url.startswith("https://docs.google.com/spreadsheets/d/main/edit#gid=")
+    assert emulator.sheet_titles('main') == ['Сводка', 'Фестиваль']
+    rows = emulator.sheet_rows('main', 'Фестиваль')
+    # Шапка из трех строк, затем разделы по 4 строки
+    assert rows[3][0]['userEnteredValue'] == {'stringValue': 'Звук'}
+    assert rows[7][0]['userEnteredValue'] == {'stringValue': 'Свет'}
+    assert rows[7][4]['userEnteredValue'] == {'formulaValue': '=SUM(E9:E11)'}
+    assert rows[1][4]['userEnteredValue'] == {'formulaValue': '=E4+E8+E12'}
+    assert len(emulator.sheet_merges('main', 'Фестиваль')) == 3
+    assert emulator.stats()['calls'] == {
+        'spreadsheets.get': 3, 'spreadsheets.sheets.copyTo': 1, 'spreadsheets.batchUpdate': 1
+    }
+
+    # Совпадающее имя получает суффикс
+    api.create_project_sheet_with_retry("Фестиваль", ["звук"])
+    assert emulator.sheet_titles('main')[-1] == 'Фестиваль-1'
+
+def test_batch_update_is_atomic(emulated_api):
+    """Тест: при ошибке одного запроса batchUpdate не применяется целиком"""
+    api, emulator = emulated_api
+    sheet_id = emulator.add_sheet('main', 'Лист', row_count=5, column_count=5)
+    request = api.service.spreadsheets().batchUpdate(spreadsheetId='main', body={'requests': [
+        {'updateSheetProperties': {'properties': {'sheetId': sheet_id, 'title': 'Новое'}, 'fields': 'title'}},
+        {'updateCells': {'range': {'sheetId': sheet_id, 'startRowIndex': 10, 'endRowIndex': 11},
+                         'rows': [{'values': [{'userEnteredValue': {'numberValue': 1}}]}],
+                         'fields': 'userEnteredValue'}}
+    ]})
+
+    with pytest.raises(HttpError) as error:
+        request.execute()
+
+    assert error.value.resp.status == 400
+    assert 'exceeds grid limits' in str(error.value)
+    assert 'Лист' in emulator.sheet_titles('main')
+
+def test_values_and_copy_paste(emulated_api):
+    """Тест: values.update/get и copyPaste со сдвигом формул и объединений"""
+    api, emulator = emulated_api
+    sheet_id = emulator.add_sheet('main', 'Данные', merges=[
+        {'startRowIndex': 0, 'endRowIndex': 1, 'startColumnIndex': 0, 'endColumnIndex': 2}])
+
+    # USER_ENTERED: строки с "=" становятся формулами (в RAW они остались бы текстом)
+    api._execute(api.service.spreadsheets().values().update(
+        spreadsheetId='main', range='Данные!A1:C2', valueInputOption='USER_ENTERED',
+        body={'values': [['Итого', 2, '=B2*2'], ['x', 3]]}))
+    api.write_values('main', 'Данные!D1', [['=A1']])
+    api._execute(api.service.spreadsheets().batchUpdate(spreadsheetId='main', body={'requests': [{
+        'copyPaste': {
+            'source': {'sheetId': sheet_id, 'startRowIndex': 0, 'endRowIndex': 2,
+                       'startColumnIndex': 0, 'endColumnIndex': 3},
+            'destination': {'sheetId': sheet_id, 'startRowIndex': 4, 'endRowIndex': 6,
+                            'startColumnIndex': 0, 'endColumnIndex': 3},
+            'pasteType': 'PASTE_NORMAL'
+        }
+    }]}))
+
+    assert emulator.sheet_rows('main', 'Данные')[0][3]['userEnteredValue'] == {'stringValue': '=A1'}
+    assert api.read_values('main', 'Данные!A1:C6') == [
+        ['Итого', '2', '=B2*2'], ['x', '3'], [], [], ['Итого', '2', '=B6*2'], ['x', '3']
+    ]
+    assert [m['startRowIndex'] for m in emulator.sheet_merges('main', 'Данные')] == [0, 4]
+
+def test_quota_errors_are_retried(emulated_api):
+    """Тест: квота эмулятора отвечает 429 с Retry-After, ограничитель бота повторяет запрос"""
+    api, emulator = emulated_api
+    emulator.quotas['read'] = 1
+    emulator.retry_after = 0.0
+    api.rate_limiter = SheetsRateLimiter(max_retries=1, backoff_base=0.0)
+
+    api.get_sheets('main')
+    with pytest.raises(HttpError) as error:
+        api.get_sheets('main')
+
+    assert error.value.resp.status == 429
+    assert emulator.stats()['errors'] == {'spreadsheets.get:429': 2}
+    assert api.rate_limiter.stats()['retries'] == 1
+
+def test_latency_per_method(monkeypatch):
+    """Тест: задержка вызова складывается из задержки метода и размера тела"""
+    sleeps = []
+    monkeypatch.setattr('scripts.sheets_emulator.time.sleep', sleeps.append)
+    emulator = SheetsEmulator(latency=0.1, latency_by_method={'batchUpdate': 0.5}, per_kb_latency=1.0)
+    emulator.add_sheet('main', 'Лист')
+
+    emulator.spreadsheets().get(spreadsheetId='main').execute()
+    emulator.spreadsheets().batchUpdate(spreadsheetId='main', body={'requests': []}).execute()
+
+    assert sleeps[0] == pytest.approx(0.1)
+    assert sleeps[1] == pytest.approx(0.5 + len('{"requests": []}') / 1024)
+
+def test_emulator_shifts_formulas_independently():
+    """Тест: copyPaste эмулятора сдвигает только относительные строки вне литералов и имен функций"""
+    assert _shift_relative_rows('=SUM(E2:E9)', 4) == '=SUM(E6:E13)'
+    assert _shift_relative_rows('=$A$1+A$2+$B3', 2) == '=$A$1+A$2+$B5'
+    assert _shift_relative_rows('=LOG10(C2)&"A1"', 1) == '=LOG10(C3)&"A1"'
+    assert _shift_relative_rows('=1E5*D2', 1) == '=1E5*D3'
+    assert _shift_relative_rows('=C2*D2', 0) == '=C2*D2'
@@ -0,0 +1,67 @@
+import json
+import pytest
+from bot.sheets_trace import SheetsTrace, activate, current_trace, payload_size, stage
+
+class _Request:
+    def __init__(self, body):
+        self.body = body
+
+def test_stage_tags_calls_and_summary():
+    """Тест: вызовы внутри этапа получают его атрибуты, сводка суммирует этапы"""
+    trace = SheetsTrace("test")
+    with trace.stage("render_section", section=0):
+        trace.record_call("sheets.spreadsheets.batchUpdate", trace._started, 120, "ok")
+    with trace.stage("render_section", section=1):
+        pass
+    trace.record_call("sheets.spreadsheets.get", trace._started, 0, "ok")
+    trace.finish("ok")
+
+    calls = [span for span in trace.spans if span["type"] == "call"]
+    assert calls[0]["name"] == "spreadsheets.batchUpdate"
+    assert calls[0]["stage"] == "render_section" and calls[0]["section"] == 0
+    assert "stage" not in calls[1]
+
+    summary = trace.summary()
+    assert summary["api_calls"] == 2
+    assert summary["payload_bytes"] == 120
+    assert list(summary["stages"]) == ["render_section"]
+    assert summary["slowest_call"]["name"] in ("spreadsheets.batchUpdate", "spreadsheets.get")
+    assert "2 вызовов" in trace.summary_line()
+
+def test_stage_records_error_status():
+    """Тест: этап, завершившийся исключением, получает статус ошибки"""
+    trace = SheetsTrace("test")
+    with pytest.raises(ValueError):
+        with trace.stage("copy_template"):
+            raise ValueError("boom")
+    assert trace.spans[0]["status"] == "ValueError"
+
+def test_activate_and_module_stage():
+    """Тест: этапы модуля пишутся только в активную трассировку потока"""
+    with stage("ignored"):
+        pass
+    trace = SheetsTrace("test")
+    with activate(trace):
+        assert current_trace() is trace
+        with stage("templates"):
+            pass
+    assert current_trace() is None
+    assert [span["name"] for span in trace.spans] == ["templates"]
+
+def test_payload_size():
+    """Тест: размер тела считается в байтах UTF-8"""
+    assert payload_size(_Request('{"a": "я"}')) == 11
+    assert payload_size(_Request(b'abc')) == 3
+    assert payload_size(object()) == 0
+
+def test_export_appends_jsonl(tmp_path):
+    """Тест: трассировки дописываются в JSONL, без каталога выгрузка отключена"""
+    trace = SheetsTrace("test", project="Проект")
+    trace.finish("ok")
+    assert trace.export("") is None
+
+    path = trace.export(str(tmp_path))
+    trace.export(str(tmp_path))
+    lines = open(path, encoding='utf-8').read().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["attrs"] == {"project": "Проект"}
@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import patch
+from bot.state_backend import SQLiteStateBackend, StateBackend, StateMap, create_state_backend
+
+def test_sqlite_backend_roundtrip(tmp_path):
+    """Тест: значения пишутся пачкой, читаются с версией и удаляются через None"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    version = backend.put_many([("ns", "1", {"a": "привет"}), ("ns", "2", [1, 2])])
+
+    assert backend.get("ns", "1") == ({"a": "привет"}, version)
+    assert backend.version("ns", "2") == version
+    assert backend.get("other", "1") == (None, 0.0)
+
+    backend.put_many([("ns", "1", None)])
+    assert backend.get("ns", "1") == (None, 0.0)
+    assert backend._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    backend.close()
+
+def test_state_map_shared_between_processes(tmp_path):
+    """Тест: контекст пользователя виден через другое соединение и переживает перезапуск"""
+    path = str(tmp_path / "state.db")
+    first = StateMap("user_context", SQLiteStateBackend(path))
+    second = StateMap("user_context", SQLiteStateBackend(path))
+
+    first[42] = {"project_name": "Марафон", "awaiting_confirmation": True}
+    assert 42 in second
+    assert second[42]["project_name"] == "Марафон"
+
+    del second[42]
+    assert first.get(42) is None
+
+    memory = StateMap("user_context", create_state_backend("memory"))
+    memory[1] = {"x": 1}
+    assert memory[1] == {"x": 1} and 2 not in memory
+
+def test_claim_is_exclusive_until_release_or_expiry(tmp_path):
+    """Тест: аренду держит один владелец до освобождения или истечения срока"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+
+    assert backend.claim("chat", "1", "w1", ttl=60)
+    assert not backend.claim("chat", "1", "w2", ttl=60)
+    assert backend.claim("chat", "1", "w1", ttl=60)
+
+    backend.release("chat", "1", "w2")
+    assert not backend.claim("chat", "1", "w2", ttl=60)
+    backend.release("chat", "1", "w1")
+    assert backend.claim("chat", "1", "w2", ttl=60)
+
+    assert backend.claim("chat", "2", "w1", ttl=-1)
+    assert backend.claim("chat", "2", "w2", ttl=60)
+
+def test_token_bucket_shared_between_processes(tmp_path):
+    """Тест: token bucket в SQLite общий для двух соединений и пополняется со временем"""
+    path = str(tmp_path / "state.db")
+    first = SQLiteStateBackend(path)
+    second = SQLiteStateBackend(path)
+    clock = [1000.0]
+
+    with patch('bot.state_backend.time.time', side_effect=lambda: clock[0]):
+        assert first.take_token("quota", "write", capacity=2, rate=4) == 0.0
+        assert second.take_token("quota", "write", capacity=2, rate=4) == 0.0
+        assert first.take_token("quota", "write", capacity=2, rate=4) == pytest.approx(0.25)
+        clock[0] += 0.25
+        assert second.take_token("quota", "write", capacity=2, rate=4) == 0.0
+        assert first.take_token("quota", "read", capacity=2, rate=4) == 0.0
+
+    assert StateBackend().take_token("quota", "write", capacity=1, rate=1) == 0.0
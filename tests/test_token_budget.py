@@ -0,0 +1,50 @@
+from bot.token_budget import estimate_tokens, trim_history, fit_history, message_tokens
+
+def _history(*texts):
+    roles = ["user", "assistant"]
+    return [{"role": roles[i % 2], "content": text} for i, text in enumerate(texts)]
+
+def test_estimate_tokens():
+    """Тест: оценка токенов растет с длиной текста и учитывает знаки препинания"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello") == 2
+    assert estimate_tokens("привет, мир!") == 2 + 1 + 1 + 1
+    assert estimate_tokens("слово " * 100) == 200
+
+def test_trim_keeps_newest_within_budget():
+    """Тест: остаются самые новые сообщения, суммарно не больше бюджета"""
+    history = _history("первое " * 50, "второе", "третье", "четвертое")
+    kept, dropped = trim_history(history, budget=30)
+
+    assert kept == history[1:]
+    assert dropped == history[:1]
+    assert sum(message_tokens(m) for m in kept) <= 30
+
+def test_trim_truncates_oversized_last_message():
+    """Тест: слишком длинное последнее сообщение обрезается до бюджета"""
+    history = _history("короткое", "стена текста " * 1000)
+    kept, dropped = trim_history(history, budget=100)
+
+    assert len(kept) == 1 and len(dropped) == 1
+    assert kept[0]["content"].endswith("…")
+    assert message_tokens(kept[0]) <= 100
+    assert history[1]["content"] == "стена текста " * 1000
+
+def test_fit_history_adds_summary_note():
+    """Тест: не поместившиеся реплики сжимаются в системную заметку в пределах бюджета"""
+    history = _history(
+        "Планирую забег на 500 человек. Нужна помощь со сметой.",
+        "Хорошо. Начнем с аренды.",
+        "слово " * 40,
+        "Что дальше?"
+    )
+    messages, trimmed = fit_history(history, budget=120, summarize=True, summary_tokens=100)
+
+    assert messages[0]["role"] == "system"
+    assert "Ассистент: Хорошо." in messages[0]["content"]
+    assert messages[-1] == history[-1]
+    assert trimmed >= 2
+    assert sum(message_tokens(m) for m in messages) <= 120
+
+    plain, _ = fit_history(history, budget=120, summarize=False)
+    assert all(m["role"] != "system" for m in plain)
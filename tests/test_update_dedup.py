@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import httpx
+import pytest
+from unittest.mock import patch
+import app as app_module
+from bot.update_dedup import UpdateDeduplicator
+from bot.state_backend import SQLiteStateBackend
+
+@pytest.mark.asyncio
+async def test_dedup_window_and_capacity():
+    """Тест: повтор в окне - дубликат, старые и вытесненные записи забываются"""
+    clock = [0.0]
+    with patch('bot.update_dedup.time.monotonic', side_effect=lambda: clock[0]):
+        dedup = UpdateDeduplicator(max_size=2, window=60)
+        assert not await dedup.check(1)
+        assert await dedup.check(1)
+        assert not await dedup.check(2)
+        assert not await dedup.check(3)
+        # Запись 1 вытеснена по размеру
+        assert not await dedup.check(1)
+
+        clock[0] = 61
+        assert not await dedup.check(3)
+
+    stats = dedup.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 5
+
+@pytest.mark.asyncio
+async def test_dedup_shared_between_workers(tmp_path):
+    """Тест: повтор, пришедший в другой воркер, распознается через общее хранилище"""
+    path = str(tmp_path / "state.db")
+    first = UpdateDeduplicator(backend=SQLiteStateBackend(path), owner="w1")
+    second = UpdateDeduplicator(backend=SQLiteStateBackend(path), owner="w2")
+
+    assert not await first.check(1)
+    assert await second.check(1)
+    assert second.stats()["shared_hits"] == 1
+
+    # Забытое после ошибки обновление может обработать любой воркер
+    await first.forget(1)
+    assert not await second.check(1)
+
+@pytest.mark.asyncio
+async def test_webhook_skips_redelivered_update():
+    """Тест: повторно доставленное обновление не обрабатывается, после ошибки - обрабатывается"""
+    handled = []
+
+    class Processor:
+        fail = True
+
+        async def process_message(self, message):
+            handled.append(message.message_id)
+            if self.fail:
+                self.fail = False
+                raise RuntimeError("boom")
+
+        def get_stats(self):
+            return {}
+
+    update = {
+        "update_id": 100,
+        "message": {
+            "message_id": 1,
+            "from": {"id": 5, "is_bot": False, "first_name": "Test"},
+            "chat": {"id": 5, "type": "private"},
+            "date": 1740700549,
+            "text": "привет"
+        }
+    }
+    transport = httpx.ASGITransport(app=app_module.app, raise_app_exceptions=False)
+    with patch.object(app_module, 'command_processor', Processor()), \
+         patch.object(app_module, 'update_dedup', UpdateDeduplicator()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.post("/webhook", json=update)).status_code == 500
+            assert (await client.post("/webhook", json=update)).status_code == 200
+            assert (await client.post("/webhook", json=update)).status_code == 200
+            stats = (await client.get("/stats")).json()
+
+    assert handled == [1, 1]
+    assert stats["update_dedup"]["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_dedup_claim_runs_off_loop_and_blocks_concurrent_repeat(tmp_path):
+    """Тест: аренда занимается вне потока цикла, параллельный повтор в том же воркере - дубликат"""
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    dedup = UpdateDeduplicator(backend=backend, owner="w1")
+    threads = []
+    claim = backend.claim
+    backend.claim = lambda *args: threads.append(threading.get_ident()) or claim(*args)
+
+    results = await asyncio.gather(dedup.check(1), dedup.check(1))
+
+    assert sorted(results) == [False, True]
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,90 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+import app as app_module
+from bot.update_dedup import UpdateDeduplicator
+from bot.update_queue import UpdateQueue
+
+def _update(update_id, chat_id, text="привет"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "chat": {"id": chat_id, "type": "private"},
+            "date": 1740700549,
+            "text": text
+        }
+    }
+
+@pytest.mark.asyncio
+async def test_updates_of_one_chat_processed_in_order():
+    """Тест: обновления одного чата обрабатываются по порядку, разных - параллельно"""
+    processed = []
+
+    async def handler(update):
+        await asyncio.sleep(0.01 if update["update_id"] == 1 else 0)
+        processed.append(update["update_id"])
+
+    queue = UpdateQueue(handler, workers=4, max_size=10)
+    await queue.start()
+    for update_id in (1, 2, 3):
+        assert queue.submit(_update(update_id, 7), chat_id=7)
+    await queue.stop()
+
+    assert processed == [1, 2, 3]
+    assert queue.stats()["processed"] == 3
+
+@pytest.mark.asyncio
+async def test_queue_rejects_when_full_and_drains_on_stop():
+    """Тест: переполненная очередь отклоняет обновления, остановка дожидается принятых"""
+    release = asyncio.Event()
+    processed = []
+
+    async def handler(update):
+        await release.wait()
+        processed.append(update["update_id"])
+
+    queue = UpdateQueue(handler, workers=1, max_size=2)
+    await queue.start()
+    assert queue.submit(_update(1, 1), chat_id=1)
+    await asyncio.sleep(0)
+    assert queue.submit(_update(2, 1), chat_id=1)
+    assert queue.submit(_update(3, 1), chat_id=1)
+    assert not queue.submit(_update(4, 1), chat_id=1)
+
+    stop = asyncio.create_task(queue.stop())
+    await asyncio.sleep(0)
+    assert not queue.submit(_update(5, 1), chat_id=1)
+    release.set()
+    await stop
+
+    assert processed == [1, 2, 3]
+    assert queue.stats()["rejected"] == 2
+
+@pytest.mark.asyncio
+async def test_webhook_acknowledges_before_processing():
+    """Тест: в режиме быстрого подтверждения webhook отвечает до обработки сообщения"""
+    release = asyncio.Event()
+    handled = []
+
+    class SlowProcessor:
+        async def process_message(self, message):
+            await release.wait()
+            handled.append(message.text)
+
+    queue = UpdateQueue(app_module.process_queued_update, workers=2, max_size=10)
+    await queue.start()
+    transport = httpx.ASGITransport(app=app_module.app)
+    with patch.object(app_module, 'command_processor', SlowProcessor()), \
+         patch.object(app_module, 'update_queue', queue), \
+         patch.object(app_module, 'update_dedup', UpdateDeduplicator()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await asyncio.wait_for(client.post("/webhook", json=_update(1, 5)), timeout=1)
+        assert response.json() == {"ok": True}
+        assert handled == []
+
+        release.set()
+        await queue.stop()
+    assert handled == ["привет"]
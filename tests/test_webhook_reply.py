@@ -0,0 +1,80 @@
+import asyncio
+import json
+import httpx
+import pytest
+from unittest.mock import patch
+import app as app_module
+from bot.update_dedup import UpdateDeduplicator
+from bot.command_processor import CommandProcessor
+from bot.webhook_reply import open_reply_slot, close_reply_slot, take_reply_slot
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "chat": {"id": 42, "type": "private"},
+        "date": 1740700549,
+        "text": "/start"
+    }
+}
+
+def _processor(requests):
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={"ok": True})
+
+    processor = CommandProcessor()
+    processor.telegram_client = httpx.AsyncClient(
+        base_url="https://api.telegram.org/bottest-token/",
+        transport=httpx.MockTransport(handler)
+    )
+    return processor
+
+def test_reply_slot_accepts_single_reply_within_window():
+    """Тест: слот принимает один ответ и только до закрытия и истечения окна"""
+    assert not take_reply_slot("sendMessage", {"text": "вне запроса"})
+
+    slot, token = open_reply_slot(window=10)
+    assert take_reply_slot("sendMessage", {"chat_id": 1, "text": "первый"})
+    assert not take_reply_slot("sendMessage", {"chat_id": 1, "text": "второй"})
+    assert close_reply_slot(slot, token) == {"method": "sendMessage", "chat_id": 1, "text": "первый"}
+
+    slot, token = open_reply_slot(window=-1)
+    assert not take_reply_slot("sendMessage", {"text": "поздно"})
+    assert close_reply_slot(slot, token) is None
+
+@pytest.mark.asyncio
+async def test_second_reply_flushes_held_reply_in_order():
+    """Тест: при втором ответе отложенный отправляется первым, порядок сохраняется"""
+    requests = []
+    processor = _processor(requests)
+
+    slot, token = open_reply_slot(window=10)
+    await processor.send_telegram_message(1, "первый")
+    assert requests == []
+    await processor.send_telegram_message(1, "второй")
+    assert close_reply_slot(slot, token) is None
+    assert [r["text"] for r in requests] == ["первый", "второй"]
+    await processor.shutdown()
+
+@pytest.mark.asyncio
+async def test_webhook_returns_inline_reply():
+    """Тест: ответ на /start возвращается в теле webhook-ответа без sendMessage"""
+    requests = []
+    processor = _processor(requests)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    with patch.object(app_module, 'command_processor', processor), \
+         patch.object(app_module, 'TELEGRAM_INLINE_REPLIES', True), \
+         patch.object(app_module, 'update_dedup', UpdateDeduplicator()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/webhook", json=UPDATE)
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["method"] == "sendMessage"
+    assert body["chat_id"] == 42
+    assert "Привет" in body["text"]
+    assert requests == []
+    await processor.shutdown()